@@ -0,0 +1,228 @@
+"""
+Offline end-to-end latency benchmark for the query pipeline.
+
+Runs the sample queries in README.md through util.engine.recommend, the code path the
+service serves, against the local stub from stub_openai_server.py, and reports the time
+per stage from each query's trace spans. Run from the repo root:
+
+    python -m benchmarks.pipeline_benchmark --concurrency 1 4 8 --output bench.json
+    python -m benchmarks.pipeline_benchmark --compare bench.json
+
+Results are written as sorted JSON so two runs can be diffed directly.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+# 2: stage times come from the engine's trace spans
+RESULTS_VERSION = 2
+PERCENTILES = (50, 95, 99)
+
+
+def load_readme_queries(readme_path: Path = REPO_ROOT / "README.md") -> list[str]:
+    # Sample queries are the quoted lines between "Sample queries" and the next heading
+    text = readme_path.read_text(encoding="utf-8")
+    section = text.split("Sample queries", 1)[1].split("\n#", 1)[0]
+    queries = []
+    for line in section.splitlines():
+        line = line.strip().strip('"“”').strip()
+        if line:
+            queries.append(line)
+    return queries
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _reset_caches(cache_dir: Path):
+    # Fresh, empty caches so every level measures the cold path rather than cache hits
+    from util import llm_cache, query_cache, vad_store
+    from util.query_extraction import COMBINED_SYSTEM_PROMPT
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    llm_cache._cache = llm_cache.LLMCache(cache_dir / "llm_cache.sqlite3")
+    query_cache._query_cache = query_cache.QueryCache(cache_dir / "query_cache.jsonl")
+    query_cache._query_cache.register_prompt(COMBINED_SYSTEM_PROMPT)
+    vad_store._store = vad_store.VADStore(cache_dir / "vad_store")
+
+
+def run_query(catalog, user_query: str, options) -> dict:
+    """
+    One query through util.engine.recommend, as the service runs it, query cache and
+    audience confidence check included.
+
+    Returns:
+        dict: span name -> milliseconds summed over the query's trace (see Trace.summary),
+        plus "total", and "matched" and "ranked" counts.
+    """
+    from util.engine import recommend
+    from util.tracing import start_trace
+
+    with start_trace("benchmark", export_path=None, query=user_query) as trace:
+        recommendation = recommend(user_query, catalog, options)
+    summary = trace.summary()
+    return {
+        **summary["stages_ms"],
+        "total": summary["duration_ms"],
+        "matched": recommendation.matched,
+        "ranked": len(recommendation.results),
+    }
+
+
+def summarize(samples: list[dict]) -> dict:
+    stages = sorted({name for sample in samples for name in sample if name not in ("matched", "ranked")})
+    summary = {}
+    for stage in stages:
+        values = np.array([sample[stage] for sample in samples if stage in sample])
+        summary[stage] = {
+            "n": int(len(values)),
+            "mean_ms": round(float(values.mean()), 3),
+            **{f"p{p}_ms": round(float(np.percentile(values, p)), 3) for p in PERCENTILES},
+        }
+    return summary
+
+
+def run_level(catalog, queries: list[str], concurrency: int, args) -> dict:
+    from util.engine import RecommendOptions
+
+    options = RecommendOptions(k=args.k, mode=args.mode, max_live=args.max_live)
+    errors = []
+
+    def one(user_query: str):
+        try:
+            return run_query(catalog, user_query, options)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = [sample for sample in pool.map(one, queries) if sample is not None]
+    wall_seconds = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "queries": len(queries),
+        "errors": len(errors),
+        "error_examples": sorted(set(errors))[:5],
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_qps": round(len(samples) / wall_seconds, 3),
+        "no_match": sum(1 for sample in samples if sample["matched"] == 0),
+        "stages": summarize(samples),
+    }
+
+
+def print_report(results: dict):
+    for level in results["levels"]:
+        print(f"\nconcurrency={level['concurrency']}  {level['throughput_qps']} q/s  "
+              f"({level['queries']} queries, {level['errors']} errors, {level['no_match']} no match)")
+        print(f"  {'stage':<28}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for stage, stats in level["stages"].items():
+            print(f"  {stage:<28}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+
+
+def print_comparison(results: dict, baseline: dict):
+    # p50/p95 change per stage relative to an earlier results file, matched by concurrency
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\nvs {baseline.get('git_commit')}:")
+    for level in results["levels"]:
+        previous = baseline_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        print(f"  concurrency={level['concurrency']}  throughput {previous['throughput_qps']} → {level['throughput_qps']} q/s")
+        for stage, stats in level["stages"].items():
+            before = previous["stages"].get(stage)
+            if before is None:
+                continue
+            deltas = "  ".join(
+                f"p{p} {before[f'p{p}_ms']:.1f} → {stats[f'p{p}_ms']:.1f} ms" for p in PERCENTILES[:2]
+            )
+            print(f"    {stage:<26}{deltas}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--catalog", type=Path, default=REPO_ROOT / "data" / "netflix_titles.csv")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the query set per level; later passes hit the caches")
+    parser.add_argument("--mode", choices=["parallel", "combined"], default="parallel")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--max-live", type=int, default=40, help="titles scored live per query")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="stub latency per LLM call")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--per-item-ms", type=float, default=10.0, help="extra stub latency per title in a VAD batch")
+    parser.add_argument("--warm", action="store_true", help="keep caches between levels instead of starting cold")
+    parser.add_argument("--output", type=Path, help="write JSON results here")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    from benchmarks.stub_openai_server import start_stub_server
+    server = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_item_ms=args.per_item_ms)
+    cache_root = Path(tempfile.mkdtemp(prefix="movie-picker-bench-"))
+    # Must be set before the util modules are imported: they build the client and caches at import time
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+    os.environ["LLM_CACHE_PATH"] = str(cache_root / "llm_cache.sqlite3")
+    os.environ["QUERY_CACHE_PATH"] = str(cache_root / "query_cache.jsonl")
+    os.environ["VAD_STORE_DIR"] = str(cache_root / "vad_store")
+
+    from util.helper import load_data
+    from util.catalog import Catalog
+    from util.query_rules import QUERY_RULES_ENABLED, rule_stats
+    from util.text_index import RECALL_TOP_N
+    import util.pipeline  # noqa: F401 - import the pipeline (and its logging setup) before quieting it
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with open(args.catalog, "rb") as f:
+        catalog = Catalog("benchmark", load_data(f))
+    # Built once up front so the first query's recall time is not the build
+    catalog.warm_indexes()
+    queries = load_readme_queries() * args.repeat
+    results = {
+        "version": RESULTS_VERSION,
+        "git_commit": _git_commit(),
+        "config": {
+            "catalog": args.catalog.name,
+            "titles": len(catalog),
+            "queries": len(queries),
+            "mode": args.mode,
+            "k": args.k,
+            "max_live": args.max_live,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "per_item_ms": args.per_item_ms,
+            "warm": args.warm,
+            "query_rules": QUERY_RULES_ENABLED,
+            "recall_top_n": RECALL_TOP_N,
+        },
+        "levels": [],
+    }
+    for concurrency in args.concurrency:
+        if not args.warm:
+            _reset_caches(cache_root / f"c{concurrency}")
+        results["levels"].append(run_level(catalog, queries, concurrency, args))
+    results["rule_stats"] = rule_stats.stats()
+    server.shutdown()
+
+    print_report(results)
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text()))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"\nWrote {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,180 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from models.models import ALLOWED_GENRES
+
+# Keyword -> genre, first match wins; only labels that exist in ALLOWED_GENRES
+GENRE_KEYWORDS = [
+    ("docuseries", "Docuseries"),
+    ("documentary", "Documentaries"),
+    ("horror", "Horror Movies"),
+    ("thriller", "Thrillers"),
+    ("anime", "Anime Features"),
+    ("animated", "Children & Family Movies"),
+    ("family", "Children & Family Movies"),
+    ("sci-fi", "Sci-Fi & Fantasy"),
+    ("fantasy", "Sci-Fi & Fantasy"),
+    ("space", "Sci-Fi & Fantasy"),
+    ("mystery", "TV Mysteries"),
+    ("comedy", "Comedy"),
+    ("rom-com", "TV Comedies"),
+    ("drama", "TV Dramas"),
+]
+AUDIENCE_KEYWORDS = [
+    ("adult", "ADULT"),
+    ("mature", "ADULT"),
+    ("teen", "TEEN"),
+    ("kid", "CHILDREN"),
+    ("family", "CHILDREN"),
+    ("all ages", "CHILDREN"),
+]
+
+
+def _unit(*parts) -> float:
+    # Deterministic value in [0, 1) so repeated runs get identical answers
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def _vad(*parts) -> dict:
+    return {name: round(_unit(name, *parts), 3) for name in ("valence", "arousal", "dominance")}
+
+
+def _genre(text: str) -> dict:
+    lowered = text.lower()
+    genre = next((genre for keyword, genre in GENRE_KEYWORDS if keyword in lowered), None)
+    if genre is None:
+        genre = ALLOWED_GENRES[int(_unit("genre", text) * len(ALLOWED_GENRES))]
+    return {"genre": genre, "confidence": 0.8, "rationale": "stub"}
+
+
+def _viewing_type(text: str) -> dict:
+    lowered = text.lower()
+    if "miniseries" in lowered or "limited series" in lowered:
+        return {"viewing_type": ["Miniseries"]}
+    if "series" in lowered or "show" in lowered:
+        return {"viewing_type": ["TV Series"]}
+    return {"viewing_type": ["Movie"]}
+
+
+def _audience_category(text: str) -> dict:
+    lowered = text.lower()
+    category = next((category for keyword, category in AUDIENCE_KEYWORDS if keyword in lowered), "ADULT")
+    return {"category": category, "confidence": 0.9, "rationale": "stub"}
+
+
+def _numeric(text: str) -> dict:
+    # Only the README's runtime phrasing; every other limit is left open
+    return {"max_duration_minutes": 120} if "under 2 hours" in text.lower() else {}
+
+
+def _movie_vad_batch(text: str) -> dict:
+    items = json.loads(text)
+    return {"movie_vads": [{"show_id": item["show_id"], **_vad(item["show_id"])} for item in items]}
+
+
+# response_format schema name -> answer built from the last user message
+RESPONSES = {
+    "ExtractGenre": _genre,
+    "ExtractViewingType": _viewing_type,
+    "ExtractAudienceCategory": _audience_category,
+    "ExtractVAD": lambda text: {"vad": _vad(text)},
+    "ExtractMovieVAD": lambda text: {"movie_vad": _vad(text)},
+    "ExtractMovieVADBatch": _movie_vad_batch,
+    "ExtractNumericConstraints": _numeric,
+    "ExtractQueryCriteria": lambda text: {
+        "genre": _genre(text),
+        "viewing_type": _viewing_type(text),
+        "audience_category": _audience_category(text),
+        "vad": {"vad": _vad(text)},
+        "numeric": _numeric(text),
+    },
+}
+
+
+class StubChatCompletions(BaseHTTPRequestHandler):
+    """
+    Answers POST /v1/chat/completions like the structured-output endpoint.
+
+    The JSON content is chosen by the response_format schema name, and every reply is
+    delayed by latency_ms ± jitter_ms plus per_item_ms for each title in a VAD batch.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so the client connection pool is exercised
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    per_item_ms = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        schema_name = ((body.get("response_format") or {}).get("json_schema") or {}).get("name")
+        respond = RESPONSES.get(schema_name)
+        if respond is None:
+            return self._reply(400, {"error": {"message": f"Unsupported response_format {schema_name}"}})
+        user_text = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+        content = respond(user_text)
+        items = len(content.get("movie_vads", ()))
+        delay_ms = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms) + self.per_item_ms * items
+        time.sleep(max(delay_ms, 0.0) / 1000)
+        content_text = json.dumps(content)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body["messages"]) // 4
+        self._reply(200, {
+            "id": f"chatcmpl-stub-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content_text, "refusal": None},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content_text) // 4,
+                "total_tokens": prompt_tokens + len(content_text) // 4,
+            },
+        })
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0, per_item_ms: float = 0.0) -> ThreadingHTTPServer:
+    # port=0 picks a free port; the base URL is http://{host}:{server.server_port}/v1
+    handler = type("ConfiguredStubChatCompletions", (StubChatCompletions,), {
+        "latency_ms": latency_ms, "jitter_ms": jitter_ms, "per_item_ms": per_item_ms,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat-completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--per-item-ms", type=float, default=10.0)
+    args = parser.parse_args()
+    server = start_stub_server(args.host, args.port, args.latency_ms, args.jitter_ms, args.per_item_ms)
+    print(f"Stub OpenAI server on http://{args.host}:{server.server_port}/v1 (set OPENAI_BASE_URL to this)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
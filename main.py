@@ -1,14 +1,11 @@
 import os
+import json
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
 import pandas as pd
 import streamlit as st
-from util.helper import load_data
-from util.genre_extracter import extract_genre_from_request
-from util.function_calls import extract_VAD_from_request, extract_viewing_type_from_request, extract_audience_category_from_request, extract_movie_vad_score
-from util.data_filter import manually_filter_movies
-from util.vad_calculation import rank_movies_by_vad
+from util.catalog_snapshot import content_hash
+from util.catalog import session_memory_bytes
+from util.service_client import RecommendClient, ServiceError, SERVICE_URL
 
 # Set up logging configuration
 logging.basicConfig(
@@ -19,37 +16,57 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Ensure your API key is being correctly called
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise RuntimeError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
-else:
-    # (optionally mask most of it in logs)
-    print(f"✅ OPENAI_API_KEY loaded: {openai_api_key[:4]}…")
+st.set_page_config(page_title="AI Movie Picker")
 
-client = OpenAI()
-model="o4-mini"
 
-st.set_page_config(page_title="AI Movie Picker")
+@st.cache_resource
+def get_service_client() -> RecommendClient:
+    # All pipeline work happens in the recommendation service; without RECOMMEND_SERVICE_URL
+    # one is started inside this process and shared by every session
+    if SERVICE_URL:
+        return RecommendClient(SERVICE_URL)
+    from util.service import start_service
+    port = start_service()
+    logger.info(f"Started in-process recommendation service on port {port}")
+    return RecommendClient(f"http://127.0.0.1:{port}")
+
+
+service = get_service_client()
 
 with st.sidebar:
     uploaded_file = st.file_uploader("Load Movie Data...", type=["csv", "xlsx"])
 
     if uploaded_file is not None:
-        if uploaded_file.name.endswith(".csv"):
-            data = load_data(uploaded_file)
-            if 'movie_dataframe' not in st.session_state:
-                st.session_state['movie_dataframe'] = data
-            st.subheader(f"Rows: {data.shape[0]}, Columns: {data.shape[1]}")
-            st.write(data)
-        elif uploaded_file.name.endswith(".xlsx"):
-            data = load_data(uploaded_file)
-            st.write(data)
+        if uploaded_file.name.endswith((".csv", ".xlsx")):
+            # The service loads each catalog once per process; sessions only keep its key
+            catalog_key = content_hash(uploaded_file.getvalue())
+            try:
+                catalog_info = service.catalog_info(catalog_key, limit=1000)
+            except ServiceError:
+                # Not loaded yet (or the service restarted): upload it and show what changed
+                report = service.load_catalog(uploaded_file.name, uploaded_file.getvalue())
+                if report.get("changes"):
+                    with st.expander("Catalog changes"):
+                        st.json(report["changes"])
+                catalog_info = service.catalog_info(catalog_key, limit=1000)
+            st.session_state['catalog_key'] = catalog_key
+            st.subheader(f"Rows: {catalog_info['rows']}, Columns: {len(catalog_info['columns'])}")
+            st.caption(f"Catalog memory (shared): {catalog_info['memory_bytes'] / 1e6:.2f} MB")
+            st.write(pd.DataFrame(catalog_info['titles']))
         else:
             st.error("Unsupported file format. Please upload a CSV or Excel file.")
-    
-      
+
+    # One structured-output call for all criteria instead of separate extractors
+    combined_extraction = st.toggle("Combined criteria extraction", value=os.getenv("CRITERIA_EXTRACTION_MODE", "parallel") == "combined")
+    service_stats = service.stats()
+    cache_stats = service_stats["llm_cache"]
+    st.caption(f"LLM cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    query_cache_stats = service_stats["query_cache"]
+    st.caption(f"Query cache: {query_cache_stats['entries']} queries, {query_cache_stats['hits']} hits / {query_cache_stats['misses']} misses")
+    for field, counts in service_stats["rules"].items():
+        st.caption(f"Rule fast path ({field}): {counts['hits']} resolved / {counts['misses']} sent to LLM ({counts['hit_rate']:.0%})")
+    st.caption(f"This session's state: {session_memory_bytes(st.session_state) / 1e3:.1f} KB")
+
 st.subheader("🍿 LLM Movie Picker")
 st.caption("Let’s find your perfect pick! Drop the genre, movie/TV, preferred rating, and a director if you’ve got one")
 st.divider()
@@ -64,11 +81,8 @@ if "movie_criteria" not in st.session_state:
         "viewing_type": None,
         "audience_category": {},
         "VAD": {},
-        "movie_VAD": []
+        "numeric": None,
     }
-print(f"st.session_state.movie_criteria: {st.session_state.movie_criteria}")
-if 'filtered_df' not in st.session_state:
-    st.session_state['filtered_df'] = pd.DataFrame()
 
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
@@ -77,100 +91,94 @@ for message in st.session_state.messages:
 
 
 # Define process functions 
-def process_query(user_query: str):
+def process_query(user_query: str) -> dict | None:
+    """
+    Send the query to the recommendation service and draw its answer as it streams in.
+
+    Returns:
+        dict: the query's trace, or None when the query never reached the service.
+    """
     # 1. Add user query to session state
     add_query_to_history(user_query)
-    # 2. Extract genre from user query
-    with st.spinner("Extracting genres…"):
-        response = extract_genre_from_request({"query": user_query})
-    if response:
-        set_genre_session(response)
-    else:
-        st.warning("No genre found in your query. Please try again.")
-    # 3. Extract view type from user query (if needed)
-    with st.spinner("Extracting viewing type…"):
-        viewing_type_response = extract_viewing_type_from_request({"query": user_query})
-    if viewing_type_response:
-        set_view_type_session(viewing_type_response.viewing_type)
-    else:
-        st.warning("No viewing type found in your query. Please try again.")
-    # 4. Extract rating from user query (if needed)
-    with st.spinner("Extracting audience category…"):
-        audience_category_response = extract_audience_category_from_request({"query": user_query})
-        print(f"audience_cat: {audience_category_response}")
-    if audience_category_response.confidence < 0.6:
-        st.warning(f"Unable to extract category, due to {audience_category_response.rationale}. Please, try again with this in mind")
-        return 
-    set_audience_category_session(audience_category_response)
-    # 4. Extract VAD from user query (if needed)
-    with st.spinner("Extracting VAD…"):
-        VAD_response = extract_VAD_from_request({"query": user_query})
-    if VAD_response:
-        set_vad_session(VAD_response)
-    else:
-        st.warning("No VAD found in your query. Please try again.")
-    # movie_vad_score = extract_movie_vad_score()
-    return_value = manually_filter_movies()
-    if isinstance(return_value, dict):
-        st.warning(return_value['message'])
-        return 
-    set_filtered_data_session(return_value)
-    movie_vad_score = extract_movie_vad_score()
-    if movie_vad_score:
-        user_vad = st.session_state.movie_criteria['VAD']
-        movie_vad_array = st.session_state.movie_criteria['movie_VAD']
-        return_vad_similarities = rank_movies_by_vad(user_vad, movie_vad_array)
-        st.write(return_vad_similarities)
-    st.write(movie_vad_score)
-    st.write(return_value)
+    if 'catalog_key' not in st.session_state:
+        st.warning("Please load movie data from the sidebar first.")
+        return None
+    options = {"mode": "combined" if combined_extraction else "parallel", "k": 10}
+    # 2. Criteria arrive with the first update; the ranked list is redrawn with every later one
+    criteria_placeholder = st.container()
+    ranking_placeholder = st.empty()
+    recommendation, criteria_shown = None, False
+    try:
+        with st.spinner("Extracting criteria, filtering and ranking titles…"):
+            for recommendation in service.stream_recommend(user_query, st.session_state['catalog_key'], options, trace=True):
+                if not criteria_shown:
+                    with criteria_placeholder:
+                        show_criteria(recommendation)
+                    criteria_shown = True
+                if recommendation["results"]:
+                    ranking_placeholder.dataframe(ranked_titles_frame(recommendation["results"]), hide_index=True)
+    except ServiceError as e:
+        st.error(f"Recommendation service error: {e}")
+        return None
+    if recommendation and recommendation["message"]:
+        st.warning(recommendation["message"])
+    return recommendation.get("trace") if recommendation else None
+
+
+def show_criteria(recommendation: dict):
+    criteria = recommendation["criteria"]
+    st.session_state.movie_criteria = criteria
+    for note in recommendation["notes"]:
+        st.warning(f"{note} Please try again.")
+    if criteria["llm_genre"]:
+        st.success(f"Genre extracted: {criteria['llm_genre']}")
+    if criteria["viewing_type"]:
+        st.success(f"Viewing type(s) extracted: {', '.join(criteria['viewing_type'])}")
+    if criteria["audience_category"]:
+        st.success(f"Audience Category extracted: {criteria['audience_category']}")
+    if criteria["VAD"]:
+        st.success(f"VAD extracted: {criteria['VAD']}")
+    numeric = {name: value for name, value in (criteria.get("numeric") or {}).items() if value is not None}
+    if numeric:
+        st.success(f"Numeric limits extracted: {numeric}")
+    if recommendation["matched"]:
+        st.success(f"{recommendation['matched']} titles match the filters")
+
+
+def show_trace_panel(trace: dict):
+    # Where this query's time and tokens went, one row per span
+    with st.expander("Debug: query trace"):
+        st.json({name: value for name, value in trace.items() if name not in ("spans", "attributes", "name")})
+        st.dataframe(
+            [
+                {
+                    "span": span["name"],
+                    "duration_ms": span["duration_ms"],
+                    "status": span["status"],
+                    **span["attributes"],
+                }
+                for span in trace["spans"][1:]
+            ],
+            hide_index=True,
+        )
+        st.download_button("Download trace (JSON)", data=json.dumps(trace, default=str), file_name=f"trace-{trace['trace_id']}.json", mime="application/json")
+
+
+def ranked_titles_frame(results: list[dict]):
+    frame = pd.DataFrame(results)[['score', 'show_id', 'title', 'type', 'rating', 'description']]
+    frame['score'] = frame['score'].round(3)
+    return frame
    
 
-def set_filtered_data_session(df):
-    st.session_state['filtered_df'] = df
-    st.success(f"st.session_state['filtered_df'] set: {st.session_state['filtered_df']}")
-
 def add_query_to_history(user_query: str):
     st.session_state.messages.append({"role": "user", "content": user_query})
 
-def set_genre_session(response: dict):
-    st.session_state.movie_criteria["llm_genre"] = {
-        "genre": response.genre, 
-        "confidence": response.confidence,
-        "rationale": response.rationale
-    }
-    st.success(f"Genre extracted: {response}")
-
-def set_view_type_session(response: list[str]):
-    st.session_state.movie_criteria["viewing_type"] = response
-    st.success(f"Viewing type(s) extracted: {', '.join(response)}")
-
-def set_audience_category_session(response: str):
-    print(f"audience_category response: {response}")
-    st.session_state.movie_criteria["audience_category"] = {
-        "category":response.category,
-        "confidence": response.confidence,
-        "rationale": response.rationale
-    }
-    st.success(f"Audience Category extracted: {response}")
-
-def set_vad_session(vad: dict):
-    st.session_state.movie_criteria["VAD"] = {
-        "valence":vad.vad.valence,
-        "arousal": vad.vad.arousal,
-        "dominance": vad.vad.dominance
-    }
-    print(f"st.session_state.movie_criteria: {st.session_state.movie_criteria}")
-    st.success(f"VAD extracted: {vad.vad}")
-
 # Respond to user input
 if user_input := st.chat_input("What kind of movie are you in the mood for? 👋"):
     # Display user message in chat message container
     with st.chat_message("user"):
         st.markdown(user_input)
-    process_query(user_input)
-    
- 
-
-
-
-
+    # The service records every stage and LLM call of the query as spans on one trace
+    trace = process_query(user_input)
+    if trace:
+        show_trace_panel(trace)
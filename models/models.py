@@ -94,6 +94,10 @@ class ExtractVAD(BaseModel):
     vad: VAD 
     model_config = {"extra": "forbid"}  # Disallow extra fields
 
+# A VAD estimated locally from the lexicon when the LLM call failed; never cached as an LLM answer
+class LexiconVAD(ExtractVAD):
+    pass
+
 class MovieVAD(BaseModel):
     valence: float = Field(..., ge=0.0, le=1.0, description="Pleasantness (0–1)")
     arousal: float = Field(..., ge=0.0, le=1.0, description="Activation (0–1)")
@@ -101,4 +105,39 @@ class MovieVAD(BaseModel):
 
 class ExtractMovieVAD(BaseModel):
     movie_vad: MovieVAD 
-    model_config = {"extra": "forbid"}  # Disallow extra fields
\ No newline at end of file
+    model_config = {"extra": "forbid"}  # Disallow extra fields
+
+# Numeric limits on runtime, seasons and dates; None leaves that end of the range open
+class ExtractNumericConstraints(BaseModel):
+    min_duration_minutes: Optional[int] = Field(default=None, ge=0, description="Movies: shortest runtime in minutes")
+    max_duration_minutes: Optional[int] = Field(default=None, ge=0, description="Movies: longest runtime in minutes")
+    min_seasons: Optional[int] = Field(default=None, ge=0, description="TV: fewest seasons")
+    max_seasons: Optional[int] = Field(default=None, ge=0, description="TV: most seasons")
+    min_release_year: Optional[int] = Field(default=None, description="Released in or after this year")
+    max_release_year: Optional[int] = Field(default=None, description="Released in or before this year")
+    released_within_years: Optional[int] = Field(default=None, ge=1, description="Released in the last N years")
+    added_within_years: Optional[int] = Field(default=None, ge=1, description="Added to the catalog in the last N years")
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self.model_dump().values())
+
+# All query criteria in one structured output, so a single call can fill them together
+class ExtractQueryCriteria(BaseModel):
+    genre: ExtractGenre
+    viewing_type: ExtractViewingType
+    audience_category: ExtractAudienceCategory
+    vad: ExtractVAD
+    numeric: ExtractNumericConstraints
+
+
+# One title in a batched VAD response. The values are left unconstrained here so a single
+# out-of-range item does not fail the whole batch; each item is validated against MovieVAD.
+class ScoredMovieVAD(BaseModel):
+    show_id: str
+    valence: float
+    arousal: float
+    dominance: float
+
+class ExtractMovieVADBatch(BaseModel):
+    movie_vads: list[ScoredMovieVAD]
+    model_config = {"extra": "forbid"}  # Disallow extra fields
@@ -0,0 +1,30 @@
+import pytest
+from util.query_cache import QueryCache, query_tokens
+
+CRITERIA = {"genre": None, "viewing_type": None, "audience_category": None, "VAD": None, "numeric": None}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QueryCache(tmp_path / "query_cache.jsonl")
+
+
+def test_negated_words_are_marked():
+    assert query_tokens("Gory horror, but no comedy") == {"gory", "horror", "but", "no", "not:comedy"}
+    # Punctuation ends the scope
+    assert "not:comedy" not in query_tokens("Not gory, a comedy")
+
+
+@pytest.mark.parametrize("stored, query", [
+    ("Gory horror, but no comedy", "Comedy, but no gory horror"),
+    ("A thriller movie for adults, not a kids show", "A thriller show for kids, not an adults movie"),
+])
+def test_swapped_negation_scope_misses(cache, stored, query):
+    cache.add(stored, CRITERIA)
+    assert cache.lookup(query) is None
+    assert cache.lookup(stored) is not None
+
+
+def test_filler_words_still_match(cache):
+    cache.add("Gory horror, but no comedy", CRITERIA)
+    assert cache.lookup("Just gory horror, but no comedy") is not None
@@ -0,0 +1,25 @@
+import pytest
+from util.query_rules import resolve_numeric_constraints
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("A sci-fi show with 3 seasons", {"min_seasons": 3, "max_seasons": 3}),
+    ("A sci-fi show with 3 seasons or fewer", {"max_seasons": 3}),
+    ("A sci-fi show with three seasons or less", {"max_seasons": 3}),
+    ("A sci-fi show with 2 seasons max", {"max_seasons": 2}),
+    ("A sci-fi show with 4 seasons or more", {"min_seasons": 4}),
+    ("A sci-fi show with under 3 seasons", {"max_seasons": 2}),
+])
+def test_season_bounds(query, expected):
+    constraints = resolve_numeric_constraints(query)
+    assert constraints is not None
+    assert constraints.model_dump(exclude_none=True) == expected
+
+
+@pytest.mark.parametrize("query", [
+    # Contradictory or detached qualifiers are left to the LLM
+    "A sci-fi show with under 3 seasons or more",
+    "A sci-fi show with 3 seasons, give or take, or fewer",
+])
+def test_unclear_season_bounds_fall_back(query):
+    assert resolve_numeric_constraints(query) is None
@@ -0,0 +1,198 @@
+"""
+Batch recommendations: a JSONL file of queries in, a JSONL file of results out.
+
+Each input line is {"query": "...", "id": "...", "options": {...}} (id and options are
+optional; the id defaults to the line number). Each output line is the Recommendation
+for one input line plus its id, the trace summary and an error field when it failed:
+
+    python -m util.batch queries.jsonl results.jsonl --catalog data/netflix_titles.csv --concurrency 8
+
+Identical queries (same text up to case and whitespace, same options) run once and
+their result is written for every id. Results are appended and flushed as they finish,
+so an interrupted run picks up where it stopped when started again with the same output
+file; ids already written without an error are skipped.
+"""
+import os
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from pathlib import Path
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from util.catalog import Catalog
+from util.catalog_ingest import ingest_catalog, should_stream
+from util.catalog_snapshot import load_catalog, content_hash
+from util.engine import RecommendOptions, recommend
+from util.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+PROGRESS_EVERY = 100
+
+
+def dedup_key(query: str, options: RecommendOptions) -> str:
+    return json.dumps([" ".join(query.split()).casefold(), asdict(options)], sort_keys=True)
+
+
+def read_requests(path: Path, defaults: RecommendOptions):
+    """Yields (id, query, options) per input line; malformed lines are logged and skipped."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                query = str(record["query"]).strip()
+                options = RecommendOptions.from_dict({**asdict(defaults), **(record.get("options") or {})})
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping input line {line_number}: {e}")
+                continue
+            yield str(record.get("id", line_number)), query, options
+
+
+def read_finished(path: Path) -> dict[str, dict]:
+    """
+    Successful results already in an output file, by id.
+
+    A line cut off by an interruption is removed first, so appended results start on a
+    fresh line; failed results are not returned, so they run again.
+    """
+    if not path.exists():
+        return {}
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    finished = {}
+    for line in data.decode("utf-8").splitlines():
+        try:
+            result = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not result.get("error"):
+            finished[str(result["id"])] = result
+    return finished
+
+
+def run_one(query: str, catalog: Catalog, options: RecommendOptions) -> dict:
+    try:
+        with start_trace("batch_recommend", export_path=None, query=query) as trace:
+            result = recommend(query, catalog, options).to_dict()
+        result["error"] = None
+    except Exception as e:
+        logger.error(f"Query failed: {query!r}: {e}")
+        result = {"query": query, "error": f"{type(e).__name__}: {e}"}
+    result["trace"] = trace.summary()
+    return result
+
+
+def run_batch(input_path: Path, output_path: Path, catalog: Catalog, concurrency: int = DEFAULT_CONCURRENCY,
+              defaults: RecommendOptions | None = None) -> dict:
+    """
+    Run every query in input_path and append one result line per input id to output_path.
+
+    At most concurrency queries run at once, and only about twice that many are read
+    ahead, so memory stays flat however long the input is.
+
+    Returns:
+        dict: counts of written, resumed (skipped), deduplicated and failed ids.
+    """
+    defaults = defaults or RecommendOptions()
+    finished = read_finished(output_path)
+    # Finished results double as answers for duplicates that had not been written yet
+    finished_by_key = {}
+    counts = {"written": 0, "resumed": 0, "deduplicated": 0, "errors": 0}
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        def write(ids: list[str], result: dict):
+            with write_lock:
+                for record_id in ids:
+                    out.write(json.dumps({**result, "id": record_id}, default=str, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["written"] += len(ids)
+                counts["errors"] += len(ids) if result.get("error") else 0
+                if counts["written"] // PROGRESS_EVERY != (counts["written"] - len(ids)) // PROGRESS_EVERY:
+                    elapsed = time.perf_counter() - start
+                    logger.warning(f"{counts['written']} results written, {counts['written'] / elapsed:.1f}/s")
+
+        # dedup key -> (future, ids waiting on it)
+        pending: dict[str, tuple] = {}
+
+        def drain(block: bool):
+            done, _ = wait([future for future, _ in pending.values()], return_when=FIRST_COMPLETED) if block else (
+                [future for future, _ in pending.values() if future.done()], None)
+            for key, (future, ids) in list(pending.items()):
+                if future in done:
+                    result = future.result()
+                    if not result.get("error"):
+                        finished_by_key[key] = result
+                    write(ids, result)
+                    del pending[key]
+
+        for record_id, query, options in read_requests(input_path, defaults):
+            key = dedup_key(query, options)
+            if record_id in finished:
+                counts["resumed"] += 1
+                finished_by_key.setdefault(key, finished[record_id])
+                continue
+            if key in finished_by_key:
+                counts["deduplicated"] += 1
+                write([record_id], finished_by_key[key])
+                continue
+            if key in pending:
+                counts["deduplicated"] += 1
+                pending[key][1].append(record_id)
+                continue
+            while len(pending) >= 2 * concurrency:
+                drain(block=True)
+            pending[key] = (pool.submit(run_one, query, catalog, options), [record_id])
+            drain(block=False)
+        while pending:
+            drain(block=True)
+    counts["wall_seconds"] = round(time.perf_counter() - start, 3)
+    return counts
+
+
+def load_batch_catalog(path: Path) -> Catalog:
+    if should_stream(path):
+        catalog = Catalog.open(*ingest_catalog(path))
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        upload = io.BytesIO(raw)
+        upload.name = path.name
+        catalog = Catalog(content_hash(raw), load_catalog(upload))
+    catalog.warm_indexes()
+    return catalog
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("input", type=Path, help="JSONL file of {\"query\", \"id\", \"options\"} lines")
+    parser.add_argument("output", type=Path, help="JSONL results; appended to, so a rerun resumes")
+    parser.add_argument("--catalog", type=Path, default=Path(__file__).resolve().parent.parent / "data" / "netflix_titles.csv")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--k", type=int, default=RecommendOptions.k)
+    parser.add_argument("--mode", choices=["parallel", "combined"], default=None)
+    parser.add_argument("--max-live", type=int, default=RecommendOptions.max_live, help="titles scored live per query")
+    args = parser.parse_args(argv)
+
+    catalog = load_batch_catalog(args.catalog)
+    defaults = RecommendOptions.from_dict({"k": args.k, "mode": args.mode, "max_live": args.max_live})
+    # Per-query INFO logs would drown the progress lines
+    logging.getLogger().setLevel(logging.WARNING)
+    counts = run_batch(args.input, args.output, catalog, args.concurrency, defaults)
+    print(json.dumps(counts))
+    return counts["errors"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
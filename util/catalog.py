@@ -0,0 +1,231 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from util.catalog_index import CatalogIndex
+from util.catalog_ingest import CHUNK_ROWS, INDEX_DIR, KEYWORDS_DIR, VECTORS_DIR
+from util.catalog_snapshot import StringTable, open_snapshot
+from util.text_index import DescriptionVectorIndex, RECALL_TOP_N
+from util.keyword_index import KeywordIndex, SegmentedKeywordIndex
+from util.vad_index import VADGridIndex, build_catalog_vad_index
+from util.vad_store import KEY_DTYPE, vad_key
+
+logger = logging.getLogger(__name__)
+
+# A VAD grid index this recent is reused even if scores were flushed since; titles it
+# does not know yet are looked up in the store by the live scoring step anyway
+VAD_INDEX_MAX_AGE_SECONDS = float(os.getenv("VAD_INDEX_MAX_AGE_SECONDS", "5"))
+# Catalogs kept loaded, with their indexes; the least recently used one is dropped beyond this
+MAX_LOADED_CATALOGS = int(os.getenv("MAX_LOADED_CATALOGS", "4"))
+
+
+class Catalog:
+    """
+    One loaded catalog plus its derived indexes, shared read-only by every session.
+
+    Sessions keep only the catalog key and row positions into it; use rows() to get a
+    DataFrame view of a selection when it has to be displayed.
+
+    A catalog opened from an ingested snapshot (Catalog.open) is memory-mapped: movie_df
+    holds only the typed columns, the text columns stay on disk as StringTables decoded
+    row by row in rows(), and the indexes are the ones built at ingest.
+    """
+
+    def __init__(self, key: str, movie_df: pd.DataFrame, index: CatalogIndex | None = None,
+                 strings: dict[str, StringTable] | None = None, columns: list[str] | None = None,
+                 index_dir: Path | None = None):
+        self.key = key
+        self.movie_df = movie_df
+        self.strings = strings or {}
+        self.columns = columns or list(movie_df.columns)
+        self.index_dir = index_dir
+        self.index = index if index is not None else CatalogIndex(movie_df)
+        self.show_ids = self.strings['show_id'] if 'show_id' in self.strings else movie_df['show_id'].to_numpy()
+        self._vad_keys: np.ndarray | None = None
+        # (store version, build time, index)
+        self._vad_index: tuple[int, float, VADGridIndex] | None = None
+        self._text_index: DescriptionVectorIndex | None = None
+        self._keyword_index: KeywordIndex | SegmentedKeywordIndex | None = None
+        self._lock = threading.Lock()
+        # Shared arrays must never be mutated by a session
+        if isinstance(self.show_ids, np.ndarray):
+            self.show_ids.flags.writeable = False
+        self.index.genre_matrix.flags.writeable = False
+        for mask in (*self.index.type_masks.values(), *self.index.rating_masks.values()):
+            mask.flags.writeable = False
+        for array in (array for arrays in self.index.ranges.values() for array in arrays):
+            array.flags.writeable = False
+
+    @classmethod
+    def open(cls, key: str, directory: str | Path) -> "Catalog":
+        """A catalog written by util.catalog_ingest, served from its memory-mapped snapshot."""
+        directory = Path(directory)
+        movie_df, strings, columns = open_snapshot(directory)
+        return cls(key, movie_df, index=CatalogIndex.load(directory / INDEX_DIR), strings=strings, columns=columns, index_dir=directory)
+
+    def __len__(self) -> int:
+        return len(self.movie_df)
+
+    def rows(self, rows) -> pd.DataFrame:
+        frame = self.movie_df.iloc[rows]
+        if not self.strings:
+            return frame
+        # Only the selected rows of the on-disk text columns are decoded
+        return frame.assign(**{name: table.take(rows) for name, table in self.strings.items()})[self.columns]
+
+    def vad_keys(self) -> np.ndarray:
+        # The VAD store key of every row, hashed once per catalog, a block of rows at a time
+        with self._lock:
+            if self._vad_keys is None:
+                keys = np.empty(len(self), dtype=KEY_DTYPE)
+                for first in range(0, len(self), CHUNK_ROWS):
+                    block = slice(first, first + CHUNK_ROWS)
+                    if self.strings:
+                        show_ids, descriptions = self.strings['show_id'].take(block), self.strings['description'].take(block)
+                    else:
+                        show_ids, descriptions = self.movie_df['show_id'].iloc[block], self.movie_df['description'].iloc[block]
+                    keys[block] = [vad_key(show_id, description) for show_id, description in zip(show_ids, descriptions)]
+                keys.flags.writeable = False
+                self._vad_keys = keys
+            return self._vad_keys
+
+    def vad_index(self, store) -> VADGridIndex:
+        # Rebuilt from the store (a searchsorted per segment, no per-title Python) once it
+        # has new scores and the current index is older than VAD_INDEX_MAX_AGE_SECONDS
+        keys = self.vad_keys()
+        with self._lock:
+            current = self._vad_index
+            if current is None or (current[0] != store.version and time.monotonic() - current[1] > VAD_INDEX_MAX_AGE_SECONDS):
+                version = store.version
+                self._vad_index = (version, time.monotonic(), build_catalog_vad_index(keys, store))
+            return self._vad_index[2]
+
+    def text_index(self) -> DescriptionVectorIndex:
+        # Built on first use: only queries that reach the recall stage pay for it
+        with self._lock:
+            if self._text_index is None:
+                if self.index_dir is not None:
+                    self._text_index = DescriptionVectorIndex.load(self.index_dir / VECTORS_DIR)
+                else:
+                    self._text_index = DescriptionVectorIndex(self.movie_df['description'].fillna("").tolist())
+            return self._text_index
+
+    def keyword_index(self) -> KeywordIndex | SegmentedKeywordIndex:
+        with self._lock:
+            if self._keyword_index is None:
+                if self.index_dir is not None:
+                    self._keyword_index = SegmentedKeywordIndex.load(self.index_dir / KEYWORDS_DIR)
+                else:
+                    self._keyword_index = KeywordIndex(self.movie_df)
+            return self._keyword_index
+
+    def warm_indexes(self):
+        # Build the lazy indexes now rather than inside the first query that needs them
+        self.vad_keys()
+        if RECALL_TOP_N > 0:
+            self.keyword_index()
+            self.text_index()
+
+    def memory_bytes(self) -> int:
+        index_bytes = self.index.genre_matrix.nbytes + sum(
+            mask.nbytes for mask in (*self.index.type_masks.values(), *self.index.rating_masks.values())
+        ) + sum(array.nbytes for arrays in self.index.ranges.values() for array in arrays)
+        for derived in (self._text_index, self._keyword_index, self._vad_index[2] if self._vad_index else None):
+            if derived is not None:
+                index_bytes += derived.memory_bytes()
+        if self._vad_keys is not None:
+            index_bytes += self._vad_keys.nbytes
+        string_bytes = sum(table.nbytes for table in self.strings.values())
+        return int(self.movie_df.memory_usage(deep=True).sum()) + string_bytes + index_bytes
+
+
+# Least recently used first. A dropped catalog stays usable by the queries already holding
+# it; later requests for its key get None from find_catalog and have to load it again
+_catalogs: OrderedDict[str, Catalog] = OrderedDict()
+_catalogs_lock = threading.Lock()
+# One lock per catalog key being loaded, so a slow load (e.g. VAD enrichment of a refresh)
+# only blocks callers waiting for that same catalog
+_load_locks: dict[str, threading.Lock] = {}
+
+def _touch(key: str) -> Catalog | None:
+    # Caller holds _catalogs_lock
+    catalog = _catalogs.get(key)
+    if catalog is not None:
+        _catalogs.move_to_end(key)
+    return catalog
+
+def _get_or_create_catalog(key: str, create) -> Catalog:
+    with _catalogs_lock:
+        catalog = _touch(key)
+        if catalog is not None:
+            return catalog
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+    with load_lock:
+        with _catalogs_lock:
+            catalog = _touch(key)
+        if catalog is None:
+            catalog = create()
+            with _catalogs_lock:
+                _catalogs[key] = catalog
+                _load_locks.pop(key, None)
+                while len(_catalogs) > max(MAX_LOADED_CATALOGS, 1):
+                    evicted, _ = _catalogs.popitem(last=False)
+                    logger.info(f"Dropped least recently used catalog {evicted}")
+        return catalog
+
+def get_or_load_catalog(key: str, loader) -> Catalog:
+    # loader() -> DataFrame runs at most once per key per process, outside the global lock
+    def create():
+        catalog = Catalog(key, loader())
+        logger.info(f"Loaded shared catalog {key}: {len(catalog)} titles")
+        return catalog
+    return _get_or_create_catalog(key, create)
+
+def get_or_open_catalog(key: str, directory: str | Path) -> Catalog:
+    # get_or_load_catalog for an ingested snapshot directory
+    def create():
+        catalog = Catalog.open(key, directory)
+        logger.info(f"Opened ingested catalog {key}: {len(catalog)} titles")
+        return catalog
+    return _get_or_create_catalog(key, create)
+
+def get_catalog(key: str) -> Catalog:
+    catalog = find_catalog(key)
+    if catalog is None:
+        raise KeyError(key)
+    return catalog
+
+def find_catalog(key: str) -> Catalog | None:
+    with _catalogs_lock:
+        return _touch(key)
+
+def loaded_catalog_keys() -> list[str]:
+    with _catalogs_lock:
+        return sorted(_catalogs)
+
+
+def session_memory_bytes(state) -> int:
+    # Approximate bytes owned by one session's state; shared catalogs are not counted
+    seen = set()
+
+    def size(value) -> int:
+        if id(value) in seen or isinstance(value, Catalog):
+            return 0
+        seen.add(id(value))
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+        total = sys.getsizeof(value)
+        if isinstance(value, dict):
+            total += sum(size(k) + size(v) for k, v in value.items())
+        elif isinstance(value, (list, tuple, set)):
+            total += sum(size(v) for v in value)
+        return total
+
+    return sum(size(key) + size(state[key]) for key in list(state.keys()))
@@ -0,0 +1,265 @@
+import json
+import time
+import logging
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from util.catalog_snapshot import ArrayWriter, fill_grouped_order
+
+logger = logging.getLogger(__name__)
+
+# Viewing types the extractors emit -> values of the catalog's `type` column
+VIEWING_TYPE_LABELS = {
+    "Movie": ["Movie"],
+    "TV Series": ["TV Show"],
+    "TV Show": ["TV Show"],
+    "Miniseries": ["TV Show"],
+}
+
+# Numeric columns parsed by helper.type_catalog; date_added is indexed as days since the epoch
+RANGE_COLUMNS = ("duration_minutes", "seasons", "release_year", "date_added")
+EPOCH = pd.Timestamp("1970-01-01")
+INDEX_MANIFEST = "index.json"
+# Rows per block when a persisted index is filled from its on-disk inputs
+FILL_BLOCK_ROWS = 1 << 20
+
+
+def _split_genres(genre: pd.Series) -> tuple[pd.Series, np.ndarray]:
+    # One label per (title, label) pair, plus the position of its title
+    split_labels = genre.fillna("").astype(str).str.split(", ")
+    labels = split_labels.explode()
+    rows = np.repeat(np.arange(len(genre)), split_labels.str.len().to_numpy())
+    keep = (labels != "").to_numpy()
+    return labels[keep], rows[keep]
+
+
+def _range_values(column: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(column):
+        column = (column - EPOCH).dt.days
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+
+class CatalogIndex:
+    """
+    Facet masks over the catalog, built once at load time.
+
+    - genre: multi-hot matrix over the split `listed_in` labels, stored label-major
+      so selecting a label is a contiguous row read.
+    - type / rating: one boolean mask per distinct value.
+    - duration_minutes / seasons / release_year / date_added: the non-missing values
+      in sorted order plus the rows they came from, so a range is two binary searches
+      and one slice of row positions.
+
+    Filtering is then a handful of vectorised mask ANDs instead of per-query
+    string scans over the DataFrame.
+    """
+
+    def __init__(self, movie_df: pd.DataFrame):
+        start = time.perf_counter()
+        self.n_rows = len(movie_df)
+
+        labels, rows = _split_genres(movie_df['genre'])
+        codes, self.genre_labels = pd.factorize(labels, sort=True)
+        self.genre_matrix = np.zeros((len(self.genre_labels), self.n_rows), dtype=bool)
+        self.genre_matrix[codes, rows] = True
+
+        self.type_masks = self._value_masks(movie_df['type'])
+        self.rating_masks = self._value_masks(movie_df['rating'])
+        self.ranges = {column: self._range_index(movie_df[column]) for column in RANGE_COLUMNS if column in movie_df}
+        logger.info(
+            f"Built catalog index: {self.n_rows} titles, {len(self.genre_labels)} genre labels "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+    @staticmethod
+    def _value_masks(column: pd.Series) -> dict[str, np.ndarray]:
+        codes, values = pd.factorize(column.astype(object))
+        return {str(value): codes == i for i, value in enumerate(values)}
+
+    @classmethod
+    def load(cls, directory: str | Path, mmap_mode: str | None = "r") -> "CatalogIndex":
+        """An index written by CatalogIndexBuilder; its arrays stay memory-mapped."""
+        directory = Path(directory)
+        manifest = json.loads((directory / INDEX_MANIFEST).read_text())
+        index = cls.__new__(cls)
+        index.n_rows = manifest["n_rows"]
+        index.genre_labels = pd.Index(manifest["genre_labels"], dtype=object)
+        index.genre_matrix = np.load(directory / "genre_matrix.npy", mmap_mode=mmap_mode)
+        for facet in ("type", "rating"):
+            matrix = np.load(directory / f"{facet}_matrix.npy", mmap_mode=mmap_mode)
+            setattr(index, f"{facet}_masks", {value: matrix[i] for i, value in enumerate(manifest[f"{facet}_values"])})
+        index.ranges = {
+            column: tuple(np.load(directory / f"range.{column}.{part}.npy", mmap_mode=mmap_mode) for part in ("values", "order", "missing"))
+            for column in manifest["range_columns"]
+        }
+        return index
+
+    @staticmethod
+    def _range_index(column: pd.Series) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        values = _range_values(column)
+        missing = np.isnan(values)
+        present = np.flatnonzero(~missing)
+        order = present[np.argsort(values[present], kind="stable")]
+        return values[order], order, missing
+
+    def all_rows(self) -> np.ndarray:
+        return np.ones(self.n_rows, dtype=bool)
+
+    def genre_mask(self, genre: str) -> np.ndarray:
+        # Literal (not regex) substring match against the label vocabulary, so "Comedy" still
+        # covers "Stand-Up Comedy" the way the old str.contains scan did
+        label_ids = [i for i, label in enumerate(self.genre_labels) if genre in label]
+        if not label_ids:
+            return np.zeros(self.n_rows, dtype=bool)
+        return self.genre_matrix[label_ids].any(axis=0)
+
+    def type_mask(self, viewing_types: list[str]) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for viewing_type in viewing_types:
+            values = VIEWING_TYPE_LABELS.get(viewing_type)
+            if values is None:
+                # Unknown label: fall back to matching any of its words against the type values
+                words = viewing_type.split()
+                values = [value for value in self.type_masks if any(word in value for word in words)]
+            for value in values:
+                if value in self.type_masks:
+                    mask |= self.type_masks[value]
+        return mask
+
+    def rating_mask(self, ratings: list[str]) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for rating in ratings:
+            if rating in self.rating_masks:
+                mask |= self.rating_masks[rating]
+        return mask
+
+    def range_mask(self, column: str, low: float | None = None, high: float | None = None) -> np.ndarray:
+        """
+        Rows whose value lies in [low, high], plus rows with no value at all, so a runtime
+        limit does not drop TV shows (which have seasons instead) from a mixed request.
+        """
+        if column not in self.ranges:
+            return self.all_rows()
+        sorted_values, order, missing = self.ranges[column]
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        mask = missing.copy()
+        mask[order[start:stop]] = True
+        return mask
+
+    def latest(self, column: str) -> float | None:
+        # Largest value of a range column, e.g. the newest release year in this catalog
+        sorted_values = self.ranges[column][0] if column in self.ranges else ()
+        return float(sorted_values[-1]) if len(sorted_values) else None
+
+
+class CatalogIndexBuilder:
+    """
+    Builds the CatalogIndex of a catalog fed in row chunks, straight to disk.
+
+    add() only appends each chunk's genre postings, facet codes and range values to
+    files and tallies the distinct values; finish() then fills the label-major masks
+    block by block and orders each range column with a counting sort over its
+    distinct values (years, minutes, seasons and days are all small integer domains),
+    so memory stays bounded by the chunk size and the number of distinct values.
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.n_rows = 0
+        self._genre_ids: dict[str, int] = {}
+        self._genre_labels = ArrayWriter(self.directory / "genre_postings.labels.npy", np.int32)
+        self._genre_rows = ArrayWriter(self.directory / "genre_postings.rows.npy", np.int64)
+        self._facet_ids: dict[str, dict[str, int]] = {"type": {}, "rating": {}}
+        self._facet_codes = {facet: ArrayWriter(self.directory / f"{facet}.codes.npy", np.int32) for facet in self._facet_ids}
+        self._range_counts: dict[str, dict[float, int]] = {}
+        self._range_values: dict[str, ArrayWriter] = {}
+
+    @staticmethod
+    def _codes(values, ids: dict[str, int]) -> np.ndarray:
+        # Codes into a vocabulary that grows as new values show up; missing values are -1
+        codes, uniques = pd.factorize(pd.Series(values).astype(object))
+        lookup = np.array([ids.setdefault(str(value), len(ids)) for value in uniques] + [-1], dtype=np.int32)
+        return lookup[codes]
+
+    def add(self, chunk: pd.DataFrame):
+        labels, rows = _split_genres(chunk['genre'])
+        self._genre_labels.append(self._codes(labels, self._genre_ids))
+        self._genre_rows.append(rows + self.n_rows)
+        for facet, ids in self._facet_ids.items():
+            self._facet_codes[facet].append(self._codes(chunk[facet], ids))
+        for column in RANGE_COLUMNS:
+            if column not in chunk:
+                continue
+            values = _range_values(chunk[column])
+            if column not in self._range_values:
+                self._range_values[column] = ArrayWriter(self.directory / f"{column}.values.npy", np.float64)
+                self._range_counts[column] = {}
+            self._range_values[column].append(values)
+            counts = self._range_counts[column]
+            distinct, distinct_counts = np.unique(values[~np.isnan(values)], return_counts=True)
+            for value, count in zip(distinct.tolist(), distinct_counts.tolist()):
+                counts[value] = counts.get(value, 0) + count
+        self.n_rows += len(chunk)
+
+    def finish(self) -> CatalogIndex:
+        start = time.perf_counter()
+        genre_labels = sorted(self._genre_ids)
+        # Labels were numbered in order of appearance; the matrix is laid out in sorted label order
+        label_rank = np.empty(len(genre_labels), dtype=np.int32)
+        label_rank[[self._genre_ids[label] for label in genre_labels]] = np.arange(len(genre_labels), dtype=np.int32)
+        genre_matrix = np.lib.format.open_memmap(self.directory / "genre_matrix.npy", mode="w+", dtype=bool, shape=(len(genre_labels), self.n_rows))
+        labels = np.load(self._genre_labels.close(), mmap_mode="r")
+        rows = np.load(self._genre_rows.close(), mmap_mode="r")
+        for first in range(0, len(rows), FILL_BLOCK_ROWS):
+            genre_matrix[label_rank[labels[first:first + FILL_BLOCK_ROWS]], rows[first:first + FILL_BLOCK_ROWS]] = True
+        genre_matrix.flush()
+        del genre_matrix, labels, rows
+
+        manifest = {"n_rows": self.n_rows, "genre_labels": genre_labels, "range_columns": list(self._range_values)}
+        for facet, ids in self._facet_ids.items():
+            manifest[f"{facet}_values"] = list(ids)
+            matrix = np.lib.format.open_memmap(self.directory / f"{facet}_matrix.npy", mode="w+", dtype=bool, shape=(len(ids), self.n_rows))
+            codes = np.load(self._facet_codes[facet].close(), mmap_mode="r")
+            for first in range(0, self.n_rows, FILL_BLOCK_ROWS):
+                block = np.asarray(codes[first:first + FILL_BLOCK_ROWS])
+                present = np.flatnonzero(block >= 0)
+                matrix[block[present], first + present] = True
+            matrix.flush()
+            del matrix, codes
+
+        for column, writer in self._range_values.items():
+            self._write_range(column, np.load(writer.close(), mmap_mode="r"), self._range_counts[column])
+
+        # The appended inputs are no longer needed once the index arrays are filled
+        for name in ("genre_postings.labels", "genre_postings.rows", "type.codes", "rating.codes", *(f"{c}.values" for c in self._range_values)):
+            (self.directory / f"{name}.npy").unlink(missing_ok=True)
+        (self.directory / INDEX_MANIFEST).write_text(json.dumps(manifest))
+        logger.info(
+            f"Built catalog index on disk: {self.n_rows} titles, {len(genre_labels)} genre labels "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return CatalogIndex.load(self.directory)
+
+    def _write_range(self, column: str, values: np.ndarray, counts: dict[float, int]):
+        distinct = np.array(sorted(counts), dtype=np.float64)
+        value_counts = np.array([counts[value] for value in distinct.tolist()], dtype=np.int64)
+        value_start = np.concatenate([[0], np.cumsum(value_counts)])
+        n_present = int(value_start[-1])
+        sorted_values = np.lib.format.open_memmap(self.directory / f"range.{column}.values.npy", mode="w+", dtype=np.float64, shape=(n_present,))
+        order = np.lib.format.open_memmap(self.directory / f"range.{column}.order.npy", mode="w+", dtype=np.int64, shape=(n_present,))
+        missing = np.lib.format.open_memmap(self.directory / f"range.{column}.missing.npy", mode="w+", dtype=bool, shape=(self.n_rows,))
+        for i, value in enumerate(distinct.tolist()):
+            sorted_values[value_start[i]:value_start[i + 1]] = value
+        # Counting sort over the distinct values, in row order within a value: the stable
+        # argsort the in-memory index uses
+        def value_ids():
+            for first in range(0, self.n_rows, FILL_BLOCK_ROWS):
+                block = np.asarray(values[first:first + FILL_BLOCK_ROWS])
+                block_missing = np.isnan(block)
+                missing[first:first + len(block)] = block_missing
+                yield first, np.where(block_missing, -1, np.searchsorted(distinct, np.nan_to_num(block)))
+        fill_grouped_order(value_ids(), value_counts, order)
+        for array in (sorted_values, order, missing):
+            array.flush()
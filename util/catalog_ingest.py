@@ -0,0 +1,232 @@
+"""
+Chunked ingest for catalogs too large to parse in one read.
+
+The CSV is read CHUNK_ROWS titles at a time. Each chunk is typed like load_data does
+(util.helper.type_catalog) and appended to the columnar snapshot files, while the facet
+index, keyword index segments and description vectors are built from the same chunk and
+written next to them. Nothing is kept per title in memory, so peak memory depends on the
+chunk size, not the catalog size. Run from the repo root:
+
+    python -m util.catalog_ingest data/big_catalog.csv --chunk-rows 50000
+
+The result is a snapshot directory keyed by the file's content hash, which
+Catalog.open() serves memory-mapped.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from util.helper import type_catalog
+from util.catalog_index import CatalogIndexBuilder, FILL_BLOCK_ROWS
+from util.catalog_snapshot import (
+    DEFAULT_SNAPSHOT_DIR, MANIFEST_FILE, SNAPSHOT_VERSION, ArrayWriter, StringTableWriter, file_content_hash,
+    replace_snapshot_dir, snapshot_exists,
+)
+from util.keyword_index import KeywordIndexBuilder
+from util.text_index import DescriptionVectorIndexBuilder
+
+logger = logging.getLogger(__name__)
+
+# Titles per chunk; peak memory is set by the per-chunk keyword index build (~0.8 GB at 50k)
+CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000"))
+# CSV exports at least this large are ingested in chunks instead of parsed in one read
+STREAMING_INGEST_BYTES = int(os.getenv("STREAMING_INGEST_BYTES", str(256 * 1024 * 1024)))
+# Subdirectories of an ingested snapshot holding its prebuilt indexes
+INDEX_DIR, KEYWORDS_DIR, VECTORS_DIR = "index", "keywords", "vectors"
+
+
+class _CategoryWriter:
+    # Codes into one vocabulary shared by all chunks; sorted like astype("category") at the end
+    def __init__(self, directory: Path, name: str):
+        self.directory, self.name = directory, name
+        self.ids: dict[str, int] = {}
+        self._codes = ArrayWriter(directory / f"{name}.codes.unsorted.npy", np.int32)
+
+    def append(self, column: pd.Series):
+        codes, uniques = pd.factorize(column.astype(object))
+        lookup = np.array([self.ids.setdefault(str(value), len(self.ids)) for value in uniques] + [-1], dtype=np.int32)
+        self._codes.append(lookup[codes])
+
+    def close(self) -> dict:
+        categories = sorted(self.ids)
+        rank = np.empty(len(categories) + 1, dtype=np.int32)
+        rank[[self.ids[value] for value in categories]] = np.arange(len(categories), dtype=np.int32)
+        rank[-1] = -1
+        dtype = np.int8 if len(categories) < 2 ** 7 else np.int16 if len(categories) < 2 ** 15 else np.int32
+        unsorted = np.load(self._codes.close(), mmap_mode="r")
+        codes = ArrayWriter(self.directory / f"{self.name}.codes.npy", dtype)
+        for first in range(0, len(unsorted), FILL_BLOCK_ROWS):
+            codes.append(rank[unsorted[first:first + FILL_BLOCK_ROWS]])
+        codes.close()
+        del unsorted
+        (self.directory / f"{self.name}.codes.unsorted.npy").unlink()
+        table = StringTableWriter(self.directory, f"{self.name}.categories")
+        table.append(categories)
+        table.close()
+        return {"name": self.name, "kind": "category"}
+
+
+class _NumericWriter:
+    # Integer columns keep a null mask and become nullable ints only if a value was missing
+    def __init__(self, directory: Path, name: str, dtype):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self._values = ArrayWriter(directory / f"{name}.npy", self.dtype)
+        self._mask = ArrayWriter(directory / f"{name}.mask.npy", bool) if self.dtype.kind in "iu" else None
+        self.any_missing = False
+
+    def append(self, column: pd.Series):
+        if self._mask is None:
+            self._values.append(column.to_numpy(dtype=self.dtype, na_value=np.nan))
+            return
+        mask = column.isna().to_numpy()
+        self.any_missing |= bool(mask.any())
+        self._values.append(column.to_numpy(dtype=self.dtype, na_value=0))
+        self._mask.append(mask)
+
+    def close(self) -> dict:
+        self._values.close()
+        if self._mask is None:
+            return {"name": self.name, "kind": "numeric"}
+        mask_path = self._mask.close()
+        if not self.any_missing:
+            mask_path.unlink()
+            return {"name": self.name, "kind": "numeric"}
+        return {"name": self.name, "kind": "nullable_int", "dtype": self.dtype.name.capitalize()}
+
+
+class _DatetimeWriter:
+    def __init__(self, directory: Path, name: str, unit: str):
+        self.name, self.unit = name, unit
+        self._ticks = ArrayWriter(directory / f"{name}.npy", np.int64)
+
+    def append(self, column: pd.Series):
+        self._ticks.append(column.to_numpy().astype(f"datetime64[{self.unit}]").view("int64"))
+
+    def close(self) -> dict:
+        self._ticks.close()
+        return {"name": self.name, "kind": "datetime", "unit": self.unit}
+
+
+class _StringWriter:
+    def __init__(self, directory: Path, name: str):
+        self.name = name
+        self._table = StringTableWriter(directory, name)
+
+    def append(self, column: pd.Series):
+        self._table.append(column.to_numpy(dtype=object))
+
+    def close(self) -> dict:
+        self._table.close()
+        return {"name": self.name, "kind": "string"}
+
+
+def _column_writer(directory: Path, name: str, column: pd.Series):
+    # The first chunk's dtypes decide each column's on-disk layout (the same kinds as save_snapshot)
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return _CategoryWriter(directory, name)
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return _DatetimeWriter(directory, name, np.datetime_data(column.to_numpy().dtype)[0])
+    if pd.api.types.is_numeric_dtype(dtype):
+        numpy_dtype = dtype.numpy_dtype if isinstance(dtype, pd.api.extensions.ExtensionDtype) else dtype
+        return _NumericWriter(directory, name, numpy_dtype)
+    return _StringWriter(directory, name)
+
+
+def is_ingested(directory: Path) -> bool:
+    if not snapshot_exists(directory):
+        return False
+    return bool(json.loads((directory / MANIFEST_FILE).read_text()).get("indexes"))
+
+
+def should_stream(path: str | Path) -> bool:
+    path = Path(path)
+    return path.suffix == ".csv" and path.stat().st_size >= STREAMING_INGEST_BYTES
+
+
+def ingest_catalog(path: str | Path, snapshot_dir: str | Path = DEFAULT_SNAPSHOT_DIR, chunk_rows: int = CHUNK_ROWS) -> tuple[str, Path]:
+    """
+    Ingest a catalog CSV chunk by chunk into a snapshot with prebuilt indexes.
+
+    Columns are read as strings and typed per chunk, so every chunk gets the same
+    dtypes whatever values it happens to hold (columns outside type_catalog stay text).
+    The snapshot is built in a temp directory and moved into place with
+    replace_snapshot_dir, so readers only ever see a complete one; a file already
+    ingested is not read again.
+
+    Returns:
+        (str, Path): the catalog key (content hash of the file) and the snapshot directory.
+    """
+    path = Path(path)
+    if path.suffix != ".csv":
+        raise ValueError("Chunked ingest reads CSV files only")
+    key = file_content_hash(path)
+    directory = Path(snapshot_dir) / key
+    if is_ingested(directory):
+        logger.info(f"Catalog {path.name} already ingested as {key}")
+        return key, directory
+
+    start = time.perf_counter()
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=".ingest-"))
+    try:
+        writers = None
+        index = CatalogIndexBuilder(tmp_dir / INDEX_DIR)
+        keywords = KeywordIndexBuilder(tmp_dir / KEYWORDS_DIR)
+        vectors = DescriptionVectorIndexBuilder(tmp_dir / VECTORS_DIR)
+        n_rows = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=str):
+            chunk = type_catalog(chunk.rename(columns={"listed_in": "genre"}))
+            if writers is None:
+                writers = [_column_writer(tmp_dir, name, chunk[name]) for name in chunk.columns]
+            for writer in writers:
+                writer.append(chunk[writer.name])
+            index.add(chunk)
+            keywords.add(chunk)
+            vectors.add(chunk['description'].fillna("").tolist())
+            n_rows += len(chunk)
+            logger.info(f"Ingested {n_rows} titles from {path.name} in {time.perf_counter() - start:.1f} s")
+        if writers is None:
+            raise ValueError(f"{path.name} has no rows")
+        columns = [writer.close() for writer in writers]
+        index.finish()
+        keywords.finish()
+        vectors.finish()
+        manifest = {"version": SNAPSHOT_VERSION, "n_rows": n_rows, "columns": columns, "indexes": [INDEX_DIR, KEYWORDS_DIR, VECTORS_DIR]}
+        (tmp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+        replace_snapshot_dir(tmp_dir, directory)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    logger.info(f"Ingested catalog {key}: {n_rows} titles in {time.perf_counter() - start:.1f} s")
+    return key, directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", type=Path, help="catalog CSV export")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--snapshot-dir", type=Path, default=DEFAULT_SNAPSHOT_DIR)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    key, directory = ingest_catalog(args.path, args.snapshot_dir, args.chunk_rows)
+    report = {"catalog_key": key, "directory": str(directory)}
+    try:
+        import resource
+        # Linux reports kilobytes
+        report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        pass
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
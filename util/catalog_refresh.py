@@ -0,0 +1,145 @@
+import os
+import re
+import logging
+from pathlib import Path
+from dataclasses import dataclass, field
+import pandas as pd
+from util.vad_store import VADStore, description_hash, vad_key, get_vad_store
+from util.catalog_snapshot import DEFAULT_SNAPSHOT_DIR, content_hash, load_catalog, load_snapshot, snapshot_exists
+
+logger = logging.getLogger(__name__)
+
+# One pointer file per catalog lineage, naming the snapshot of its most recent export
+LINEAGE_DIR = "lineages"
+
+
+@dataclass
+class CatalogDiff:
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    previous_key: str | None = None
+    new_key: str | None = None
+    enriched: int = 0
+
+    def summary(self) -> dict:
+        return {
+            "previous": self.previous_key,
+            "current": self.new_key,
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "removed": len(self.removed),
+            "unchanged": self.unchanged,
+            "vad_scored": self.enriched,
+        }
+
+
+def _description_hashes(df: pd.DataFrame) -> pd.Series:
+    return pd.Series([description_hash(d) for d in df['description'].tolist()], index=df['show_id'].astype(str).tolist())
+
+
+def diff_catalogs(previous_df: pd.DataFrame, new_df: pd.DataFrame) -> CatalogDiff:
+    # Titles are matched by show_id; a different description hash means the title changed
+    previous = _description_hashes(previous_df)
+    new = _description_hashes(new_df)
+    previous = previous[~previous.index.duplicated(keep="last")]
+    new = new[~new.index.duplicated(keep="last")]
+    common = new.index.intersection(previous.index)
+    changed_mask = new.loc[common].to_numpy() != previous.loc[common].to_numpy()
+    return CatalogDiff(
+        added=new.index.difference(previous.index).tolist(),
+        changed=common[changed_mask].tolist(),
+        removed=previous.index.difference(new.index).tolist(),
+        unchanged=int((~changed_mask).sum()),
+    )
+
+
+def catalog_lineage(name: str) -> str:
+    # Exports of the same catalog share a lineage; by default it is the upload's file name
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", Path(name).stem).strip("._") or "catalog"
+
+
+def latest_catalog_key(lineage: str, snapshot_dir: str | Path = DEFAULT_SNAPSHOT_DIR) -> str | None:
+    latest = Path(snapshot_dir) / LINEAGE_DIR / lineage
+    return latest.read_text().strip() if latest.exists() else None
+
+
+def _set_latest(snapshot_dir: Path, lineage: str, key: str):
+    lineage_dir = snapshot_dir / LINEAGE_DIR
+    lineage_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = lineage_dir / f"{lineage}.tmp"
+    tmp_path.write_text(key)
+    os.replace(tmp_path, lineage_dir / lineage)
+
+
+def apply_vad_delta(previous_df: pd.DataFrame, new_df: pd.DataFrame, diff: CatalogDiff, store: VADStore, enrich: bool = True) -> int:
+    """
+    Bring the VAD store in line with the new catalog, touching only the delta.
+
+    Scores for removed titles and for the old description of changed titles are
+    discarded; added and changed titles are scored with batched VAD requests.
+
+    Returns:
+        int: number of titles newly scored.
+    """
+    previous_by_id = previous_df.drop_duplicates('show_id', keep="last").set_index('show_id')['description']
+    stale = [vad_key(show_id, previous_by_id[show_id]) for show_id in (*diff.removed, *diff.changed)]
+    store.discard(stale)
+    if not enrich:
+        return 0
+    # Imported here so the ingest path does not need the OpenAI client unless it enriches
+    from util.function_calls import score_movie_descriptions
+    todo = new_df[new_df['show_id'].isin(set(diff.added) | set(diff.changed))]
+    items = [
+        (show_id, description)
+        for show_id, description in zip(todo['show_id'].tolist(), todo['description'].tolist())
+        if store.get(show_id, description) is None
+    ]
+    scored = score_movie_descriptions(items)
+    descriptions = dict(items)
+    for show_id, movie_vad in scored.items():
+        store.put(show_id, descriptions[show_id], movie_vad)
+    store.flush()
+    return len(scored)
+
+
+def refresh_catalog(uploaded_file, snapshot_dir: str | Path = DEFAULT_SNAPSHOT_DIR, store: VADStore | None = None, enrich: bool = True,
+                    catalog_id: str | None = None) -> tuple[pd.DataFrame, CatalogDiff]:
+    """
+    Ingest a catalog export incrementally against the previous export of the same catalog.
+
+    Exports are grouped into lineages by catalog_id, or by the upload's file name when
+    none is given, so loading an unrelated catalog never diffs against this one. The new
+    file is diffed against its lineage's latest snapshot by show_id and description hash;
+    only added or changed titles are VAD-scored and removed titles are dropped from the
+    VAD store. The first ingest of a lineage has nothing to diff against, so it does not
+    pre-score the whole catalog; titles are then scored on demand per query.
+
+    Only the VAD enrichment is incremental. The filter, keyword and description vector
+    indexes are built from scratch for every export, which takes a few seconds on a large
+    catalog (mostly the vector index's SVD); a process keeps at most MAX_LOADED_CATALOGS
+    catalogs with their indexes loaded.
+
+    Returns:
+        (DataFrame, CatalogDiff): the new catalog and the change report.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    raw = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    new_key = content_hash(raw)
+    lineage = catalog_lineage(catalog_id or getattr(uploaded_file, "name", "") or "catalog")
+    previous_key = latest_catalog_key(lineage, snapshot_dir)
+    new_df = load_catalog(uploaded_file, snapshot_dir)
+
+    if previous_key == new_key:
+        diff = CatalogDiff(unchanged=len(new_df))
+    elif previous_key is None or not snapshot_exists(snapshot_dir / previous_key):
+        diff = CatalogDiff(added=new_df['show_id'].astype(str).tolist())
+    else:
+        previous_df = load_snapshot(snapshot_dir / previous_key)
+        diff = diff_catalogs(previous_df, new_df)
+        diff.enriched = apply_vad_delta(previous_df, new_df, diff, store or get_vad_store(), enrich=enrich)
+    diff.previous_key, diff.new_key = previous_key, new_key
+    _set_latest(snapshot_dir, lineage, new_key)
+    logger.info(f"Catalog refresh ({lineage}): {diff.summary()}")
+    return new_df, diff
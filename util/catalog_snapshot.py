@@ -0,0 +1,313 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from util.helper import load_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SNAPSHOT_DIR = Path(os.getenv("CATALOG_SNAPSHOT_DIR", Path(__file__).resolve().parent.parent / "data" / "snapshots"))
+MANIFEST_FILE = "manifest.json"
+# 2: string tables store byte offsets (1 stored character offsets)
+SNAPSHOT_VERSION = 2
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def file_content_hash(path: str | Path, block_bytes: int = 16 * 1024 * 1024) -> str:
+    # content_hash of a file read in blocks, for files too large to hold in memory
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_bytes):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _save_strings(directory: Path, name: str, values) -> None:
+    # String table: one concatenated UTF-8 buffer plus byte offsets and a null mask
+    series = pd.Series(values, dtype=object)
+    null = series.isna().to_numpy()
+    encoded = [s.encode("utf-8") for s in series.where(~null, "").astype(str).tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(directory / f"{name}.chars.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(directory / f"{name}.offsets.npy", offsets)
+    np.save(directory / f"{name}.null.npy", null)
+
+
+def _load_strings(directory: Path, name: str, mmap_mode) -> np.ndarray:
+    return StringTable(directory, name, mmap_mode).take(slice(None))
+
+
+class StringTable:
+    """
+    A snapshot string column read from its (memory-mapped) buffers.
+
+    Only the rows asked for are decoded, so a text column larger than memory costs
+    nothing until rows of it are displayed or scored.
+    """
+
+    def __init__(self, directory: str | Path, name: str, mmap_mode: str | None = "r"):
+        directory = Path(directory)
+        self.chars = np.load(directory / f"{name}.chars.npy", mmap_mode=mmap_mode)
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode=mmap_mode)
+        self.null = np.load(directory / f"{name}.null.npy", mmap_mode=mmap_mode)
+
+    def __len__(self) -> int:
+        return len(self.null)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.chars.nbytes + self.offsets.nbytes + self.null.nbytes)
+
+    def _bytes(self, row: int) -> bytes:
+        return self.chars[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def take(self, rows) -> np.ndarray:
+        """Decoded values (NaN for nulls) of a slice or array of row positions."""
+        if isinstance(rows, slice):
+            first, last, step = rows.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(first, last, step))
+            last = max(first, last)
+            # A contiguous block is one read of the character buffer
+            offsets = self.offsets[first:last + 1].tolist()
+            buffer = self.chars[offsets[0]:offsets[-1]].tobytes() if offsets else b""
+            base = offsets[0] if offsets else 0
+            strings = [buffer[start - base:end - base].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+            null = self.null[first:last]
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            strings = [self._bytes(row).decode("utf-8") for row in rows.tolist()]
+            null = self.null[rows]
+        values = np.empty(len(strings), dtype=object)
+        values[:] = strings
+        values[np.asarray(null, dtype=bool)] = np.nan
+        return values
+
+    def find(self, value: str) -> int:
+        # Position of value in a table written in sorted order, or -1; UTF-8 bytes sort like code points
+        target = value.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self._bytes(low) == target else -1
+
+
+class ArrayWriter:
+    """
+    A .npy file written in appended rows, for arrays whose length is only known at the
+    end. Rows go to a raw side file; close() puts the header in front.
+    """
+
+    def __init__(self, path: str | Path, dtype, row_shape: tuple[int, ...] = ()):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.length = 0
+        self._raw_path = self.path.with_name(self.path.name + ".raw")
+        self._raw = open(self._raw_path, "wb")
+
+    def append(self, values) -> None:
+        values = np.ascontiguousarray(values, dtype=self.dtype).reshape(-1, *self.row_shape)
+        values.tofile(self._raw)
+        self.length += len(values)
+
+    def close(self) -> Path:
+        self._raw.close()
+        header = {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.length, *self.row_shape)}
+        with open(self.path, "wb") as out, open(self._raw_path, "rb") as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 16 * 1024 * 1024)
+        self._raw_path.unlink()
+        return self.path
+
+
+def fill_grouped_order(key_blocks, counts: np.ndarray, order: np.ndarray) -> None:
+    """
+    Fill order with row positions grouped by key, rows ascending within a group: a
+    stable counting sort fed one block of keys at a time, so the keys never have to be
+    in memory together.
+
+    Args:
+        key_blocks: (first_row, keys) for consecutive row blocks; negative keys are left out.
+        counts: rows per key over all blocks; order must hold counts.sum() positions.
+    """
+    cursor = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    for first, keys in key_blocks:
+        keys = np.asarray(keys)
+        present = np.flatnonzero(keys >= 0)
+        keys = keys[present]
+        block_order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[block_order]
+        rank = np.arange(len(sorted_keys)) - np.searchsorted(sorted_keys, sorted_keys, side="left")
+        order[cursor[sorted_keys] + rank] = first + present[block_order]
+        cursor += np.bincount(keys, minlength=len(counts))
+
+
+class StringTableWriter:
+    """The string table layout of _save_strings, appended to in chunks."""
+
+    def __init__(self, directory: str | Path, name: str):
+        directory = Path(directory)
+        self._chars = ArrayWriter(directory / f"{name}.chars.npy", np.uint8)
+        self._offsets = ArrayWriter(directory / f"{name}.offsets.npy", np.int64)
+        self._null = ArrayWriter(directory / f"{name}.null.npy", bool)
+        self._offsets.append([0])
+
+    def append(self, values) -> None:
+        series = pd.Series(values, dtype=object)
+        null = series.isna().to_numpy()
+        encoded = [s.encode("utf-8") for s in series.where(~null, "").astype(str).tolist()]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        self._offsets.append(self._chars.length + np.cumsum(lengths))
+        self._chars.append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        self._null.append(null)
+
+    def close(self) -> None:
+        for writer in (self._chars, self._offsets, self._null):
+            writer.close()
+
+
+def replace_snapshot_dir(tmp_dir: Path, directory: Path) -> None:
+    """
+    Move a fully written snapshot from tmp_dir to directory.
+
+    An existing snapshot is renamed aside first and deleted only once the new one is in
+    place, so a reader never finds it half-deleted; files it already has open or mapped
+    stay valid. Between the two renames the path is briefly absent, which readers treat
+    as "not written yet".
+    """
+    if not directory.exists():
+        os.replace(tmp_dir, directory)
+        return
+    old_dir = directory.parent / f"{tmp_dir.name}.old"
+    os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def save_snapshot(df: pd.DataFrame, directory: str | Path) -> Path:
+    """
+    Write a typed catalog frame as a columnar binary snapshot.
+
+    Every column becomes one or more .npy files (categorical codes, numeric values,
+    datetime ticks, nullable-int values + mask, or a string table) described by
+    manifest.json. The directory is written to a temp location and moved into place
+    with replace_snapshot_dir, so readers only ever see a complete snapshot.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=".snapshot-"))
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        dtype = column.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            np.save(tmp_dir / f"{name}.codes.npy", column.cat.codes.to_numpy())
+            _save_strings(tmp_dir, f"{name}.categories", column.cat.categories.astype(str))
+            columns.append({"name": name, "kind": "category"})
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            unit = np.datetime_data(column.to_numpy().dtype)[0]
+            np.save(tmp_dir / f"{name}.npy", column.to_numpy().view("int64"))
+            columns.append({"name": name, "kind": "datetime", "unit": unit})
+        elif isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            np.save(tmp_dir / f"{name}.npy", column.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+            np.save(tmp_dir / f"{name}.mask.npy", column.isna().to_numpy())
+            columns.append({"name": name, "kind": "nullable_int", "dtype": str(dtype)})
+        elif pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+            np.save(tmp_dir / f"{name}.npy", column.to_numpy())
+            columns.append({"name": name, "kind": "numeric"})
+        else:
+            _save_strings(tmp_dir, name, column.to_numpy(dtype=object))
+            columns.append({"name": name, "kind": "string"})
+    manifest = {"version": SNAPSHOT_VERSION, "n_rows": len(df), "columns": columns}
+    (tmp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    replace_snapshot_dir(tmp_dir, directory)
+    logger.info(f"Wrote catalog snapshot to {directory}")
+    return directory
+
+
+def load_snapshot(directory: str | Path, mmap_mode: str | None = "r") -> pd.DataFrame:
+    # Numeric, datetime and code arrays are memory-mapped; only string tables are decoded
+    df, strings, columns = open_snapshot(directory, mmap_mode)
+    for name, table in strings.items():
+        df[name] = table.take(slice(None))
+    return df[columns]
+
+
+def open_snapshot(directory: str | Path, mmap_mode: str | None = "r") -> tuple[pd.DataFrame, dict[str, StringTable], list[str]]:
+    """
+    A snapshot without decoding its string columns.
+
+    Returns:
+        (DataFrame, dict, list): the typed (memory-mapped) columns, a StringTable per
+        string column, and all column names in snapshot order.
+    """
+    directory = Path(directory)
+    manifest = json.loads((directory / MANIFEST_FILE).read_text())
+    data, strings = {}, {}
+    for column in manifest["columns"]:
+        name, kind = column["name"], column["kind"]
+        if kind == "category":
+            categories = _load_strings(directory, f"{name}.categories", mmap_mode)
+            codes = np.load(directory / f"{name}.codes.npy", mmap_mode=mmap_mode)
+            data[name] = pd.Categorical.from_codes(codes, categories=categories)
+        elif kind == "datetime":
+            ticks = np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+            data[name] = ticks.view(f"datetime64[{column['unit']}]")
+        elif kind == "nullable_int":
+            values = np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+            mask = np.load(directory / f"{name}.mask.npy", mmap_mode=mmap_mode)
+            data[name] = pd.arrays.IntegerArray(np.asarray(values), np.asarray(mask))
+        elif kind == "numeric":
+            data[name] = np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+        else:
+            strings[name] = StringTable(directory, name, mmap_mode)
+    df = pd.DataFrame(data, index=pd.RangeIndex(manifest["n_rows"]), copy=False)
+    return df, strings, [column["name"] for column in manifest["columns"]]
+
+
+def snapshot_exists(directory: Path) -> bool:
+    manifest_path = directory / MANIFEST_FILE
+    if not manifest_path.exists():
+        return False
+    return json.loads(manifest_path.read_text()).get("version") == SNAPSHOT_VERSION
+
+
+def load_catalog(uploaded_file, snapshot_dir: str | Path = DEFAULT_SNAPSHOT_DIR) -> pd.DataFrame:
+    """
+    Load an uploaded catalog, converting it to a snapshot the first time its content is seen.
+
+    Later uploads of the same file (or app restarts) load the snapshot instead of parsing
+    the CSV/xlsx again. If the snapshot cannot be read the raw file is parsed as before.
+    """
+    raw = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+    directory = Path(snapshot_dir) / content_hash(raw)
+    if snapshot_exists(directory):
+        try:
+            df = load_snapshot(directory)
+            logger.info(f"Loaded catalog snapshot {directory.name}")
+            return df
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Catalog snapshot {directory.name} unreadable, parsing the raw file: {e}")
+    buffer = io.BytesIO(raw)
+    buffer.name = uploaded_file.name
+    df = load_data(buffer)
+    try:
+        save_snapshot(df, directory)
+    except OSError as e:
+        logger.warning(f"Could not write catalog snapshot: {e}")
+    return df
@@ -1,68 +1,84 @@
+import numpy as np
 import pandas as pd
-import streamlit as st
+from util.catalog_index import CatalogIndex
 
-def manually_filter_movies() -> pd.DataFrame:
-    movie_df = st.session_state['movie_dataframe']
-    llm_genre = st.session_state['movie_criteria']['llm_genre']['genre']
-    genre_obj = st.session_state['movie_criteria']['llm_genre']
-    viewing_type = st.session_state['movie_criteria']['viewing_type']
+# Audience category -> catalog rating, per viewing type
+MOVIE_AUDIENCE_RATINGS = {"CHILDREN": "G", "TEEN": "PG-13", "ADULT": "R"}
+TV_AUDIENCE_RATINGS = {"CHILDREN": "TV-Y7", "TEEN": "TV-14", "ADULT": "TV-MA"}
+
+def filter_catalog(catalog_index: CatalogIndex, movie_criteria: dict) -> np.ndarray | dict:
+    """
+    Apply the genre, viewing type, audience category and numeric range criteria as mask ANDs.
+
+    Returns:
+        np.ndarray: positions of the matching catalog rows, or a {"message": ...} dict
+        naming the criterion that left nothing to recommend.
+    """
+    llm_genre = (movie_criteria['llm_genre'] or {}).get('genre')
+    viewing_type = movie_criteria['viewing_type'] or []
+    mask = catalog_index.all_rows()
     if llm_genre:
-        genre_filtered_movie_df = movie_df[movie_df['genre'].str.contains(llm_genre)]
-        if genre_filtered_movie_df.empty:
+        mask &= catalog_index.genre_mask(llm_genre)
+        if not mask.any():
             return {"message": f"Unable to filter on {llm_genre}. Please modify your request with this in mind"}
-    genre_view_type_filtered_movie_df = filter_view_type(genre_filtered_movie_df)
-    if genre_view_type_filtered_movie_df.empty:
+    mask = filter_view_type(catalog_index, mask, viewing_type)
+    if not mask.any():
         return {"message": f"Unable to filter on {viewing_type}. Please modify your request with this in mind"}
-    genre_view_type_audience_category_movie_df = filter_audience_category(genre_view_type_filtered_movie_df)
-    print(f"genre_view_type_audience_category_movie_df: {genre_view_type_audience_category_movie_df}")
-    if genre_view_type_audience_category_movie_df.empty:
+    mask = filter_audience_category(catalog_index, mask, viewing_type, movie_criteria['audience_category'])
+    if not mask.any():
         return {"message": f"Unable to filter on {viewing_type}. Please modify your request with this in mind"}
-    return genre_view_type_audience_category_movie_df
+    numeric = movie_criteria.get('numeric')
+    mask = filter_numeric_constraints(catalog_index, mask, numeric)
+    if not mask.any():
+        limits = ", ".join(f"{name}={value}" for name, value in numeric.items() if value is not None)
+        return {"message": f"Unable to filter on {limits}. Please modify your request with this in mind"}
+    return np.flatnonzero(mask)
+
+def filter_view_type(catalog_index: CatalogIndex, mask: np.ndarray, view_type_lst: list[str]) -> np.ndarray:
+    if not view_type_lst:
+        return mask
+    return mask & catalog_index.type_mask(view_type_lst)
+
+def filter_audience_category(catalog_index: CatalogIndex, mask: np.ndarray, view_type_lst: list[str], audience_category: dict) -> np.ndarray:
+    category = (audience_category or {}).get("category")
+    if not category:
+        return mask
+    ratings = MOVIE_AUDIENCE_RATINGS if view_type_lst and view_type_lst[0] == "Movie" else TV_AUDIENCE_RATINGS
+    if category not in ratings:
+        return mask
+    return mask & catalog_index.rating_mask([ratings[category]])
+
+def numeric_ranges(catalog_index: CatalogIndex, numeric: dict) -> list[tuple[str, float | None, float | None]]:
+    """
+    (column, low, high) ranges for an ExtractNumericConstraints dump.
 
-def filter_view_type(genre_filtered_movie_df: pd.DataFrame) -> pd.DataFrame:
-    view_type_lst = st.session_state['movie_criteria']['viewing_type']
-    new_view_type_lst = split_list(view_type_lst)
-    if len(new_view_type_lst) > 1:
-        view_type_movie_df = genre_filtered_movie_df[genre_filtered_movie_df['type'].apply(lambda lst: any(item in lst for item in new_view_type_lst))]
-        return view_type_movie_df
-    # It's not capturing 'Mystery' because in the df it's listed as 'Mysteries'
-    view_type_movie_df = genre_filtered_movie_df[genre_filtered_movie_df['type'].apply(lambda lst: any(item in lst for item in view_type_lst))]
-    return view_type_movie_df
+    "Last N years" counts back from the newest title in the catalog rather than from
+    today, so an older export still has something to call recent.
+    """
+    ranges = []
+    if numeric.get('min_duration_minutes') is not None or numeric.get('max_duration_minutes') is not None:
+        ranges.append(("duration_minutes", numeric.get('min_duration_minutes'), numeric.get('max_duration_minutes')))
+    if numeric.get('min_seasons') is not None or numeric.get('max_seasons') is not None:
+        ranges.append(("seasons", numeric.get('min_seasons'), numeric.get('max_seasons')))
+    min_year, max_year = numeric.get('min_release_year'), numeric.get('max_release_year')
+    latest_year = catalog_index.latest("release_year")
+    if numeric.get('released_within_years') and latest_year is not None:
+        within = latest_year - numeric['released_within_years'] + 1
+        min_year = within if min_year is None else max(min_year, within)
+    if min_year is not None or max_year is not None:
+        ranges.append(("release_year", min_year, max_year))
+    latest_added = catalog_index.latest("date_added")
+    if numeric.get('added_within_years') and latest_added is not None:
+        ranges.append(("date_added", latest_added - numeric['added_within_years'] * 365.25, None))
+    return ranges
+
+def filter_numeric_constraints(catalog_index: CatalogIndex, mask: np.ndarray, numeric: dict | None) -> np.ndarray:
+    if not numeric:
+        return mask
+    for column, low, high in numeric_ranges(catalog_index, numeric):
+        mask = mask & catalog_index.range_mask(column, low, high)
+    return mask
 
-def filter_audience_category(df):
-    print(f"st.session_state.movie_criteria['audience_category']: {st.session_state.movie_criteria['viewing_type'][0]}")
-    if st.session_state.movie_criteria['viewing_type'][0] == "Movie":
-        if st.session_state.movie_criteria["audience_category"]:
-            audience_category = st.session_state.movie_criteria["audience_category"]["category"]
-        if audience_category == "CHILDREN":
-            print(f"CHILDREN - audience_category: {audience_category}")
-            rating = "G"
-            audience_category_df  = df[df['rating'] == rating]
-            return audience_category_df
-        if audience_category == "TEEN":
-            print(f"TEEN - audience_category: {audience_category}")
-            rating = "PG-13"
-            audience_category_df  = df[df['rating'] == rating]
-            return audience_category_df
-        if audience_category == "ADULT":
-            print(f"ADULT - audience_category: {audience_category}")
-            rating = "R"
-            audience_category_df  = df[df['rating'] == rating]
-            return audience_category_df
-    if st.session_state.movie_criteria["audience_category"]:
-            audience_category = st.session_state.movie_criteria["audience_category"]["category"]
-            if audience_category == "CHILDREN":
-                rating = "TV-Y7"
-                audience_category_df  = df[df['rating'] == rating ]
-                return audience_category_df
-            if audience_category == "TEEN":
-                rating = "TV-14"
-                audience_category_df  = df[df['rating'] == rating]
-                return audience_category_df
-            if audience_category == "ADULT":
-                rating = "TV-MA"
-                audience_category_df  = df[df['rating'] == rating]
-                return audience_category_df
 def split_list(lst: list[str]) -> list[str]:
     output_lst: list[str] = []
     for element in lst:
@@ -72,7 +88,3 @@ def split_list(lst: list[str]) -> list[str]:
         else:
             output_lst.append(element)
     return output_lst
-
-
-
-
@@ -0,0 +1,146 @@
+import logging
+from dataclasses import dataclass, field, fields, asdict
+from util.catalog import Catalog
+from util.data_filter import filter_catalog
+from util.function_calls import MAX_LIVE_VAD_SCORES
+from util.pipeline import stream_ranked_titles
+from util.query_extraction import extract_query_criteria
+from util.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Below this the audience category is too uncertain to filter on
+MIN_AUDIENCE_CONFIDENCE = 0.6
+RESULT_COLUMNS = ['show_id', 'title', 'type', 'rating', 'release_year', 'duration', 'genre', 'description']
+
+
+@dataclass(frozen=True)
+class RecommendOptions:
+    k: int = 10
+    # Criteria extraction mode, "parallel" or "combined"; None uses CRITERIA_EXTRACTION_MODE
+    mode: str | None = None
+    max_live: int = MAX_LIVE_VAD_SCORES
+    min_audience_confidence: float = MIN_AUDIENCE_CONFIDENCE
+
+    @classmethod
+    def from_dict(cls, values: dict | None) -> "RecommendOptions":
+        values = dict(values or {})
+        unknown = set(values) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown options: {sorted(unknown)}")
+        options = cls(**values)
+        if options.k < 1 or options.max_live < 0:
+            raise ValueError("k must be at least 1 and max_live at least 0")
+        if options.mode not in (None, "parallel", "combined"):
+            raise ValueError(f"Unknown extraction mode {options.mode!r}")
+        return options
+
+
+@dataclass
+class Recommendation:
+    """
+    Everything one query produced: the extracted criteria, how many titles passed the
+    filters and the ranked titles, best first. message says why there are no results
+    when the query could not be answered; notes carry non-fatal extraction problems.
+    """
+    query: str
+    criteria: dict = field(default_factory=dict)
+    matched: int = 0
+    results: list[dict] = field(default_factory=list)
+    message: str | None = None
+    notes: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def movie_criteria_from(criteria: dict) -> tuple[dict, list[str]]:
+    """
+    The filter/ranking criteria dict (the shape filter_catalog takes) from extracted
+    criteria, plus a note for every extractor that came back empty.
+    """
+    notes = []
+    genre, viewing_type, audience, vad = (criteria.get(name) for name in ("genre", "viewing_type", "audience_category", "VAD"))
+    numeric = criteria.get("numeric")
+    if not genre:
+        notes.append("No genre found in your query.")
+    if not viewing_type:
+        notes.append("No viewing type found in your query.")
+    if not vad:
+        notes.append("No VAD found in your query.")
+    movie_criteria = {
+        "llm_genre": genre.model_dump() if genre else {},
+        "viewing_type": viewing_type.viewing_type if viewing_type else None,
+        "audience_category": audience.model_dump() if audience else {},
+        "VAD": vad.vad.model_dump() if vad else {},
+        # Query cache entries written before numeric limits existed have none
+        "numeric": numeric.model_dump() if numeric else None,
+    }
+    return movie_criteria, notes
+
+
+def ranked_results(catalog: Catalog, ranked: list[tuple[int, float]]) -> list[dict]:
+    rows = [row for row, _ in ranked]
+    frame = catalog.rows(rows)[[column for column in RESULT_COLUMNS if column in catalog.columns]]
+    # Plain JSON values: categories and nullable ints become objects, missing values None
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [
+        {"row": int(row), "score": round(float(score), 4), **record}
+        for (row, score), record in zip(ranked, frame.to_dict("records"))
+    ]
+
+
+def iter_recommend(query: str, catalog: Catalog, options: RecommendOptions | None = None):
+    """
+    recommend() as a generator: yields the Recommendation once the criteria are
+    extracted and the catalog filtered, then again after every ranking update.
+
+    The same Recommendation object is updated in place between yields.
+    """
+    options = options or RecommendOptions()
+    recommendation = Recommendation(query=query)
+    criteria = extract_query_criteria(query, mode=options.mode)
+    movie_criteria, recommendation.notes = movie_criteria_from(criteria)
+    recommendation.criteria = movie_criteria
+    audience = criteria.get("audience_category")
+    if not audience:
+        recommendation.message = "Unable to extract category. Please, try again"
+    elif audience.confidence < options.min_audience_confidence:
+        recommendation.message = f"Unable to extract category, due to {audience.rationale}. Please, try again with this in mind"
+    elif not movie_criteria["VAD"]:
+        recommendation.message = "Unable to estimate the mood of your query. Please, try again"
+    if recommendation.message:
+        yield recommendation
+        return
+
+    with span("filter") as filter_span:
+        rows = filter_catalog(catalog.index, movie_criteria)
+        filter_span.set(matched=0 if isinstance(rows, dict) else len(rows))
+    if isinstance(rows, dict):
+        recommendation.message = rows["message"]
+        yield recommendation
+        return
+    recommendation.matched = len(rows)
+    yield recommendation
+
+    ranked = []
+    for ranked in stream_ranked_titles(catalog, rows, movie_criteria["VAD"], k=options.k, max_live=options.max_live, query=query):
+        recommendation.results = ranked_results(catalog, ranked)
+        yield recommendation
+    if not ranked:
+        recommendation.message = "None of the matching titles could be scored. Please try again."
+        yield recommendation
+
+
+def recommend(query: str, catalog: Catalog, options: RecommendOptions | None = None) -> Recommendation:
+    """
+    Extract criteria from a free-text query, filter the catalog and rank the matches by
+    VAD similarity.
+
+    Pure with respect to its inputs: nothing is read from or written to Streamlit state,
+    and the shared catalog is only read, so any number of threads can call it at once.
+    """
+    recommendation = None
+    for recommendation in iter_recommend(query, catalog, options):
+        pass
+    return recommendation
@@ -1,21 +1,32 @@
 import os
 import logging
 import json
-import streamlit as st
-from models.models import ExtractDescription,ExtractVAD, ExtractMovieVAD, ExtractViewingType, ExtractAudienceCategory
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI()
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import APIError
+from pydantic import ValidationError
+from models.models import ExtractDescription,ExtractVAD, ExtractMovieVAD, ExtractViewingType, ExtractAudienceCategory, MovieVAD, ExtractMovieVADBatch, LexiconVAD, ExtractNumericConstraints
+from util.openai_client import get_client, CONCURRENT_REQUESTS, REQUEST_FAN_OUT
+from util.vad_store import get_vad_store
+from util.llm_cache import cached_parse, get_llm_cache
+from util.tracing import span, submit
+from util.query_rules import apply_rule, resolve_viewing_type, resolve_audience_category, resolve_numeric_constraints
+from util.vad_lexicon import get_vad_lexicon
+from util.vad_calculation import vad_similarity_matrix
+
+client = get_client()
 model = "o4-mini"
-
-if not openai_api_key:
-    raise RuntimeError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
-else:
-    # (optionally mask most of it in logs)
-    print(f"✅ OPENAI_API_KEY loaded: {openai_api_key[:4]}…")
+# Titles missing from the VAD store that may be scored live in a single query
+MAX_LIVE_VAD_SCORES = int(os.getenv("MAX_LIVE_VAD_SCORES", "40"))
+# Descriptions per batched VAD request, and a cap on their combined length (~4 chars per token)
+VAD_BATCH_SIZE = int(os.getenv("VAD_BATCH_SIZE", "20"))
+VAD_BATCH_MAX_CHARS = int(os.getenv("VAD_BATCH_MAX_CHARS", "12000"))
+# Shared by every request; threads are only started when there is work for them
+_scoring_executor = ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS * REQUEST_FAN_OUT, thread_name_prefix="vad-batch")
+# "llm" scores catalog titles with o4-mini, "lexicon" scores them locally (offline, no API cost)
+VAD_SCORER = os.getenv("VAD_SCORER", "llm")
+# Give up on the query VAD call after this long and use the lexicon estimate instead
+VAD_FALLBACK_TIMEOUT_SECONDS = float(os.getenv("VAD_FALLBACK_TIMEOUT_SECONDS", "30"))
 
 # Set up logging configuration
 logging.basicConfig(
@@ -64,6 +75,8 @@ SYSTEM_PROMPT = """
     - miniseries/mini-series/limited series/limited → "Miniseries"
 """.strip()
 
+get_llm_cache().register_prompt("viewing_type", SYSTEM_PROMPT)
+
 def build_messages(request_text: str):
     return (
         [{"role": "system", "content": SYSTEM_PROMPT}]
@@ -72,21 +85,24 @@ def build_messages(request_text: str):
     )
 
 def extract_viewing_type_from_request(request: dict) -> ExtractViewingType:
+    # Unambiguous type words are resolved locally; the LLM only sees the rest
+    rule_result = apply_rule("viewing_type", resolve_viewing_type, request)
+    if rule_result is not None:
+        return rule_result
     logger.info(f"Extracting genre from request: {request}")
     message = build_messages(str(request))
     logger.info("Generating confirmation message")
-    viewing_type_extraction = client.beta.chat.completions.parse(
+    viewing_type_result = cached_parse(
+        client,
+        namespace="viewing_type",
         model=model,
         messages = message,
         response_format=ExtractViewingType
         )
-    
-    viewing_type_result = viewing_type_extraction.choices[0].message.parsed
     logger.info(f"Confirmation message generated successfully: {viewing_type_result}")
     return viewing_type_result
 
-def build_audience_category_messages(request_text: str):
-   cat_system_prompt = """
+AUDIENCE_CATEGORY_SYSTEM_PROMPT = """
         You classify the intended audience category for a movie/TV request.
 
         Return JSON only in this exact schema:
@@ -104,7 +120,10 @@ def build_audience_category_messages(request_text: str):
         - If unclear, return {"category":"","confidence":0.0,"rationale":"insufficient cues"}.
         - Keep rationale concise (<=12 words). Confidence to two decimals. No extra keys.
 """.strip()
-   
+
+get_llm_cache().register_prompt("audience_category", AUDIENCE_CATEGORY_SYSTEM_PROMPT)
+
+def build_audience_category_messages(request_text: str):
    cat_few_shots = [
        # CHILDREN
         {"role":"user","content":"Animated TV show for my 6-year-old—gentle, no scares."},
@@ -145,30 +164,77 @@ def build_audience_category_messages(request_text: str):
         {"role":"assistant","content": json.dumps({"category":"","confidence":0.0,"rationale":"insufficient cues"})},
    ]
 
-   return [{"role": "system", "content": cat_system_prompt}] + cat_few_shots + [
+   return [{"role": "system", "content": AUDIENCE_CATEGORY_SYSTEM_PROMPT}] + cat_few_shots + [
         {"role": "user", "content": request_text}
     ]
   
 def extract_audience_category_from_request(request: dict) -> ExtractAudienceCategory:
+    rule_result = apply_rule("audience_category", resolve_audience_category, request)
+    if rule_result is not None:
+        return rule_result
     logger.info(f"Extracting rating from request: {request}")
 
     message = build_audience_category_messages(str(request))
 
-    rating_extraction = client.beta.chat.completions.parse(
+    rating_result = cached_parse(
+        client,
+        namespace="audience_category",
         model=model,
         messages = message,
         response_format=ExtractAudienceCategory
         )
-    
-    msg = rating_extraction.choices[0].message
-    llm_raw_response = msg.content
-
-    logger.debug(f"RAW assistant: \n%s {llm_raw_response}")
-    
-    rating_result = rating_extraction.choices[0].message.parsed
     logger.info(f"Confirmation message generated successfully: {rating_result}")
     return rating_result
 
+NUMERIC_SYSTEM_PROMPT = """
+        You extract numeric limits on runtime, seasons and dates from a movie/TV request.
+
+        Return only what the response schema expects. Leave a field null unless the request states that limit.
+
+        Rules:
+        - Runtime is for movies, in minutes: "under 2 hours" → max_duration_minutes 120; "around 90 minutes" → 75 to 105.
+        - Seasons are for TV: "a single season" → min_seasons 1 and max_seasons 1; "no more than 3 seasons" → max_seasons 3.
+        - Release dates: "from the 1990s" → min_release_year 1990, max_release_year 1999; "before 2000" → max_release_year 1999.
+        - "from the last 5 years" → released_within_years 5; "recent" alone → released_within_years 3.
+        - "recently added" / "new on the service" → added_within_years 1.
+        - The period a story is set in ("set in the 1970s") is not a release date.
+        - Episode counts and episode lengths are not available; ignore them.
+""".strip()
+
+get_llm_cache().register_prompt("numeric_constraints", NUMERIC_SYSTEM_PROMPT)
+
+numeric_few_shots = [
+    {"role": "user", "content": "A smart thriller movie with minimal gore—under 2 hours."},
+    {"role": "assistant", "content": json.dumps({"max_duration_minutes": 120})},
+
+    {"role": "user", "content": "Gritty crime drama set in the 1970s, something recent."},
+    {"role": "assistant", "content": json.dumps({"released_within_years": 3})},
+
+    {"role": "user", "content": "A classic 80s comedy, nothing longer than 100 minutes."},
+    {"role": "assistant", "content": json.dumps({"min_release_year": 1980, "max_release_year": 1989, "max_duration_minutes": 100})},
+
+    {"role": "user", "content": "A cozy TV series with gentle humor, episodes around 25 minutes."},
+    {"role": "assistant", "content": json.dumps({})},
+]
+
+def extract_numeric_constraints_from_request(request: dict) -> ExtractNumericConstraints:
+    # Explicit phrasing ("under 2 hours", "last 5 years") and requests without numbers never reach the LLM
+    rule_result = apply_rule("numeric", resolve_numeric_constraints, request)
+    if rule_result is not None:
+        return rule_result
+    logger.info(f"Extracting numeric constraints from request: {request}")
+    numeric_result = cached_parse(
+        client,
+        namespace="numeric_constraints",
+        model=model,
+        messages=[{"role": "system", "content": NUMERIC_SYSTEM_PROMPT}] + numeric_few_shots + [
+            {"role": "user", "content": str(request)}
+        ],
+        response_format=ExtractNumericConstraints,
+    )
+    logger.info(f"Confirmation message generated successfully: {numeric_result}")
+    return numeric_result
+
 def extract_description_from_request(request: dict) -> ExtractDescription:
     logger.info(f"Extracting description from request: {request}")
     """
@@ -181,7 +247,9 @@ def extract_description_from_request(request: dict) -> ExtractDescription:
     """
     logger.info("Generating confirmation message")
 
-    description_extraction = client.beta.chat.completions.parse(
+    description_result = cached_parse(
+        client,
+        namespace="description",
         model=model,
         messages=[
             {
@@ -234,10 +302,17 @@ def extract_description_from_request(request: dict) -> ExtractDescription:
             ],
             response_format=ExtractDescription,
         )
-    description_result = description_extraction.choices[0].message.parsed
     logger.info(f"Confirmation message generated successfully: {description_result}")
     return description_result
 
+VAD_SYSTEM_PROMPT = (
+    "You estimate Valence–Arousal–Dominance (VAD) for a short text about movie/TV preferences or synopses. "
+    "Definitions: Valence (unpleasant→pleasant), Arousal (calm→intense), Dominance (powerless→in-control). "
+    "All values must be in [0,1]. Return only what the response schema expects."
+)
+
+get_llm_cache().register_prompt("vad", VAD_SYSTEM_PROMPT)
+
 def extract_VAD_from_request(request: dict) -> ExtractVAD:
     logger.info(f"Extracting VAD from request: {request}")
     """
@@ -261,17 +336,28 @@ def extract_VAD_from_request(request: dict) -> ExtractVAD:
     """
     logger.info("Generating confirmation message")
 
-    description_extraction = client.beta.chat.completions.parse(
+    try:
+        VAD_result = _parse_query_vad(request)
+    except APIError as e:
+        # Slow or unavailable API: estimate locally rather than leave the query without a VAD
+        logger.warning(f"VAD extraction failed, using the lexicon estimate: {e}")
+        with span("vad.lexicon_fallback"):
+            return LexiconVAD(vad=get_vad_lexicon().estimate_vad(request.get("query", "") if isinstance(request, dict) else str(request)))
+    logger.info(f"Confirmation message generated successfully: {VAD_result}")
+    return VAD_result
+
+
+def _parse_query_vad(request: dict) -> ExtractVAD:
+    return cached_parse(
+        # One bounded attempt: the lexicon fallback is cheaper than retrying a slow call
+        client.with_options(timeout=VAD_FALLBACK_TIMEOUT_SECONDS, max_retries=0),
+        namespace="vad",
         model=model,
         seed=7,
         messages = [
             {
                 "role": "system",
-                "content": (
-                    "You estimate Valence–Arousal–Dominance (VAD) for a short text about movie/TV preferences or synopses. "
-                    "Definitions: Valence (unpleasant→pleasant), Arousal (calm→intense), Dominance (powerless→in-control). "
-                    "All values must be in [0,1]. Return only what the response schema expects."
-                ),
+                "content": VAD_SYSTEM_PROMPT,
             },
             # Few-shots (user → assistant). The assistant replies match your schema but you can keep them concise:
             {
@@ -289,9 +375,6 @@ def extract_VAD_from_request(request: dict) -> ExtractVAD:
         ],
             response_format=ExtractVAD,
         )
-    VAD_result = description_extraction.choices[0].message.parsed
-    logger.info(f"Confirmation message generated successfully: {VAD_result}")
-    return VAD_result
 
 
 MOVIE_VAD_SYSTEM_PROMPT = """
@@ -323,6 +406,8 @@ movie_vad_few_shots = [
             {"role": "assistant", "content": '{"vad":{"valence":0.20,"arousal":0.55,"dominance":0.30},"rationale":"Low mood, mid arousal, low control."}'},         
 ]
 
+get_llm_cache().register_prompt("movie_vad", MOVIE_VAD_SYSTEM_PROMPT)
+
 def build_movie_vad_prompt(movie_description: str):
      return (
         [{"role": "system", "content": MOVIE_VAD_SYSTEM_PROMPT}]
@@ -330,30 +415,174 @@ def build_movie_vad_prompt(movie_description: str):
         + [{"role": "user", "content": movie_description}]  # <-- real input goes here
     )
 
-def extract_movie_vad_score() -> ExtractMovieVAD:
-    filtered_df = st.session_state['filtered_df'].iloc[:3]
-    movie_vad_score_obj = {}
-    for index, row in filtered_df.iterrows():
-        movie_description = row['description']
-        movie_id = row['show_id']
-        movie_vad_score = client.beta.chat.completions.parse(
-            model=model,
-            seed=7,
-            messages=build_movie_vad_prompt(movie_description),
-            response_format=ExtractMovieVAD,
-        )
-        movie_VAD_result = movie_vad_score.choices[0].message.parsed
-        logger.info(f"Confirmation message generated successfully: {movie_VAD_result}")
-        if movie_VAD_result:
-            print(f"movie_VAD_result: {movie_VAD_result.movie_vad}")
-            print(f"st.session_state.movie_criteria:{ st.session_state.movie_criteria}")
-            movie_vad_score_obj = {
-                "valence": movie_VAD_result.movie_vad.valence,
-                "arousal": movie_VAD_result.movie_vad.arousal,
-                "dominance": movie_VAD_result.movie_vad.dominance,
-                "movie_id": movie_id
-            }
-            st.session_state.movie_criteria["movie_VAD"].append(movie_vad_score_obj)
-    movie_VAD_lst = st.session_state.movie_criteria["movie_VAD"]
-    return movie_VAD_lst
-    
+def score_movie_description(movie_description: str) -> ExtractMovieVAD:
+    movie_VAD_result = cached_parse(
+        client,
+        namespace="movie_vad",
+        model=model,
+        seed=7,
+        messages=build_movie_vad_prompt(movie_description),
+        response_format=ExtractMovieVAD,
+    )
+    logger.info(f"Confirmation message generated successfully: {movie_VAD_result}")
+    return movie_VAD_result
+
+MOVIE_VAD_BATCH_SYSTEM_PROMPT = """
+    You estimate Valence–Arousal–Dominance (VAD) for several movie/TV descriptions at once.
+
+    Input: a JSON list of {"show_id": "...", "description": "..."}.
+    Output JSON only: {"movie_vads": [{"show_id": "...", "valence": 0.0-1.0, "arousal": 0.0-1.0, "dominance": 0.0-1.0}, ...]}
+
+    Guidelines:
+    - Score every input item exactly once and copy its show_id unchanged.
+    - Valence: unpleasant/sad=0.0 → pleasant/joyful=1.0
+    - Arousal: calm/slow=0.0 → intense/exciting=1.0
+    - Dominance: powerless/hemmed-in=0.0 → in-control/empowered=1.0
+    - Score each description on its own; do not compare items. No extra keys.
+""".strip()
+
+movie_vad_batch_few_shots = [
+    {"role": "user", "content": json.dumps([
+        {"show_id": "x1", "description": "Something light and cozy about friendship, low stakes, gentle humor."},
+        {"show_id": "x2", "description": "Bleak, slow-burn mystery that feels suffocating."},
+    ])},
+    {"role": "assistant", "content": json.dumps({"movie_vads": [
+        {"show_id": "x1", "valence": 0.80, "arousal": 0.30, "dominance": 0.50},
+        {"show_id": "x2", "valence": 0.20, "arousal": 0.55, "dominance": 0.30},
+    ]})},
+]
+
+get_llm_cache().register_prompt("movie_vad_batch", MOVIE_VAD_BATCH_SYSTEM_PROMPT)
+
+def build_movie_vad_batch_prompt(batch: list[tuple[str, str]]):
+    return (
+        [{"role": "system", "content": MOVIE_VAD_BATCH_SYSTEM_PROMPT}]
+        + movie_vad_batch_few_shots
+        + [{"role": "user", "content": json.dumps([{"show_id": show_id, "description": description} for show_id, description in batch])}]
+    )
+
+def _vad_batches(items: list[tuple[str, str]], batch_size: int, max_chars: int):
+    # Split by item count and by description length so one batch stays inside the context budget
+    batch, batch_chars = [], 0
+    for show_id, description in items:
+        item_chars = len(show_id) + len(description)
+        if batch and (len(batch) >= batch_size or batch_chars + item_chars > max_chars):
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append((show_id, description))
+        batch_chars += item_chars
+    if batch:
+        yield batch
+
+def score_movie_descriptions(items: list[tuple[str, str]], batch_size: int = VAD_BATCH_SIZE, max_chars: int = VAD_BATCH_MAX_CHARS, max_rounds: int = 3) -> dict[str, MovieVAD]:
+    """
+    Score many (show_id, description) pairs with batched VAD requests.
+
+    Each returned item is validated on its own; titles that are missing, duplicated or
+    out of range are re-queued for the next round instead of failing the whole batch.
+
+    Returns:
+        dict: show_id -> MovieVAD for every title that was scored successfully.
+    """
+    results: dict[str, MovieVAD] = {}
+    pending = list(items)
+    for round_number in range(max_rounds):
+        failed = []
+        for batch in _vad_batches(pending, batch_size, max_chars):
+            try:
+                batch_result = cached_parse(
+                    client,
+                    namespace="movie_vad_batch",
+                    model=model,
+                    # A new seed per round so a retried batch is not answered from the cache
+                    seed=7 + round_number,
+                    messages=build_movie_vad_batch_prompt(batch),
+                    response_format=ExtractMovieVADBatch,
+                )
+            except (ValidationError, APIError) as e:
+                logger.warning(f"VAD batch of {len(batch)} failed: {e}")
+                failed.extend(batch)
+                continue
+            returned, duplicated = {}, set()
+            for item in (batch_result.movie_vads if batch_result else []):
+                if item.show_id in returned:
+                    duplicated.add(item.show_id)
+                returned[item.show_id] = item
+            for show_id, description in batch:
+                # A title answered twice is ambiguous, so it is asked again rather than guessed
+                item = returned.get(show_id) if show_id not in duplicated else None
+                try:
+                    results[show_id] = MovieVAD(valence=item.valence, arousal=item.arousal, dominance=item.dominance)
+                except (ValidationError, AttributeError):
+                    failed.append((show_id, description))
+        logger.info(f"VAD batch round {round_number + 1}: {len(pending) - len(failed)}/{len(pending)} titles scored")
+        pending = failed
+        if not pending:
+            break
+    return results
+
+def iter_movie_vad_scores(show_ids: list[str], descriptions: list[str], max_live: int = MAX_LIVE_VAD_SCORES, first_batch_size: int = 1, user_vad=None):
+    """
+    Stream VAD scores for the given titles as soon as each one is available.
+
+    Store hits come out first in one chunk. Misses (up to max_live) are scored in
+    concurrent batches and yielded batch by batch; the first batch is kept tiny so the
+    first live score arrives after a single short request.
+
+    With user_vad, the lexicon estimate picks which misses get the max_live LLM
+    scores (closest to the user first). Titles whose LLM batch fails are yielded with
+    their lexicon estimate instead; those estimates are not written to the store.
+    With VAD_SCORER=lexicon every miss is scored locally and no request is made.
+
+    Yields:
+        (positions, vad): int positions into show_ids and their (len, 3) float32 VAD rows.
+    """
+    store = get_vad_store()
+    with span("vad_store.lookup", titles=len(show_ids)) as lookup_span:
+        vad_matrix, found = store.lookup(show_ids, descriptions)
+        lookup_span.set(hits=int(found.sum()))
+    logger.info(f"VAD store hits: {int(found.sum())}/{len(found)}")
+    if found.any():
+        hits = np.flatnonzero(found)
+        yield hits, vad_matrix[hits]
+    misses = np.flatnonzero(~found)
+    if not len(misses):
+        return
+    lexicon = get_vad_lexicon()
+    if VAD_SCORER == "lexicon":
+        with span("vad.lexicon", titles=len(misses)):
+            estimates, _ = lexicon.score_texts(descriptions[i] for i in misses)
+        yield misses, estimates
+        return
+    if user_vad is not None and len(misses) > max_live:
+        with span("vad.lexicon_prefilter", titles=len(misses), kept=max_live):
+            estimates, _ = lexicon.score_texts(descriptions[i] for i in misses)
+            closeness = vad_similarity_matrix(user_vad, estimates)
+            misses = misses[np.argsort(-closeness, kind="stable")]
+    misses = misses[:max_live].tolist()
+    batches = [misses[:first_batch_size]] + [
+        misses[i:i + VAD_BATCH_SIZE] for i in range(first_batch_size, len(misses), VAD_BATCH_SIZE)
+    ]
+    futures = {
+        submit(_scoring_executor, score_movie_descriptions, [(show_ids[i], descriptions[i]) for i in batch]): batch
+        for batch in batches if batch
+    }
+    try:
+        for future in as_completed(futures):
+            try:
+                scored = future.result()
+            except Exception as e:
+                logger.warning(f"VAD batch of {len(futures[future])} failed: {e}")
+                scored = {}
+            positions = [i for i in futures[future] if show_ids[i] in scored]
+            unscored = [i for i in futures[future] if show_ids[i] not in scored]
+            if positions:
+                vad = np.array([[scored[show_ids[i]].valence, scored[show_ids[i]].arousal, scored[show_ids[i]].dominance] for i in positions], dtype=np.float32)
+                for i, movie_vad in zip(positions, vad):
+                    store.put(show_ids[i], descriptions[i], movie_vad)
+                yield np.array(positions), vad
+            if unscored:
+                estimates, _ = lexicon.score_texts(descriptions[i] for i in unscored)
+                yield np.array(unscored), estimates
+    finally:
+        store.flush()
@@ -1,21 +1,12 @@
-import os
 import logging
 import json
 from models.models import ExtractGenre, ExtractDescription,ExtractVAD, ExtractViewingType, ExtractAudienceCategory
-from openai import OpenAI
-from dotenv import load_dotenv
+from util.openai_client import get_client
+from util.llm_cache import cached_parse, get_llm_cache
 
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI()
+client = get_client()
 model = "o4-mini"
 
-if not openai_api_key:
-    raise RuntimeError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
-else:
-    # (optionally mask most of it in logs)
-    print(f"✅ OPENAI_API_KEY loaded: {openai_api_key[:4]}…")
-
 # Set up logging configuration
 logging.basicConfig(
     level=logging.INFO,
@@ -147,6 +138,8 @@ GENRE_SYSTEM_PROMPT = f"""
     - No extra keys, no commentary, output must be valid JSON.
     """.strip()
 
+get_llm_cache().register_prompt("genre", GENRE_SYSTEM_PROMPT)
+
 def build_genre_messages(request_text: str):
     return (
         [{"role": "system", "content": GENRE_SYSTEM_PROMPT}]
@@ -168,11 +161,12 @@ def extract_genre_from_request(request: dict) -> ExtractGenre:
     """Third LLM call to generate a confirmation message"""
     logger.info("Generating confirmation message")
 
-    genre_extraction = client.beta.chat.completions.parse(
+    genre_result = cached_parse(
+        client,
+        namespace="genre",
         model=model,
         messages=message,
             response_format=ExtractGenre,
         )
-    genre_result = genre_extraction.choices[0].message.parsed
     logger.info(f"Confirmation message generated successfully: {genre_result}")
     return genre_result
\ No newline at end of file
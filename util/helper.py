@@ -1,25 +1,46 @@
-import pandas as pd 
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Few distinct values per column, so categorical codes are far smaller than repeated strings
+CATEGORICAL_COLUMNS = ["type", "rating", "country", "duration"]
 
 def load_data(uploaded_file):
     if uploaded_file.name.endswith(".csv"):
         df = pd.read_csv(uploaded_file)
-        columns = {
-            "type": df["type"],
-            "title": df["title"],
-            "director": df["director"],
-            "cast": df["cast"].tolist(),
-            "country": df["country"],
-            "date_added": df["date_added"],
-            "release_year": df["release_year"],
-            "rating": df["rating"],
-            "duration": df["duration"],
-            "genre": df["listed_in"].tolist(),
-            "description": df["description"]
-        }
-        df_renamed = df.rename(columns={"listed_in": "genre"})
-        return df_renamed
-    
     elif uploaded_file.name.endswith(".xlsx"):
-        return pd.read_excel(uploaded_file)
+        df = pd.read_excel(uploaded_file)
     else:
-        raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
\ No newline at end of file
+        raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
+    df_renamed = type_catalog(df.rename(columns={"listed_in": "genre"}))
+    logger.info(f"Catalog memory footprint: {catalog_memory_usage(df_renamed) / 1e6:.2f} MB for {len(df_renamed)} titles")
+    return df_renamed
+
+def type_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert a raw catalog frame to compact dtypes.
+
+    - type / rating / country / duration → category
+    - duration → duration_minutes (movies) and seasons (TV shows) as small nullable ints
+    - date_added → datetime64
+    - release_year → int16
+    """
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    if "duration" in df:
+        duration = df["duration"].astype("string")
+        df["duration_minutes"] = pd.to_numeric(duration.str.extract(r"^(\d+) min", expand=False)).astype("Int16")
+        df["seasons"] = pd.to_numeric(duration.str.extract(r"^(\d+) Season", expand=False)).astype("Int8")
+    if "date_added" in df:
+        df["date_added"] = pd.to_datetime(df["date_added"].astype("string").str.strip(), format="%B %d, %Y", errors="coerce")
+    if "release_year" in df:
+        release_year = pd.to_numeric(df["release_year"], errors="coerce")
+        df["release_year"] = release_year.astype("int16") if release_year.notna().all() else release_year.astype("Int16")
+    return df
+
+def catalog_memory_usage(df: pd.DataFrame) -> int:
+    # Deep usage counts the string payloads, not just the object pointers
+    return int(df.memory_usage(deep=True).sum())
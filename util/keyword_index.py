@@ -0,0 +1,281 @@
+import re
+import json
+import time
+import logging
+import unicodedata
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from util.catalog_snapshot import StringTable, StringTableWriter
+from util.query_cache import STOPWORDS, GUARD_TERMS
+from util.vad_lexicon import negation_scopes
+
+logger = logging.getLogger(__name__)
+
+# Field boosts: a name in the credits or title says more about a title than the same word in its blurb
+FIELD_BOOSTS = {"title": 3.0, "director": 3.0, "cast": 2.0, "country": 2.0, "description": 1.0}
+# BM25F length normalisation per field; credits and countries are lists, so their length means little
+FIELD_B = {"title": 0.5, "director": 0.0, "cast": 0.2, "country": 0.0, "description": 0.75}
+K1 = 1.2
+# Postings store the saturated term weight, in [0, K1 + 1), quantised to one byte
+IMPACT_LEVELS = 255
+# Request words that say what to find rather than what it is about
+QUERY_FILLER = {
+    "recommend", "find", "show", "shows", "something", "anything", "good", "great", "kind", "type", "one",
+    "ones", "vibe", "vibes", "feel", "feeling", "story", "stories", "set", "setting", "starring", "directed",
+    "director", "by", "featuring", "fans", "fan", "watch", "watching", "need", "maybe", "but", "not", "too",
+}
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Arrays a saved index is made of, besides its gap streams and vocabulary
+INDEX_ARRAYS = ("impacts", "impact_start", "document_frequency", "idf", "first_row", "width", "stream_start")
+SEGMENTS_MANIFEST = "segments.json"
+
+
+def analyze(text: str) -> list[str]:
+    # Accent-folded lowercase word tokens, so "Cuaron" finds "Cuarón"
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return TOKEN_PATTERN.findall(text.encode("ascii", "ignore").decode("ascii"))
+
+
+def _top_n(scores: np.ndarray, rows, n: int) -> tuple[np.ndarray, np.ndarray]:
+    # The n best-scoring rows with a positive score, among rows (or all rows), best first
+    if rows is None:
+        candidates = np.flatnonzero(scores)
+    else:
+        rows = np.asarray(rows, dtype=np.int64)
+        candidates = rows[scores[rows] > 0]
+    candidate_scores = scores[candidates]
+    if n < len(candidates):
+        top = np.argpartition(-candidate_scores, n - 1)[:n]
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.argsort(-candidate_scores[top], kind="stable")]
+    return candidates[top], candidate_scores[top]
+
+
+def query_terms(query: str) -> list[str]:
+    """
+    Keyword constraints in a request: its content words, minus filler, the words the facet
+    extractors consume and words in a negation's scope ("not too gory" must not boost gore).
+    """
+    negated = {term for token, is_negated in negation_scopes(query) if is_negated for term in analyze(token)}
+    skip = STOPWORDS | GUARD_TERMS | QUERY_FILLER | negated
+    return list(dict.fromkeys(term for term in analyze(query) if term not in skip and len(term) > 1))
+
+
+class KeywordIndex:
+    """
+    BM25F inverted index over title, description, director, cast and country.
+
+    Each term's postings are its sorted catalog rows: the first row, then the gaps,
+    stored in the narrowest unsigned dtype that holds the largest gap and decoded with
+    np.cumsum, plus one quantised impact byte per posting. The impact already folds in
+    the field boosts, per-field length normalisation and tf saturation, so scoring a
+    term is a decode, one multiply by its idf and one scatter-add.
+    """
+
+    def __init__(self, movie_df: pd.DataFrame, fields: dict[str, float] = FIELD_BOOSTS):
+        start = time.perf_counter()
+        self.n_rows = len(movie_df)
+        term_chunks, row_chunks, weight_chunks = [], [], []
+        for column, boost in fields.items():
+            if column not in movie_df:
+                continue
+            tokens = movie_df[column].astype(object).fillna("").map(analyze)
+            lengths = tokens.str.len().to_numpy()
+            rows = np.repeat(np.arange(self.n_rows), lengths)
+            b = FIELD_B.get(column, 0.75)
+            norm = 1.0 - b + b * lengths / max(lengths.mean(), 1e-9)
+            term_chunks.append(tokens.explode().dropna().to_numpy())
+            row_chunks.append(rows)
+            weight_chunks.append((boost / norm)[rows])
+        terms = np.concatenate(term_chunks) if term_chunks else np.empty(0, dtype=object)
+        rows = np.concatenate(row_chunks) if row_chunks else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weight_chunks) if weight_chunks else np.empty(0)
+
+        term_ids, vocabulary = pd.factorize(terms, sort=True)
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        # One entry per (term, row), sorted term-major then by row
+        keys, inverse = np.unique(term_ids.astype(np.int64) * self.n_rows + rows, return_inverse=True)
+        tf = np.bincount(inverse, weights=weights, minlength=len(keys))
+        posting_terms, posting_rows = np.divmod(keys, self.n_rows)
+        self.impacts = np.round(tf * (K1 + 1) / (tf + K1) / (K1 + 1) * IMPACT_LEVELS).astype(np.uint8)
+
+        term_start = np.searchsorted(posting_terms, np.arange(len(vocabulary) + 1))
+        self.document_frequency = np.diff(term_start)
+        self.idf = np.log1p((self.n_rows - self.document_frequency + 0.5) / (self.document_frequency + 0.5)).astype(np.float32)
+        self.impact_start = term_start
+        # The first row of each term is kept apart so a term's gaps stay small enough for one byte
+        self.first_row = posting_rows[term_start[:-1]].astype(np.int32)
+        gaps = np.diff(posting_rows, prepend=0)
+        gaps[term_start[:-1]] = 0
+        self._encode(gaps, term_start)
+        logger.info(
+            f"Built keyword index: {self.n_rows} titles, {len(self.vocabulary)} terms, {len(keys)} postings, "
+            f"{self.memory_bytes() / 1e6:.2f} MB in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def _encode(self, gaps: np.ndarray, term_start: np.ndarray):
+        # Each term's gaps go into the uint8, uint16 or uint32 stream, whichever fits its largest gap
+        max_gap = np.maximum.reduceat(gaps, term_start[:-1]) if len(gaps) else np.zeros(len(term_start) - 1, dtype=np.int64)
+        max_gap[self.document_frequency == 0] = 0
+        self.width = np.select([max_gap < 2 ** 8, max_gap < 2 ** 16], [0, 1], 2).astype(np.uint8)
+        self.streams = []
+        self.stream_start = np.zeros(len(term_start) - 1, dtype=np.int64)
+        for width, dtype in enumerate((np.uint8, np.uint16, np.uint32)):
+            terms = np.flatnonzero(self.width == width)
+            lengths = self.document_frequency[terms]
+            self.stream_start[terms] = np.cumsum(lengths) - lengths
+            selected = np.repeat(term_start[terms] - self.stream_start[terms], lengths) + np.arange(lengths.sum())
+            self.streams.append(gaps[selected].astype(dtype))
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """(rows, impacts) for one analysed term; empty when the term is not indexed."""
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        start, length = self.stream_start[term_id], self.document_frequency[term_id]
+        rows = np.cumsum(self.streams[self.width[term_id]][start:start + length], dtype=np.int64)
+        rows += self.first_row[term_id]
+        return rows, self.impacts[self.impact_start[term_id]:self.impact_start[term_id + 1]]
+
+    def search(self, terms: list[str], rows=None, n: int = 100) -> tuple[np.ndarray, np.ndarray]:
+        """
+        BM25F top n among rows for the given terms (OR semantics).
+
+        Args:
+            terms: keyword constraints, e.g. from query_terms().
+            rows: catalog row positions to rank within (e.g. the filtered rows), or None for all.
+        Returns:
+            (rows, scores): titles matching at least one term, best first.
+        """
+        scores = np.zeros(self.n_rows, dtype=np.float32)
+        scale = np.float32((K1 + 1) / IMPACT_LEVELS)
+        for term in dict.fromkeys(terms):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            posting_rows, impacts = self.postings(term)
+            # Rows are unique within a term's postings, so a plain fancy-index add is safe
+            scores[posting_rows] += impacts * (self.idf[term_id] * scale)
+        return _top_n(scores, rows, n)
+
+    def save(self, directory: str | Path):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in INDEX_ARRAYS:
+            np.save(directory / f"{name}.npy", getattr(self, name))
+        for width, stream in enumerate(self.streams):
+            np.save(directory / f"stream{width}.npy", stream)
+        # The vocabulary is already in sorted order, so a loaded index can binary-search it on disk
+        vocabulary = StringTableWriter(directory, "vocabulary")
+        vocabulary.append(list(self.vocabulary))
+        vocabulary.close()
+        (directory / "index.json").write_text(json.dumps({"n_rows": self.n_rows}))
+
+    @classmethod
+    def load(cls, directory: str | Path, mmap_mode: str | None = "r") -> "KeywordIndex":
+        directory = Path(directory)
+        index = cls.__new__(cls)
+        index.n_rows = json.loads((directory / "index.json").read_text())["n_rows"]
+        for name in INDEX_ARRAYS:
+            setattr(index, name, np.load(directory / f"{name}.npy", mmap_mode=mmap_mode))
+        index.streams = [np.load(directory / f"stream{width}.npy", mmap_mode=mmap_mode) for width in range(3)]
+        index.vocabulary = SortedTerms(StringTable(directory, "vocabulary", mmap_mode))
+        return index
+
+    def memory_bytes(self) -> int:
+        arrays = (*self.streams, self.impacts, self.impact_start, self.document_frequency, self.idf, self.width, self.stream_start, self.first_row)
+        # The vocabulary dict is counted as its keys' string payloads
+        if isinstance(self.vocabulary, SortedTerms):
+            vocabulary_bytes = self.vocabulary.nbytes
+        else:
+            vocabulary_bytes = sum(len(term) for term in self.vocabulary)
+        return int(sum(array.nbytes for array in arrays) + vocabulary_bytes)
+
+
+class SortedTerms:
+    """The term -> id lookup of a loaded KeywordIndex, answered from its sorted on-disk vocabulary."""
+
+    def __init__(self, table: StringTable):
+        self.table = table
+        self.nbytes = table.nbytes
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def get(self, term: str) -> int | None:
+        term_id = self.table.find(term)
+        return None if term_id < 0 else term_id
+
+
+class SegmentedKeywordIndex:
+    """
+    KeywordIndex segments over consecutive row ranges of one catalog, searched as one.
+
+    Each segment is built from one ingest chunk, so its length normalisation uses that
+    chunk's average field lengths. idf comes from the document frequencies summed over
+    all segments, so scores match a single index up to that normalisation.
+    """
+
+    def __init__(self, segments: list[KeywordIndex]):
+        self.segments = segments
+        self.row_offsets = np.cumsum([0] + [segment.n_rows for segment in segments])
+        self.n_rows = int(self.row_offsets[-1])
+
+    @classmethod
+    def load(cls, directory: str | Path, mmap_mode: str | None = "r") -> "SegmentedKeywordIndex":
+        directory = Path(directory)
+        names = json.loads((directory / SEGMENTS_MANIFEST).read_text())["segments"]
+        return cls([KeywordIndex.load(directory / name, mmap_mode) for name in names])
+
+    def _term_ids(self, term: str) -> list[int | None]:
+        return [segment.vocabulary.get(term) for segment in self.segments]
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        rows, impacts = [], []
+        for segment, offset, term_id in zip(self.segments, self.row_offsets, self._term_ids(term)):
+            if term_id is not None:
+                segment_rows, segment_impacts = segment.postings(term)
+                rows.append(segment_rows + offset)
+                impacts.append(segment_impacts)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint8)
+        return np.concatenate(rows), np.concatenate(impacts)
+
+    def search(self, terms: list[str], rows=None, n: int = 100) -> tuple[np.ndarray, np.ndarray]:
+        """KeywordIndex.search over every segment; rows are catalog row positions."""
+        scores = np.zeros(self.n_rows, dtype=np.float32)
+        scale = np.float32((K1 + 1) / IMPACT_LEVELS)
+        for term in dict.fromkeys(terms):
+            term_ids = self._term_ids(term)
+            document_frequency = sum(int(segment.document_frequency[term_id]) for segment, term_id in zip(self.segments, term_ids) if term_id is not None)
+            if not document_frequency:
+                continue
+            idf = np.float32(np.log1p((self.n_rows - document_frequency + 0.5) / (document_frequency + 0.5)))
+            for segment, offset, term_id in zip(self.segments, self.row_offsets, term_ids):
+                if term_id is not None:
+                    posting_rows, impacts = segment.postings(term)
+                    scores[posting_rows + offset] += impacts * (idf * scale)
+        return _top_n(scores, rows, n)
+
+    def memory_bytes(self) -> int:
+        return sum(segment.memory_bytes() for segment in self.segments)
+
+
+class KeywordIndexBuilder:
+    """Writes one KeywordIndex segment per catalog chunk, then loads them as a SegmentedKeywordIndex."""
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.segments: list[str] = []
+
+    def add(self, chunk: pd.DataFrame):
+        name = f"segment-{len(self.segments):05d}"
+        KeywordIndex(chunk).save(self.directory / name)
+        self.segments.append(name)
+
+    def finish(self) -> SegmentedKeywordIndex:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / SEGMENTS_MANIFEST).write_text(json.dumps({"segments": self.segments}))
+        return SegmentedKeywordIndex.load(self.directory)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from util.tracing import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", Path(__file__).resolve().parent.parent / "data" / "llm_cache.sqlite3"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def _hash(value) -> str:
+    # Canonical JSON (sorted keys, no whitespace) so equal requests always hash the same
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def prompt_hash(prompt: str) -> str:
+    return _hash(prompt)[:16]
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of structured-output completions.
+
+    Entries are keyed on model, the canonical hash of the messages, the response-format
+    JSON schema and any extra parse parameters (e.g. seed). Each row also records the
+    caller's namespace and a hash of its system prompt, so register_prompt() can drop
+    everything produced by an older version of that prompt. Eviction is LRU by last
+    access once max_entries is exceeded; entries older than ttl_seconds are misses.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_namespace ON completions (namespace, prompt_hash)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict], response_format, **params) -> str:
+        schema = response_format.model_json_schema() if hasattr(response_format, "model_json_schema") else response_format
+        return _hash({"model": model, "messages": _hash(messages), "schema": _hash(schema), "params": params})
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT content, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            content, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return content
+
+    def put(self, key: str, content: str, namespace: str, model: str, system_prompt_hash: str = ""):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, system_prompt_hash, model, content, now, now),
+            )
+            # LRU eviction: keep only the max_entries most recently used rows
+            self._conn.execute(
+                """
+                DELETE FROM completions WHERE key IN (
+                    SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def invalidate(self, namespace: str | None = None) -> int:
+        with self._lock:
+            if namespace is None:
+                cursor = self._conn.execute("DELETE FROM completions")
+            else:
+                cursor = self._conn.execute("DELETE FROM completions WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def register_prompt(self, namespace: str, prompt: str) -> int:
+        # Drop entries this namespace produced with any other version of its prompt
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM completions WHERE namespace = ? AND prompt_hash != ?",
+                (namespace, prompt_hash(prompt)),
+            )
+            self._conn.commit()
+        if cursor.rowcount:
+            logger.info(f"Invalidated {cursor.rowcount} cached '{namespace}' responses after a prompt change")
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+
+def cached_parse(client, *, namespace: str, model: str, messages: list[dict], response_format, **params):
+    """
+    client.beta.chat.completions.parse with a persistent response cache in front of it.
+
+    Returns:
+        The parsed response_format instance (None if the model refused).
+    """
+    with span(f"llm.{namespace}", namespace=namespace, model=model) as llm_span:
+        cache = get_llm_cache()
+        key = cache.make_key(model, messages, response_format, **params)
+        content = cache.get(key)
+        if content is not None:
+            logger.info(f"LLM cache hit for {namespace}")
+            llm_span.set(cache_hit=True)
+            return response_format.model_validate_json(content)
+
+        completion = client.beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            response_format=response_format,
+            **params,
+        )
+        llm_span.set(cache_hit=False, **usage_attributes(completion.usage))
+        message = completion.choices[0].message
+        logger.debug(f"RAW assistant ({namespace}): \n{message.content}")
+        if message.parsed is not None and message.content:
+            system_prompt = "".join(m["content"] for m in messages if m.get("role") == "system")
+            cache.put(key, message.content, namespace, model, prompt_hash(system_prompt))
+        return message.parsed
+
+
+def usage_attributes(usage) -> dict:
+    # Token counts from a completion's usage; o-series models also report reasoning tokens
+    if usage is None:
+        return {}
+    details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "reasoning_tokens": (getattr(details, "reasoning_tokens", None) or 0) if details else 0,
+        "total_tokens": usage.total_tokens,
+    }
@@ -0,0 +1,60 @@
+import os
+import logging
+import threading
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Requests served at once (the service's worker threads) and the LLM calls each one has in
+# flight: one per criteria extractor, or one per VAD batch. The process-wide thread pools
+# and the connection pool are sized from both, so concurrent requests do not queue for them
+CONCURRENT_REQUESTS = int(os.getenv("SERVICE_WORKERS", "32"))
+REQUEST_FAN_OUT = int(os.getenv("LLM_REQUEST_FAN_OUT", "5"))
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", str(CONCURRENT_REQUESTS * REQUEST_FAN_OUT)))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", str(MAX_CONNECTIONS // 2)))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "120"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+# o4-mini reasons before answering, so reads need far more headroom than connects
+READ_TIMEOUT_SECONDS = float(os.getenv("OPENAI_READ_TIMEOUT_SECONDS", "60"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+_client: OpenAI | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    """
+    The process-wide OpenAI client.
+
+    Every extractor shares it, so back-to-back and parallel calls reuse warm keep-alive
+    connections from one pool instead of opening a fresh TLS session per module.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+        if not openai_api_key:
+            raise RuntimeError("❌ OPENAI_API_KEY not found. Please set it in your .env file.")
+        else:
+            # (optionally mask most of it in logs)
+            print(f"✅ OPENAI_API_KEY loaded: {openai_api_key[:4]}…")
+        timeout = httpx.Timeout(READ_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+        _client = OpenAI(
+            timeout=timeout,
+            max_retries=MAX_RETRIES,
+            http_client=DefaultHttpxClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            ),
+        )
+        logger.info(f"OpenAI client ready: {MAX_CONNECTIONS} max connections, {MAX_KEEPALIVE_CONNECTIONS} keep-alive")
+        return _client
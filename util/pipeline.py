@@ -0,0 +1,135 @@
+import time
+import logging
+import numpy as np
+from util.catalog import Catalog
+from util.vad_calculation import vad_similarity_matrix, top_k_positions
+from util.function_calls import iter_movie_vad_scores, MAX_LIVE_VAD_SCORES
+from util.tracing import record_span, span
+from util.text_index import RECALL_TOP_N
+from util.keyword_index import query_terms
+from util.vad_index import BRUTE_FORCE_LIMIT
+from util.vad_store import get_vad_store
+
+logger = logging.getLogger(__name__)
+
+# Reciprocal rank fusion damping: larger values flatten the advantage of the very top ranks
+RRF_K = 60
+# Stored titles taken from the VAD grid per result slot; the grid ranks by weighted distance,
+# these candidates are then re-ranked with the full similarity blend
+GRID_OVERSAMPLE = 4
+
+
+def iter_running_top_k(scored_chunks, user_vad, k: int = 10):
+    """
+    Merge streamed VAD scores into a running top-k.
+
+    Args:
+        scored_chunks: iterable of (rows, vad) pairs, e.g. from iter_movie_vad_scores.
+        user_vad: {'valence','arousal','dominance'} dict or [v, a, d].
+    Yields:
+        list of (row, score), best first, after every chunk.
+    """
+    best_rows = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for rows, vad in scored_chunks:
+        # Only the current winners and the new chunk are scored together, never the whole history
+        rows = np.concatenate([best_rows, np.asarray(rows, dtype=np.int64)])
+        scores = np.concatenate([best_scores, vad_similarity_matrix(user_vad, vad)])
+        top = top_k_positions(scores, k)
+        best_rows, best_scores = rows[top], scores[top]
+        yield list(zip(best_rows.tolist(), best_scores.tolist()))
+
+
+def fuse_rankings(rankings: list[np.ndarray], n: int) -> np.ndarray:
+    # Reciprocal rank fusion: each ranking adds 1 / (RRF_K + rank) to the rows it lists
+    ranked = [np.asarray(ranking, dtype=np.int64) for ranking in rankings if len(ranking)]
+    if not ranked:
+        return np.empty(0, dtype=np.int64)
+    fused_rows, inverse = np.unique(np.concatenate(ranked), return_inverse=True)
+    weights = np.concatenate([1.0 / (RRF_K + 1 + np.arange(len(ranking))) for ranking in ranked])
+    scores = np.bincount(inverse, weights=weights, minlength=len(fused_rows))
+    return fused_rows[np.argsort(-scores, kind="stable")[:n]]
+
+
+def recall_rows(catalog: Catalog, rows, query: str, n: int = RECALL_TOP_N) -> np.ndarray:
+    """
+    The n filtered rows most relevant to the query text.
+
+    BM25 keyword matches (title, description and credits) and description similarity
+    are ranked separately and fused, so a named director or a rare keyword still gets
+    through when the descriptions read alike. Returns rows unchanged when recall is off
+    (n=0) or there are no more than n of them.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if n <= 0 or len(rows) <= n:
+        return rows
+    with span("recall", filtered=len(rows), n=n) as recall_span:
+        terms = query_terms(query)
+        with span("recall.keywords", terms=terms) as keyword_span:
+            keyword_rows, _ = catalog.keyword_index().search(terms, rows, n=n)
+            keyword_span.set(matched=len(keyword_rows))
+        with span("recall.vectors"):
+            vector_rows, _ = catalog.text_index().search(query, rows, n=n)
+        recalled = fuse_rankings([keyword_rows, vector_rows], n)
+        recall_span.set(recalled=len(recalled))
+    return recalled
+
+
+def stream_ranked_titles(catalog: Catalog, rows, user_vad, k: int = 10, max_live: int = MAX_LIVE_VAD_SCORES, query: str | None = None):
+    """
+    Filtered rows → (text recall) → VAD scoring → running top-k, as one incremental generator.
+
+    Titles with a stored score are ranked through the catalog's VAD grid index (k-NN
+    among the filtered rows, without looking each one up); the rest go through live
+    scoring, which also picks up scores stored since the grid was built. Yields the
+    ranked list of (catalog row, score) each time new scores arrive, so the first
+    result is ready as soon as the first title is scored rather than the last. With a
+    query, only the RECALL_TOP_N filtered titles most similar to it are scored.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if query:
+        rows = recall_rows(catalog, rows, query)
+    # Scoring and ranking interleave, so each is timed by summing its share of every step
+    scoring = {"ms": 0.0, "titles": 0}
+
+    def scored_chunks():
+        # Stored scores first: the k-NN of the user's VAD among the filtered rows the grid knows
+        start = time.perf_counter()
+        vad_index = catalog.vad_index(get_vad_store())
+        stored = ~np.isnan(vad_index.vad[rows, 0])
+        stored_rows, live_rows = rows[stored], rows[~stored]
+        if len(stored_rows) > BRUTE_FORCE_LIMIT:
+            stored_rows, _ = vad_index.query(user_vad, k=k * GRID_OVERSAMPLE, candidates=stored_rows)
+        # Only the titles that may be scored live are decoded
+        live_df = catalog.rows(live_rows)
+        scoring["ms"] += (time.perf_counter() - start) * 1000
+        if len(stored_rows):
+            scoring["titles"] += len(stored_rows)
+            yield stored_rows, vad_index.vad[stored_rows]
+        chunks = iter_movie_vad_scores(live_df['show_id'].tolist(), live_df['description'].tolist(), max_live=max_live, user_vad=user_vad)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            scoring["ms"] += (time.perf_counter() - start) * 1000
+            if chunk is None:
+                return
+            positions, vad = chunk
+            scoring["titles"] += len(positions)
+            yield live_rows[positions], vad
+
+    ranked_lists = iter_running_top_k(scored_chunks(), user_vad, k=k)
+    busy_ms, first_result_ms = 0.0, None
+    start = time.perf_counter()
+    try:
+        while True:
+            step_start = time.perf_counter()
+            ranked = next(ranked_lists, None)
+            busy_ms += (time.perf_counter() - step_start) * 1000
+            if ranked is None:
+                return
+            if first_result_ms is None:
+                first_result_ms = (time.perf_counter() - start) * 1000
+            yield ranked
+    finally:
+        record_span("vad_scoring", scoring["ms"], titles=len(rows), scored=scoring["titles"], time_to_first_result_ms=first_result_ms)
+        record_span("ranking", busy_ms - scoring["ms"], k=k)
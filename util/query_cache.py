@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from models.models import ExtractGenre, ExtractViewingType, ExtractAudienceCategory, ExtractVAD, ExtractNumericConstraints
+from util.llm_cache import prompt_hash
+from util.vad_lexicon import negation_scopes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_CACHE_PATH = Path(os.getenv("QUERY_CACHE_PATH", Path(__file__).resolve().parent.parent / "data" / "query_cache.jsonl"))
+# Jaccard similarity of the normalised token sets needed to reuse stored criteria
+DEFAULT_SIMILARITY_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.8"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "5000"))
+
+NUM_PERM = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.6 Jaccard almost always share a bucket
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+CRITERIA_MODELS = {
+    "genre": ExtractGenre,
+    "viewing_type": ExtractViewingType,
+    "audience_category": ExtractAudienceCategory,
+    "VAD": ExtractVAD,
+    "numeric": ExtractNumericConstraints,
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "that", "that's", "thats",
+    "is", "it", "its", "i", "i'm", "im", "me", "my", "want", "would", "like", "looking", "something",
+    "some", "any", "please", "watch", "mood", "be", "so", "as", "this", "tonight", "s", "about", "really",
+}
+# Terms that change the extracted criteria on their own; two queries only match if they agree on all of them
+GUARD_TERMS = {
+    "movie", "movies", "film", "films", "show", "shows", "series", "tv", "miniseries", "limited", "docuseries",
+    "documentary", "kids", "kid", "children", "child", "family", "teen", "teens", "adult", "adults", "mature",
+    "all", "ages", "older", "not", "no", "without", "never", "minimal", "low",
+    "under", "over", "less", "more", "before", "after", "since", "last", "least", "most", "hours", "minutes", "seasons",
+}
+# Words that can differ between two matching queries. Any other differing word (a genre, a mood,
+# a place, a guard term) may change the criteria, so such pairs never share an entry.
+FILLER_TERMS = {
+    "can", "could", "you", "we", "us", "our", "what", "which", "should", "recommend", "recommendation",
+    "recommendations", "suggest", "suggestion", "suggestions", "find", "give", "need", "good", "great",
+    "nice", "just", "maybe", "kind", "sort", "type", "one", "ones", "pick", "picks", "options", "ideas", "also",
+    "are", "there", "have", "got", "get", "let's", "lets", "up", "feel", "feeling", "into", "from", "by",
+}
+# Words plus the punctuation that ends a negation scope
+QUERY_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[.,;:!?]")
+
+
+def _fold(query: str) -> str:
+    # Fold unicode quotes/dashes and lowercase
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = text.replace("’", "'").replace("‘", "'")
+    return re.sub(r"[‐-―/]", " ", text)
+
+
+def normalize_query(query: str) -> list[str]:
+    # Word tokens minus filler words
+    return [token for token in re.findall(r"[a-z0-9]+(?:'[a-z]+)?", _fold(query)) if token not in STOPWORDS]
+
+
+def query_tokens(query: str) -> set[str]:
+    """
+    The token set the cache compares: normalize_query's words, with those inside a
+    negation scope marked, so "horror, no comedy" ({"horror", "no", "not:comedy"}) and
+    "comedy, no horror" ({"comedy", "no", "not:horror"}) are different queries.
+    """
+    return {
+        f"not:{token}" if negated else token
+        for token, negated in negation_scopes(_fold(query), QUERY_TOKEN_PATTERN)
+        if token[0].isalnum() and token not in STOPWORDS
+    }
+
+
+def _content_difference(tokens: set[str], other: set[str]) -> set[str]:
+    # Words only one of the two queries has that could change the extracted criteria
+    return {token for token in tokens ^ other if token not in FILLER_TERMS}
+
+
+def _token_hashes(tokens: set[str]) -> np.ndarray:
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little") for token in tokens],
+        dtype=np.uint64,
+    )
+
+
+_rng = np.random.default_rng(7)
+_PERM_MASKS = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def minhash_signature(tokens: set[str]) -> np.ndarray:
+    if not tokens:
+        return np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    h = _token_hashes(tokens)[:, None] ^ _PERM_MASKS[None, :]
+    # Cheap multiplicative mix so each mask behaves like an independent permutation
+    h = h * _MIX
+    h ^= h >> np.uint64(31)
+    return h.min(axis=0)
+
+
+class QueryCache:
+    """
+    Reuse extracted criteria for queries that are near-duplicates of earlier ones.
+
+    Queries are normalised to token sets with negated words marked (query_tokens),
+    MinHash-signed and bucketed with LSH banding; bucket candidates are confirmed with
+    exact Jaccard similarity, and any word one query has and the other lacks must be
+    filler (FILLER_TERMS), so "thriller" vs "horror", "cozy" vs "bleak" or "no comedy"
+    vs "comedy" never match. Entries record the hash of the extraction prompt and
+    register_prompt() drops those from older prompts. At most max_entries are kept, least
+    recently used first out. Entries are appended to a JSONL file, which is rewritten
+    only when it has grown to twice the live entries.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_QUERY_CACHE_PATH, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.prompt_hash = ""
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # entry id -> entry, least recently used first
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._token_sets: dict[int, set[str]] = {}
+        self._buckets: dict[tuple, set[int]] = {}
+        self._next_id = 0
+        self._file_lines = 0
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._index_entry(entry)
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        logger.warning(f"Ignoring unreadable query cache line in {self.path}: {e}")
+        logger.info(f"Loaded {len(self._entries)} cached queries")
+
+    def _band_keys(self, signature: np.ndarray) -> list[tuple]:
+        return [(band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()) for band in range(BANDS)]
+
+    def _index_entry(self, entry: dict):
+        tokens = query_tokens(entry["query"])
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._token_sets[entry_id] = tokens
+        for key in self._band_keys(minhash_signature(tokens)):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._remove_entry(next(iter(self._entries)))
+
+    def _remove_entry(self, entry_id: int):
+        del self._entries[entry_id]
+        for key in self._band_keys(minhash_signature(self._token_sets.pop(entry_id))):
+            bucket = self._buckets[key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def _rewrite(self):
+        # Compact the file down to the live entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(self._entries)
+
+    def register_prompt(self, prompt: str) -> int:
+        # Drop entries extracted with any other version of the prompt; new entries are tagged with this one
+        with self._lock:
+            self.prompt_hash = prompt_hash(prompt)
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.get("prompt_hash") != self.prompt_hash]
+            for entry_id in stale:
+                self._remove_entry(entry_id)
+            if stale:
+                self._rewrite()
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached queries after a prompt change")
+        return len(stale)
+
+    def lookup(self, query: str) -> dict | None:
+        """
+        Returns:
+            dict: the stored criteria (same shape as extract_query_criteria) or None on a miss.
+        """
+        tokens = query_tokens(query)
+        candidates = set()
+        with self._lock:
+            for key in self._band_keys(minhash_signature(tokens)):
+                candidates.update(self._buckets.get(key, ()))
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                other = self._token_sets[entry_id]
+                if _content_difference(tokens, other):
+                    continue
+                similarity = len(tokens & other) / len(tokens | other) if tokens | other else 1.0
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+        logger.info(f"Query cache hit ({best_similarity:.2f}): '{query}' ~ '{entry['query']}'")
+        return {
+            name: CRITERIA_MODELS[name].model_validate(value) if value is not None else None
+            for name, value in entry["criteria"].items()
+        }
+
+    def add(self, query: str, criteria: dict):
+        entry = {
+            "query": query,
+            "prompt_hash": self.prompt_hash,
+            "criteria": {name: value.model_dump() if value is not None else None for name, value in criteria.items()},
+        }
+        with self._lock:
+            self._index_entry(entry)
+            if self._file_lines >= 2 * self.max_entries:
+                self._rewrite()
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._file_lines += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+_query_cache: QueryCache | None = None
+_query_cache_lock = threading.Lock()
+
+def get_query_cache() -> QueryCache:
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache()
+        return _query_cache
@@ -0,0 +1,167 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAIError
+from pydantic import ValidationError
+from models.models import ExtractQueryCriteria, LexiconVAD
+from util.llm_cache import cached_parse, get_llm_cache
+from util.openai_client import CONCURRENT_REQUESTS
+from util.query_cache import get_query_cache
+from util.tracing import span, submit
+from util.genre_extracter import extract_genre_from_request, GENRE_SYSTEM_PROMPT
+from util.function_calls import (
+    client,
+    model,
+    extract_VAD_from_request,
+    extract_viewing_type_from_request,
+    extract_audience_category_from_request,
+    extract_numeric_constraints_from_request,
+    SYSTEM_PROMPT,
+    AUDIENCE_CATEGORY_SYSTEM_PROMPT,
+    VAD_SYSTEM_PROMPT,
+    NUMERIC_SYSTEM_PROMPT,
+)
+
+logger = logging.getLogger(__name__)
+
+# "parallel" runs the extractors side by side, "combined" asks for all criteria in one call
+CRITERIA_EXTRACTION_MODE = os.getenv("CRITERIA_EXTRACTION_MODE", "parallel")
+
+# The extractors are independent network calls, so one thread each is enough
+CRITERIA_EXTRACTORS = {
+    "genre": extract_genre_from_request,
+    "viewing_type": extract_viewing_type_from_request,
+    "audience_category": extract_audience_category_from_request,
+    "VAD": extract_VAD_from_request,
+    "numeric": extract_numeric_constraints_from_request,
+}
+# Shared by every request, so one thread per extractor for each request served at once
+_executor = ThreadPoolExecutor(max_workers=CONCURRENT_REQUESTS * len(CRITERIA_EXTRACTORS), thread_name_prefix="criteria")
+
+COMBINED_SYSTEM_PROMPT = f"""
+    You extract every search criterion for a movie/TV request in one pass.
+    Fill each section of the response schema by following the rules for that section below.
+    The per-section "Return JSON" instructions describe the shape of that section only.
+
+    [genre]
+    {GENRE_SYSTEM_PROMPT}
+
+    [viewing_type]
+    The section field is "viewing_type" (a list).
+    {SYSTEM_PROMPT}
+
+    [audience_category]
+    {AUDIENCE_CATEGORY_SYSTEM_PROMPT}
+
+    [vad]
+    {VAD_SYSTEM_PROMPT}
+
+    [numeric]
+    {NUMERIC_SYSTEM_PROMPT}
+""".strip()
+
+combined_few_shots = [
+    {"role": "user", "content": "A crime thriller TV series that’s for adults, tense but not super gory."},
+    {"role": "assistant", "content": json.dumps({
+        "genre": {"genre": "Thrillers", "confidence": 0.82, "rationale": "Crime and tension point to thrillers."},
+        "viewing_type": {"viewing_type": ["TV Series"]},
+        "audience_category": {"category": "ADULT", "confidence": 0.9, "rationale": "explicitly for adults"},
+        "vad": {"vad": {"valence": 0.3, "arousal": 0.75, "dominance": 0.4}},
+        "numeric": {},
+    })},
+
+    {"role": "user", "content": "Rom-com TV show that’s clean and cozy, good for all ages, just one season."},
+    {"role": "assistant", "content": json.dumps({
+        "genre": {"genre": "TV Comedies", "confidence": 0.8, "rationale": "Romantic comedy series."},
+        "viewing_type": {"viewing_type": ["TV Series"]},
+        "audience_category": {"category": "CHILDREN", "confidence": 0.85, "rationale": "clean, all ages"},
+        "vad": {"vad": {"valence": 0.85, "arousal": 0.3, "dominance": 0.55}},
+        "numeric": {"min_seasons": 1, "max_seasons": 1},
+    })},
+]
+
+get_llm_cache().register_prompt("combined_criteria", COMBINED_SYSTEM_PROMPT)
+# The combined prompt embeds every per-field prompt, so it versions the query cache too
+get_query_cache().register_prompt(COMBINED_SYSTEM_PROMPT)
+
+def build_combined_messages(request_text: str):
+    return (
+        [{"role": "system", "content": COMBINED_SYSTEM_PROMPT}]
+        + combined_few_shots
+        + [{"role": "user", "content": request_text}]
+    )
+
+def extract_combined_criteria(request: dict) -> ExtractQueryCriteria:
+    logger.info(f"Extracting combined criteria from request: {request}")
+    criteria_result = cached_parse(
+        client,
+        namespace="combined_criteria",
+        model=model,
+        seed=7,
+        messages=build_combined_messages(str(request)),
+        response_format=ExtractQueryCriteria,
+    )
+    logger.info(f"Confirmation message generated successfully: {criteria_result}")
+    return criteria_result
+
+
+def extract_query_criteria(user_query: str, mode: str | None = None) -> dict:
+    """
+    Extract genre, viewing type, audience category, VAD and numeric limits for one query.
+
+    Near-duplicates of earlier queries reuse their stored criteria without any LLM call.
+    In "combined" mode one structured-output call fills them all; if that call fails
+    validation the per-field extractors run instead.
+
+    Returns:
+        dict: extractor name -> parsed response, or None when that extractor failed.
+    """
+    with span("extract_criteria", mode=mode or CRITERIA_EXTRACTION_MODE) as extract_span:
+        query_cache = get_query_cache()
+        cached = query_cache.lookup(user_query)
+        extract_span.set(query_cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+        criteria = _extract_query_criteria(user_query, mode)
+        # Lexicon fallbacks are stand-ins for a failed call, so the next near-duplicate retries the LLM
+        if all(value is not None for value in criteria.values()) and not isinstance(criteria["VAD"], LexiconVAD):
+            query_cache.add(user_query, criteria)
+        return criteria
+
+
+def _run_extractor(name: str, extractor, request: dict):
+    with span(f"extract.{name}"):
+        return extractor(request)
+
+
+def _extract_query_criteria(user_query: str, mode: str | None) -> dict:
+    request = {"query": user_query}
+    if (mode or CRITERIA_EXTRACTION_MODE) == "combined":
+        try:
+            with span("extract.combined"):
+                combined = extract_combined_criteria(request)
+        except ValidationError as e:
+            logger.warning(f"Combined extraction failed validation, falling back to per-field extractors: {e}")
+            combined = None
+        except OpenAIError as e:
+            # The per-field path still has the rule fast paths and the lexicon VAD fallback
+            logger.warning(f"Combined extraction call failed, falling back to per-field extractors: {e}")
+            combined = None
+        if combined is not None:
+            return {
+                "genre": combined.genre,
+                "viewing_type": combined.viewing_type,
+                "audience_category": combined.audience_category,
+                "VAD": combined.vad,
+                "numeric": combined.numeric,
+            }
+    futures = {name: submit(_executor, _run_extractor, name, extractor, request) for name, extractor in CRITERIA_EXTRACTORS.items()}
+    criteria = {}
+    for name, future in futures.items():
+        try:
+            criteria[name] = future.result()
+        except Exception as e:
+            logger.error(f"{name} extraction failed: {e}")
+            criteria[name] = None
+    return criteria
@@ -0,0 +1,294 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+from models.models import ExtractViewingType, ExtractAudienceCategory, ExtractNumericConstraints
+from util.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Set QUERY_RULES_ENABLED=0 to send every query to the LLM extractors
+QUERY_RULES_ENABLED = os.getenv("QUERY_RULES_ENABLED", "1") != "0"
+
+# Same synonym table as SYSTEM_PROMPT; miniseries cues are matched (and blanked) before series cues
+VIEWING_TYPE_PATTERNS = [
+    ("Miniseries", re.compile(r"\b(?:mini ?series|limited series)\b")),
+    ("TV Series", re.compile(r"\b(?:tv shows?|tv series|docuseries|sitcoms?|series(?! of)|shows?(?! me\b| us\b))\b")),
+    ("Movie", re.compile(r"\b(?:movies?|films?)\b")),
+]
+
+# Same rating table as AUDIENCE_CATEGORY_SYSTEM_PROMPT; bare "G"/"R" only count next to "rated"
+RATING_PATTERNS = [
+    ("CHILDREN", re.compile(r"\b(?:tv-y7|tv-y|tv-g|rated g|g-rated)\b")),
+    ("TEEN", re.compile(r"\b(?:tv-pg|tv-14|pg-13|pg(?!-)|rated pg|parental guidance)\b")),
+    ("ADULT", re.compile(r"\b(?:tv-ma|nc-17|rated r|r-rated)\b")),
+]
+# Audience nouns only count inside an audience construction ("for my kids", "kid-friendly");
+# on their own they usually describe the subject ("a drama about a kid"), which is left to the LLM
+KID_NOUNS = r"(?:kids?|children|child|little ones|toddlers?|preschoolers?)"
+TEEN_NOUNS = r"(?:teens?|teenagers?|young adults?)"
+ADULT_NOUNS = r"(?:adults?|grown[- ]ups?)"
+AUDIENCE_PREFIX = r"(?:for|with|to watch with|safe for|suitable for|appropriate for|okay for|ok for|fine for)"
+AUDIENCE_OWNER = r"(?:(?:my|our|the|a|young|little|small|younger|older)\s+){0,2}"
+AUDIENCE_FORMATS = r"(?:movies?|films?|shows?|tv|series|cartoons?|content|programs?)"
+AUDIENCE_PATTERNS = [
+    ("CHILDREN", re.compile(
+        rf"\b(?:{AUDIENCE_PREFIX}\s+{AUDIENCE_OWNER}{KID_NOUNS}|(?:kids?|child|children)[- ](?:safe|friendly|appropriate)|"
+        rf"(?:kids'?|children's)\s+{AUDIENCE_FORMATS}|family[- ]friendly|family[- ]appropriate|whole family|family night|all ages)\b"
+    )),
+    ("TEEN", re.compile(
+        rf"\b(?:{AUDIENCE_PREFIX}\s+{AUDIENCE_OWNER}{TEEN_NOUNS}|teen[- ](?:safe|friendly|appropriate)|"
+        rf"(?:teen|teens'?|teenagers'?)\s+{AUDIENCE_FORMATS})\b"
+    )),
+    ("ADULT", re.compile(
+        rf"\b(?:{AUDIENCE_PREFIX}\s+(?:(?:the|other|fellow)\s+)?{ADULT_NOUNS}\b|adults?[- ]only\b|"
+        rf"(?:adult|grown[- ]up)\s+(?:audiences?|viewers?)\b|mature\b|18\+)"
+    )),
+]
+# An age only sets the audience when the title is for that person ("for my 6-year-old")
+AGE_PATTERN = re.compile(r"\b(?:for|with)\s+(?:(?:my|our|a|an|the)\s+)?(\d{1,2})[- ](?:year|yr)[- ]olds?\b")
+# Audience nouns and ages left once the constructions above are blanked out
+AUDIENCE_SUBJECT_PATTERN = re.compile(
+    rf"\b(?:{KID_NOUNS}|{TEEN_NOUNS}|{ADULT_NOUNS}|\d{{1,2}}[- ](?:year|yr)[- ]olds?)\b"
+)
+# Content cues the LLM weighs against the stated audience ("family-friendly but strong profanity")
+MATURITY_PATTERN = re.compile(
+    r"\b(?:gory|gore|graphic|explicit|violent|violence|profanity|swearing|strong language|nudity|sex(?:ual)?|disturbing|raunchy)\b"
+)
+# A cue preceded by one of these within a few words is negated, not asserted
+NEGATION_WORDS = r"not|no|never|without|nothing|isn't|anything but|other than|rather than|instead of|except"
+NEGATION_PATTERN = re.compile(rf"\b(?:{NEGATION_WORDS})\b(?:\W+\w+){{0,2}}\W*$")
+# Mature-content words are also discounted when softened ("light profanity", "low on gore")
+SOFTENED_PATTERN = re.compile(rf"\b(?:{NEGATION_WORDS}|minimal|low on|light|mild|little)\b(?:\W+\w+){{0,2}}\W*$")
+CATEGORY_ORDER = {"CHILDREN": 0, "TEEN": 1, "ADULT": 2}
+
+# Numeric phrasing; anything cue-like the patterns below do not explain goes to the LLM
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "single": 1, "two": 2, "couple of": 2, "a couple of": 2, "three": 3,
+                "few": 3, "a few": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+NUMBER = r"(\d+(?:\.\d+)?|a couple of|couple of|a few|few|an?|one|single|two|three|four|five|six|seven|eight|nine|ten)"
+UPPER_BOUND = r"under|less than|fewer than|shorter than|no (?:more|longer) than|at most|up to|max(?:imum)?|below"
+LOWER_BOUND = r"over|more than|longer than|at least|min(?:imum)?|above"
+# "around 90 minutes" means give or take this much
+AROUND_MINUTES = 15
+DURATION_PATTERN = re.compile(
+    rf"\b(?:({UPPER_BOUND})|({LOWER_BOUND})|(?:around|about|roughly|approximately))\s+{NUMBER}[- ]?(hours?|hrs?|minutes?|mins?)\b"
+)
+# Bounds that follow the count ("3 seasons or fewer", "2 seasons max")
+UPPER_SUFFIX = r"or (?:fewer|less|under)|at most|max(?:imum)?|tops"
+LOWER_SUFFIX = r"or (?:more|over|longer)|at least|min(?:imum)?|plus"
+SEASON_PATTERN = re.compile(
+    rf"\b(?:({UPPER_BOUND})\s+|({LOWER_BOUND})\s+)?{NUMBER}[- ]seasons?\b(?:,?\s+({UPPER_SUFFIX})\b|,?\s+({LOWER_SUFFIX})\b)?"
+)
+RECENT_PATTERN = re.compile(rf"\b(added )?(?:from|in|within|over|during) the (?:last|past) (?:{NUMBER} )?(years?|decades?)\b")
+YEAR_BOUND_PATTERN = re.compile(r"\b(before|after|since|pre|post)[- ]((?:19|20)\d\d)\b")
+RELEASED_IN_PATTERN = re.compile(r"\b(?:released|made|came out|from) in ((?:19|20)\d\d)\b")
+DECADE_PATTERN = re.compile(r"\b(?:from|released in|made in) the (19|20)?(\d)0'?s\b")
+# Episode counts and lengths are not in the catalog; recognised so they do not send the query to the LLM
+EPISODE_PATTERN = re.compile(rf"\b(?:\d+\s*-\s*)?{NUMBER}?\s*episodes?\b(?:\s+(?:of\s+)?(?:around|about|roughly|under|over)?\s*{NUMBER}(?:\s*-\s*\d+)?[- ]?(?:minutes?|mins?|hours?))?")
+NUMERIC_CUE_PATTERN = re.compile(
+    r"\d|\b(?:hours?|hrs?|minutes?|mins?|runtime|length|seasons?|episodes?|years?|decades?|"
+    r"recent(?:ly)?|newer|newest|latest|classic|vintage|released|added|or (?:fewer|less|more)|max(?:imum)?|min(?:imum)?)\b"
+)
+
+
+def normalize_request(request) -> str:
+    # request is the {"query": ...} dict the extractors receive, or the raw text
+    text = request.get("query", "") if isinstance(request, dict) else str(request)
+    text = unicodedata.normalize("NFKC", text).lower()
+    return text.replace("’", "'").replace("‘", "'").replace("—", " ").replace("–", "-")
+
+
+def _negated(text: str, start: int, pattern: re.Pattern = NEGATION_PATTERN) -> bool:
+    return pattern.search(text[max(0, start - 30):start]) is not None
+
+
+class RuleStats:
+    """Per-field count of queries the rules resolved (hits) vs. handed to the LLM (misses)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: dict[str, dict[str, int]] = {}
+
+    def record(self, field: str, hit: bool):
+        with self._lock:
+            counts = self.counts.setdefault(field, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                field: {**counts, "hit_rate": counts["hits"] / (counts["hits"] + counts["misses"])}
+                for field, counts in self.counts.items()
+            }
+
+
+rule_stats = RuleStats()
+
+
+def resolve_viewing_type(request) -> ExtractViewingType | None:
+    """
+    Viewing type(s) from unambiguous type words, in order of mention.
+
+    Returns None (ask the LLM) when no type word is present or one is negated,
+    e.g. "anything but a movie".
+    """
+    text = normalize_request(request)
+    mentions = []
+    for viewing_type, pattern in VIEWING_TYPE_PATTERNS:
+        for match in pattern.finditer(text):
+            if _negated(text, match.start()):
+                return None
+            mentions.append((match.start(), viewing_type))
+        # Blank out the match so "limited series" is not counted again as a series
+        text = pattern.sub(lambda m: " " * len(m.group()), text)
+    if not mentions:
+        return None
+    viewing_types = list(dict.fromkeys(viewing_type for _, viewing_type in sorted(mentions)))
+    return ExtractViewingType(viewing_type=viewing_types)
+
+
+def resolve_audience_category(request) -> ExtractAudienceCategory | None:
+    """
+    Audience category from ratings, ages and explicit audience phrases.
+
+    Conflicting cues resolve to the most restrictive category, as the LLM prompt asks.
+    Returns None (ask the LLM) when there is no explicit cue, when a cue is negated,
+    when an audience noun or age appears outside an audience phrase ("a heist movie
+    about a crew of teenagers"), or when unnegated mature-content words appear without
+    an ADULT cue, since those need judgement ("family-friendly but strong profanity" is TEEN).
+    """
+    text = normalize_request(request)
+    found: dict[str, str] = {}
+    spans = []
+    confidence = 0.9
+    for patterns, cue_confidence in ((AUDIENCE_PATTERNS, 0.9), (RATING_PATTERNS, 0.95)):
+        for category, pattern in patterns:
+            for match in pattern.finditer(text):
+                if _negated(text, match.start()):
+                    return None
+                found.setdefault(category, match.group())
+                spans.append(match.span())
+                confidence = cue_confidence
+    for match in AGE_PATTERN.finditer(text):
+        age = int(match.group(1))
+        found.setdefault("CHILDREN" if age <= 12 else "TEEN" if age <= 17 else "ADULT", match.group())
+        spans.append(match.span())
+    if not found:
+        return None
+    remaining = text
+    for start, end in spans:
+        remaining = remaining[:start] + " " * (end - start) + remaining[end:]
+    if AUDIENCE_SUBJECT_PATTERN.search(remaining):
+        return None
+    category = max(found, key=CATEGORY_ORDER.__getitem__)
+    if category != "ADULT" and any(not _negated(text, m.start(), SOFTENED_PATTERN) for m in MATURITY_PATTERN.finditer(text)):
+        return None
+    if len(found) > 1:
+        confidence = 0.8
+    return ExtractAudienceCategory(
+        category=category,
+        confidence=confidence,
+        rationale=f"rule: {', '.join(found.values())}"[:240],
+    )
+
+
+def _number(word: str) -> float:
+    return float(NUMBER_WORDS.get(word, word))
+
+
+def resolve_numeric_constraints(request) -> ExtractNumericConstraints | None:
+    """
+    Runtime, season and release-date limits from explicit phrasing ("under 2 hours",
+    "one season", "3 seasons or fewer", "from the last 5 years", "before 2000", "from
+    the 1990s").
+
+    A request with no numeric cue at all resolves to no constraints. Returns None (ask
+    the LLM) when a cue is left that the patterns do not explain, e.g. "set in the
+    1970s" or "something recent", since those need judgement.
+    """
+    text = normalize_request(request)
+    limits = {}
+    # Phrases the patterns matched but could not make sense of, e.g. "under 3 seasons or more"
+    unresolved = []
+
+    def consume(pattern: re.Pattern, handle):
+        nonlocal text
+        for match in pattern.finditer(text):
+            handle(match)
+        text = pattern.sub(lambda m: " " * len(m.group()), text)
+
+    def duration(match):
+        upper, lower, number, unit = match.groups()
+        minutes = _number(number) * (60 if unit.startswith("h") else 1)
+        if upper:
+            limits["max_duration_minutes"] = int(minutes)
+        elif lower:
+            limits["min_duration_minutes"] = int(minutes)
+        else:
+            limits["min_duration_minutes"] = int(max(minutes - AROUND_MINUTES, 0))
+            limits["max_duration_minutes"] = int(minutes + AROUND_MINUTES)
+
+    def seasons(match):
+        upper, lower, number, upper_suffix, lower_suffix = match.groups()
+        count = int(_number(number))
+        if (upper or upper_suffix) and (lower or lower_suffix):
+            unresolved.append(match.group())
+        elif upper:
+            limits["max_seasons"] = count - 1 if upper.startswith(("under", "less", "fewer", "below")) else count
+        elif lower:
+            limits["min_seasons"] = count + 1 if lower.startswith(("over", "more", "above")) else count
+        elif upper_suffix:
+            limits["max_seasons"] = count
+        elif lower_suffix:
+            limits["min_seasons"] = count
+        else:
+            limits["min_seasons"] = limits["max_seasons"] = count
+
+    def recent(match):
+        added, number, unit = match.groups()
+        years = int(_number(number or "one") * (10 if unit.startswith("decade") else 1))
+        limits["added_within_years" if added else "released_within_years"] = years
+
+    def year_bound(match):
+        word, year = match.group(1), int(match.group(2))
+        if word in ("before", "pre"):
+            limits["max_release_year"] = year - 1
+        else:
+            limits["min_release_year"] = year + 1 if word in ("after", "post") else year
+
+    def released_in(match):
+        limits["min_release_year"] = limits["max_release_year"] = int(match.group(1))
+
+    def decade(match):
+        century, digit = match.group(1), int(match.group(2))
+        start = int(century or ("20" if digit < 3 else "19")) * 100 + digit * 10
+        limits["min_release_year"], limits["max_release_year"] = start, start + 9
+
+    # Episode phrases first, so "episodes around 25 minutes" is not read as a runtime
+    consume(EPISODE_PATTERN, lambda match: None)
+    for pattern, handle in (
+        (DURATION_PATTERN, duration),
+        (SEASON_PATTERN, seasons),
+        (RECENT_PATTERN, recent),
+        (YEAR_BOUND_PATTERN, year_bound),
+        (RELEASED_IN_PATTERN, released_in),
+        (DECADE_PATTERN, decade),
+    ):
+        consume(pattern, handle)
+    if unresolved or NUMERIC_CUE_PATTERN.search(text):
+        return None
+    return ExtractNumericConstraints(**limits)
+
+
+def apply_rule(field: str, resolver, request):
+    # One place to count hits/misses; a None result means the caller falls back to the LLM
+    if not QUERY_RULES_ENABLED:
+        return None
+    with span(f"rules.{field}") as rule_span:
+        result = resolver(request)
+        rule_span.set(hit=result is not None)
+    rule_stats.record(field, result is not None)
+    if result is not None:
+        logger.info(f"Rule fast path resolved {field}: {result}")
+    return result
@@ -0,0 +1,309 @@
+"""
+Async HTTP service in front of the recommendation engine.
+
+One asyncio event loop accepts connections and parses requests; the blocking engine work
+(LLM calls, filtering, ranking) runs on a bounded thread pool, so many requests are in
+flight at once in one process and share the loaded catalogs and caches. Run with:
+
+    python -m util.service --port 8780
+
+Endpoints (JSON in and out):
+    GET  /health                   liveness and loaded catalog keys
+    GET  /stats                    LLM cache, query cache and rule fast-path counters
+    POST /catalogs?filename=x.csv  body: the raw CSV/xlsx export; loads (or refreshes) a catalog
+                                   against the last export with the same catalog_id param (default: filename)
+    GET  /catalogs/<key>?limit=N   catalog size, columns and the first N titles
+    POST /recommend                {"query", "catalog_key", "options", "stream", "trace"}
+
+With "stream": true, /recommend answers with newline-delimited JSON: one Recommendation
+per ranking update, the last one marked "done".
+"""
+import io
+import os
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from util.catalog import get_or_load_catalog, get_or_open_catalog, find_catalog, loaded_catalog_keys
+from util.catalog_ingest import ingest_catalog, should_stream
+from util.catalog_refresh import refresh_catalog
+from util.catalog_snapshot import content_hash
+from util.engine import RecommendOptions, iter_recommend
+from util.llm_cache import get_llm_cache
+from util.openai_client import CONCURRENT_REQUESTS
+from util.query_cache import get_query_cache
+from util.query_rules import rule_stats
+from util.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+# Requests handled at the same time; each blocks one thread for its LLM round trips. Read
+# from SERVICE_WORKERS in openai_client, which sizes the shared LLM call pools to match
+SERVICE_WORKERS = CONCURRENT_REQUESTS
+MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(512 * 1024 * 1024)))
+MAX_HEADER_LINES = 100
+_DONE = object()
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RecommendService:
+    def __init__(self, workers: int = SERVICE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recommend")
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/stats"): self.stats,
+            ("POST", "/catalogs"): self.load_catalog,
+            ("POST", "/recommend"): self.recommend,
+        }
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # HTTP/1.1 with keep-alive: serve requests on this connection until the client closes it
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    await self._dispatch(method, target, body, writer)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)})
+                except Exception as e:
+                    logger.exception(f"{method} {target} failed")
+                    await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"})
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Send a Content-Length instead of a chunked body")
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def _dispatch(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter):
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+        if method == "GET" and path.startswith("/catalogs/"):
+            return await self.catalog_info(path.removeprefix("/catalogs/"), params, writer)
+        handler = self.routes.get((method, path))
+        if handler is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+        return await handler(params, body, writer)
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def health(self, params, body, writer):
+        await self._send_json(writer, HTTPStatus.OK, {"status": "ok", "catalogs": loaded_catalog_keys()})
+
+    async def stats(self, params, body, writer):
+        stats = await self._run(lambda: {
+            "llm_cache": get_llm_cache().stats(),
+            "query_cache": get_query_cache().stats(),
+            "rules": rule_stats.stats(),
+        })
+        await self._send_json(writer, HTTPStatus.OK, stats)
+
+    async def load_catalog(self, params, body, writer):
+        if not body:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Send the catalog file as the request body")
+        filename = params.get("filename", "catalog.csv")
+        if not filename.endswith((".csv", ".xlsx")):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Unsupported file format. Send a CSV or Excel file")
+        # Exports with the same catalog_id (default: the file name) are refreshed against each other
+        catalog_id = params.get("catalog_id")
+
+        def load():
+            # The catalog and its indexes are loaded once per process; the key is the content hash
+            reports = []
+            def load_refreshed_catalog():
+                upload = io.BytesIO(body)
+                upload.name = filename
+                data, report = refresh_catalog(upload, catalog_id=catalog_id)
+                reports.append(report)
+                return data
+            catalog = get_or_load_catalog(content_hash(body), load_refreshed_catalog)
+            catalog.warm_indexes()
+            return {**self._describe(catalog), "changes": reports[0].summary() if reports else None}
+
+        await self._send_json(writer, HTTPStatus.OK, await self._run(load))
+
+    async def catalog_info(self, key: str, params, writer):
+        catalog = find_catalog(key)
+        if catalog is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown catalog {key}")
+        limit = params.get("limit", "0")
+        if not limit.isdigit():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"limit must be a non-negative integer, got {limit!r}")
+        limit = int(limit)
+        info = self._describe(catalog)
+        if limit:
+            head = catalog.rows(slice(0, limit))
+            info["titles"] = json.loads(head.to_json(orient="records", date_format="iso"))
+        await self._send_json(writer, HTTPStatus.OK, info)
+
+    @staticmethod
+    def _describe(catalog) -> dict:
+        return {
+            "catalog_key": catalog.key,
+            "rows": len(catalog),
+            "columns": catalog.columns,
+            "memory_bytes": catalog.memory_bytes(),
+        }
+
+    async def recommend(self, params, body, writer):
+        try:
+            request = json.loads(body or b"{}")
+            query = str(request["query"]).strip()
+            catalog_key = request["catalog_key"]
+            options = RecommendOptions.from_dict(request.get("options"))
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid request: {e}")
+        if not query:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Empty query")
+        catalog = find_catalog(catalog_key)
+        if catalog is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown catalog {catalog_key}. Load it with POST /catalogs first")
+
+        # Updates cross from the worker thread to this coroutine through an asyncio queue
+        loop = asyncio.get_running_loop()
+        updates: asyncio.Queue = asyncio.Queue()
+        stream = bool(request.get("stream"))
+
+        def run():
+            try:
+                with start_trace("recommend", query=query, catalog_key=catalog_key) as trace:
+                    for recommendation in iter_recommend(query, catalog, options):
+                        if stream:
+                            loop.call_soon_threadsafe(updates.put_nowait, {**recommendation.to_dict(), "done": False})
+                final = {**recommendation.to_dict(), "done": True}
+                if request.get("trace"):
+                    final["trace"] = trace.to_dict()
+                loop.call_soon_threadsafe(updates.put_nowait, final)
+            except BaseException as e:
+                loop.call_soon_threadsafe(updates.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(updates.put_nowait, _DONE)
+
+        worker = loop.run_in_executor(self.executor, run)
+        if not stream:
+            result = await updates.get()
+            await worker
+            if isinstance(result, BaseException):
+                raise result
+            return await self._send_json(writer, HTTPStatus.OK, result)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n"
+        )
+        while (update := await updates.get()) is not _DONE:
+            if isinstance(update, BaseException):
+                update = {"error": f"{type(update).__name__}: {update}", "done": True}
+            line = json.dumps(update, default=str).encode("utf-8") + b"\n"
+            writer.write(f"{len(line):X}\r\n".encode("latin-1") + line + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        await worker
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8780, workers: int = SERVICE_WORKERS, ready=None):
+    service = RecommendService(workers)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    logger.info(f"Recommendation service listening on {', '.join(str(s.getsockname()) for s in server.sockets)}")
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
+
+
+def start_service(host: str = "127.0.0.1", port: int = 0, workers: int = SERVICE_WORKERS) -> int:
+    """
+    Run the service on a daemon thread of this process (port 0 picks a free port).
+
+    Returns:
+        int: the port it is listening on.
+    """
+    started = threading.Event()
+    bound = {}
+
+    def ready(server):
+        bound["port"] = server.sockets[0].getsockname()[1]
+        started.set()
+
+    thread = threading.Thread(target=lambda: asyncio.run(serve(host, port, workers, ready)), name="recommend-service", daemon=True)
+    thread.start()
+    if not started.wait(timeout=30):
+        raise RuntimeError("Recommendation service did not start")
+    return bound["port"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS,
+                        help="requests served at once; set SERVICE_WORKERS instead to also size the LLM call pools")
+    parser.add_argument("--catalog", action="append", default=[], help="catalog file to load at startup (repeatable)")
+    args = parser.parse_args(argv)
+    for path in args.catalog:
+        if should_stream(path):
+            # Too large to parse in one read: ingest in chunks and serve it memory-mapped
+            catalog = get_or_open_catalog(*ingest_catalog(path))
+        else:
+            with open(path, "rb") as f:
+                raw = f.read()
+            upload = io.BytesIO(raw)
+            upload.name = os.path.basename(path)
+            catalog = get_or_load_catalog(content_hash(raw), lambda: refresh_catalog(upload)[0])
+        catalog.warm_indexes()
+        logger.info(f"Preloaded {path} as catalog {catalog.key}")
+    asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import json
+import httpx
+
+# Where the recommendation service listens; unset means the UI starts one in its own process
+SERVICE_URL = os.getenv("RECOMMEND_SERVICE_URL", "")
+# Ranking waits on LLM-scored batches, so reads get the same headroom as the OpenAI client
+TIMEOUT_SECONDS = float(os.getenv("RECOMMEND_SERVICE_TIMEOUT_SECONDS", "300"))
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class RecommendClient:
+    """Thin HTTP client for util.service; one keep-alive connection pool per client."""
+
+    def __init__(self, base_url: str):
+        self._http = httpx.Client(base_url=base_url.rstrip("/"), timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=5.0))
+
+    def _json(self, response: httpx.Response) -> dict:
+        if response.is_error:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise ServiceError(f"{response.status_code}: {message}")
+        return response.json()
+
+    def health(self) -> dict:
+        return self._json(self._http.get("/health"))
+
+    def stats(self) -> dict:
+        return self._json(self._http.get("/stats"))
+
+    def load_catalog(self, filename: str, data: bytes, catalog_id: str | None = None) -> dict:
+        params = {"filename": filename} if catalog_id is None else {"filename": filename, "catalog_id": catalog_id}
+        return self._json(self._http.post("/catalogs", params=params, content=data))
+
+    def catalog_info(self, catalog_key: str, limit: int = 0) -> dict:
+        return self._json(self._http.get(f"/catalogs/{catalog_key}", params={"limit": limit}))
+
+    def recommend(self, query: str, catalog_key: str, options: dict | None = None, trace: bool = False) -> dict:
+        payload = {"query": query, "catalog_key": catalog_key, "options": options or {}, "trace": trace}
+        return self._json(self._http.post("/recommend", json=payload))
+
+    def stream_recommend(self, query: str, catalog_key: str, options: dict | None = None, trace: bool = False):
+        """Yields the Recommendation dict after every ranking update; the last one has done=True."""
+        payload = {"query": query, "catalog_key": catalog_key, "options": options or {}, "stream": True, "trace": trace}
+        with self._http.stream("POST", "/recommend", json=payload) as response:
+            if response.is_error:
+                response.read()
+                self._json(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                update = json.loads(line)
+                if "error" in update:
+                    raise ServiceError(update["error"])
+                yield update
@@ -0,0 +1,301 @@
+import os
+import time
+import zlib
+import logging
+from pathlib import Path
+import numpy as np
+from util.catalog_snapshot import ArrayWriter, fill_grouped_order
+from util.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Titles passed from text recall to VAD scoring per query; 0 turns the recall stage off
+RECALL_TOP_N = int(os.getenv("RECALL_TOP_N", "100"))
+
+HASH_FEATURES = 2 ** 18  # hashed TF-IDF space
+PROJECTION_DIM = 128
+# Hashed features seen in fewer descriptions carry no similarity signal and are dropped
+MIN_DOCUMENT_FREQUENCY = 2
+POWER_ITERATIONS = 2
+# Below this many filtered titles an exact scan of the subset beats probing IVF lists
+BRUTE_FORCE_LIMIT = 4096
+# Streaming builds fit idf and components on this many leading titles, then project the rest
+VECTOR_FIT_ROWS = int(os.getenv("VECTOR_FIT_ROWS", "50000"))
+# ...and fit the IVF centroids on a sample of this many vectors per list
+IVF_SAMPLE_PER_LIST = 40
+VECTOR_BLOCK_ROWS = 65536
+INDEX_ARRAYS = ("feature_ids", "idf", "components", "vectors", "centroids", "rows_by_list", "list_start")
+
+
+def _tokens(text: str) -> list[str]:
+    # Unigrams plus adjacent bigrams ("small town", "true crime") of the stopword-free tokens
+    words = normalize_query(str(text))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _hash_features(tokens: list[str]) -> np.ndarray:
+    return np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.int64, count=len(tokens)) % HASH_FEATURES
+
+
+def _sparse_matmul(starts: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray, n_out: int, chunk_rows: int = 1024) -> np.ndarray:
+    """
+    (sparse @ dense) for a sparse matrix in compressed-row form (starts, indices, data).
+
+    Processed in row chunks so the (nnz, k) product never has to exist all at once;
+    empty rows are skipped because reduceat cannot express them.
+    """
+    out = np.zeros((n_out, dense.shape[1]), dtype=np.float32)
+    for first in range(0, n_out, chunk_rows):
+        last = min(first + chunk_rows, n_out)
+        row_starts = starts[first:last + 1]
+        lo, hi = row_starts[0], row_starts[-1]
+        if hi == lo:
+            continue
+        products = data[lo:hi, None] * dense[indices[lo:hi]]
+        non_empty = np.flatnonzero(np.diff(row_starts) > 0)
+        out[first + non_empty] = np.add.reduceat(products, row_starts[non_empty] - lo, axis=0)
+    return out
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_lists: int, rng, iterations: int = 8) -> tuple[np.ndarray, np.ndarray]:
+    # Assign by max cosine, re-centre and re-normalise; returns (centroids, last assignment)
+    n_lists = min(n_lists, max(len(vectors), 1))
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy() if len(vectors) else np.zeros((1, vectors.shape[1]), dtype=np.float32)
+    assignment = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Empty lists keep their previous centroid
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+    return centroids, assignment
+
+
+class DescriptionVectorIndex:
+    """
+    Dense text vectors for catalog descriptions plus an IVF index for recall.
+
+    Each description becomes a hashed TF-IDF vector (sublinear tf, smoothed idf,
+    L2-normalised). A plain random projection of such short, sparse vectors is mostly
+    noise, so the projection is fitted with a randomized SVD: a Gaussian random
+    projection of the TF-IDF matrix, two power iterations, then an exact SVD of the
+    small projected problem. Documents and queries are mapped through the same
+    PROJECTION_DIM components into float32 unit vectors, so a dot product is the cosine.
+
+    Vectors are grouped into ~sqrt(N) spherical k-means lists; a search probes the lists
+    nearest the query and only scores titles inside the caller's filter. Small filtered
+    sets are scanned exactly instead.
+    """
+
+    def __init__(self, descriptions, dim: int = PROJECTION_DIM, n_lists: int | None = None, seed: int = 7, build_ivf: bool = True):
+        start = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        doc_features = [_hash_features(_tokens(text)) for text in descriptions]
+        self.n_rows = len(doc_features)
+        doc_ids = np.repeat(np.arange(self.n_rows), [len(f) for f in doc_features])
+        features = np.concatenate(doc_features) if doc_features else np.empty(0, dtype=np.int64)
+        # Collapse repeated (doc, feature) pairs into term counts; np.unique also sorts them row-major
+        pairs, counts = np.unique(doc_ids * HASH_FEATURES + features, return_counts=True)
+        pair_docs, pair_features = np.divmod(pairs, HASH_FEATURES)
+
+        # Compact column ids for the features worth keeping
+        feature_ids, columns, document_frequency = np.unique(pair_features, return_inverse=True, return_counts=True)
+        keep_feature = document_frequency >= MIN_DOCUMENT_FREQUENCY
+        self.feature_ids = feature_ids[keep_feature]
+        self.idf = (np.log((1 + self.n_rows) / (1 + document_frequency[keep_feature])) + 1.0).astype(np.float32)
+        keep = keep_feature[columns]
+        pair_docs, counts = pair_docs[keep], counts[keep]
+        columns = np.cumsum(keep_feature)[columns[keep]] - 1
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[columns]
+        norms = np.sqrt(np.bincount(pair_docs, weights=weights ** 2, minlength=self.n_rows)).astype(np.float32)
+        weights /= norms[pair_docs]
+
+        row_starts = np.searchsorted(pair_docs, np.arange(self.n_rows + 1))
+        column_order = np.argsort(columns, kind="stable")
+        column_starts = np.searchsorted(columns[column_order], np.arange(len(self.feature_ids) + 1))
+        X = (row_starts, columns, weights)
+        Xt = (column_starts, pair_docs[column_order], weights[column_order])
+
+        # Randomized SVD (Halko et al.): random projection, power iterations, small exact SVD.
+        # Only the N-row bases are orthonormalised; the feature-side products are just rescaled.
+        dim = min(dim, max(1, len(self.feature_ids)), max(1, self.n_rows))
+        omega = rng.standard_normal((len(self.feature_ids), dim + 16), dtype=np.float32)
+        Q, _ = np.linalg.qr(_sparse_matmul(*X, omega, self.n_rows))
+        for _ in range(POWER_ITERATIONS):
+            Z = _sparse_matmul(*Xt, Q, len(self.feature_ids))
+            Z /= np.linalg.norm(Z, axis=0, keepdims=True) + 1e-12
+            Q, _ = np.linalg.qr(_sparse_matmul(*X, Z, self.n_rows))
+        # SVD of B = Qᵀ X through the small Gram matrix B Bᵀ: B = U S Vᵀ  →  V = Bᵀ U / S
+        Bt = _sparse_matmul(*Xt, Q, len(self.feature_ids))
+        eigenvalues, U = np.linalg.eigh(Bt.T @ Bt)
+        top = np.argsort(eigenvalues)[::-1][:dim]
+        singular_values = np.sqrt(np.maximum(eigenvalues[top], 1e-12))
+        self.components = np.ascontiguousarray((Bt @ U[:, top]) / singular_values, dtype=np.float32)
+        self.dim = dim
+
+        self.vectors = _sparse_matmul(*X, self.components, self.n_rows)
+        vector_norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        np.divide(self.vectors, vector_norms, out=self.vectors, where=vector_norms > 0)
+
+        if not build_ivf:
+            return
+        self._build_ivf(n_lists or max(1, int(np.sqrt(self.n_rows))), rng)
+        logger.info(
+            f"Built description vector index: {self.n_rows} titles, {len(self.feature_ids)} features, {self.dim} dims, "
+            f"{len(self.centroids)} lists in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def _build_ivf(self, n_lists: int, rng, iterations: int = 8):
+        self.centroids, assignment = _spherical_kmeans(self.vectors, n_lists, rng, iterations)
+        order = np.argsort(assignment, kind="stable")
+        self.rows_by_list = order
+        self.list_start = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+
+    @classmethod
+    def load(cls, directory: str | Path, mmap_mode: str | None = "r") -> "DescriptionVectorIndex":
+        """An index written by DescriptionVectorIndexBuilder; vectors and lists stay memory-mapped."""
+        directory = Path(directory)
+        index = cls.__new__(cls)
+        for name in INDEX_ARRAYS:
+            setattr(index, name, np.load(directory / f"{name}.npy", mmap_mode=mmap_mode))
+        index.n_rows, index.dim = index.vectors.shape
+        return index
+
+    def transform(self, descriptions) -> np.ndarray:
+        """Unit vectors for many descriptions at once, through the fitted features and components."""
+        doc_features = [_hash_features(_tokens(text)) for text in descriptions]
+        n_docs = len(doc_features)
+        if not len(self.feature_ids):
+            return np.zeros((n_docs, self.dim), dtype=np.float32)
+        doc_ids = np.repeat(np.arange(n_docs), [len(f) for f in doc_features])
+        features = np.concatenate(doc_features) if doc_features else np.empty(0, dtype=np.int64)
+        pairs, counts = np.unique(doc_ids * HASH_FEATURES + features, return_counts=True)
+        pair_docs, pair_features = np.divmod(pairs, HASH_FEATURES)
+        columns = np.searchsorted(self.feature_ids, pair_features)
+        known = (columns < len(self.feature_ids)) & (self.feature_ids[np.minimum(columns, len(self.feature_ids) - 1)] == pair_features)
+        pair_docs, columns, counts = pair_docs[known], columns[known], counts[known]
+        # No tf-idf normalisation: the projected vectors are normalised anyway
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[columns]
+        row_starts = np.searchsorted(pair_docs, np.arange(n_docs + 1))
+        vectors = _sparse_matmul(row_starts, columns, weights, self.components, n_docs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+    def embed(self, text: str) -> np.ndarray:
+        features, counts = np.unique(_hash_features(_tokens(text)), return_counts=True)
+        columns = np.searchsorted(self.feature_ids, features)
+        known = (columns < len(self.feature_ids)) & (self.feature_ids[np.minimum(columns, len(self.feature_ids) - 1)] == features)
+        columns, counts = columns[known], counts[known]
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self.idf[columns]
+        vector = weights @ self.components[columns]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def search(self, query: str, rows=None, n: int = RECALL_TOP_N, n_probe: int = 8) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The n titles whose descriptions are most similar to query.
+
+        Args:
+            rows: catalog row positions to search within (e.g. the filtered rows), or None for all.
+        Returns:
+            (rows, scores): best first; scores are cosine similarities.
+        """
+        query_vector = self.embed(query)
+        if rows is None:
+            rows = np.arange(self.n_rows)
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) > BRUTE_FORCE_LIMIT and query_vector.any():
+            allowed = np.zeros(self.n_rows, dtype=bool)
+            allowed[rows] = True
+            probe = np.argsort(-(self.centroids @ query_vector))[:n_probe]
+            candidates = np.concatenate([self.rows_by_list[self.list_start[i]:self.list_start[i + 1]] for i in probe])
+            candidates = candidates[allowed[candidates]]
+            # Not enough filtered titles in the probed lists: fall back to the exact scan
+            if len(candidates) >= n:
+                rows = candidates
+        scores = self.vectors[rows] @ query_vector
+        if n < len(rows):
+            top = np.argpartition(-scores, n - 1)[:n]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def memory_bytes(self) -> int:
+        return int(self.vectors.nbytes + self.components.nbytes + self.feature_ids.nbytes + self.idf.nbytes
+                   + self.centroids.nbytes + self.rows_by_list.nbytes)
+
+
+class DescriptionVectorIndexBuilder:
+    """
+    Builds a DescriptionVectorIndex from descriptions fed in chunks, straight to disk.
+
+    The idf weights and SVD components are fitted on the first VECTOR_FIT_ROWS
+    descriptions (held until then); every description after that is projected through
+    them as it arrives and appended to the on-disk vectors. finish() fits ~sqrt(N) IVF
+    centroids on a sample of the vectors and files every title into its list block by
+    block, so memory is bounded by the fit sample, not the catalog.
+    """
+
+    def __init__(self, directory: str | Path, fit_rows: int = VECTOR_FIT_ROWS, seed: int = 7):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fit_rows = fit_rows
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.model: DescriptionVectorIndex | None = None
+        self._pending: list[str] = []
+        self._vectors: ArrayWriter | None = None
+
+    def add(self, descriptions):
+        if self.model is None:
+            self._pending.extend(descriptions)
+            if len(self._pending) >= self.fit_rows:
+                self._fit()
+            return
+        self._vectors.append(self.model.transform(descriptions))
+
+    def _fit(self):
+        self.model = DescriptionVectorIndex(self._pending, seed=self.seed, build_ivf=False)
+        self._vectors = ArrayWriter(self.directory / "vectors.npy", np.float32, (self.model.dim,))
+        self._vectors.append(self.model.vectors)
+        self._pending = []
+
+    def finish(self) -> DescriptionVectorIndex:
+        start = time.perf_counter()
+        if self.model is None:
+            self._fit()
+        vectors = np.load(self._vectors.close(), mmap_mode="r")
+        n_rows = len(vectors)
+        n_lists = min(max(1, int(np.sqrt(n_rows))), n_rows) if n_rows else 1
+        sample = np.sort(self.rng.choice(n_rows, size=min(n_rows, n_lists * IVF_SAMPLE_PER_LIST), replace=False))
+        centroids, _ = _spherical_kmeans(np.asarray(vectors[sample]), n_lists, self.rng)
+
+        def assignments():
+            for first in range(0, n_rows, VECTOR_BLOCK_ROWS):
+                yield first, np.argmax(np.asarray(vectors[first:first + VECTOR_BLOCK_ROWS]) @ centroids.T, axis=1)
+
+        counts = np.zeros(len(centroids), dtype=np.int64)
+        for _, assignment in assignments():
+            counts += np.bincount(assignment, minlength=len(centroids))
+        rows_by_list = np.lib.format.open_memmap(self.directory / "rows_by_list.npy", mode="w+", dtype=np.int64, shape=(n_rows,))
+        # Assignments are recomputed rather than kept: a second matmul pass is cheaper than N ints in memory
+        fill_grouped_order(assignments(), counts, rows_by_list)
+        rows_by_list.flush()
+        del rows_by_list
+        arrays = {
+            "feature_ids": self.model.feature_ids,
+            "idf": self.model.idf,
+            "components": self.model.components,
+            "centroids": centroids,
+            "list_start": np.concatenate([[0], np.cumsum(counts)]),
+        }
+        for name, array in arrays.items():
+            np.save(self.directory / f"{name}.npy", array)
+        logger.info(
+            f"Built description vector index on disk: {n_rows} titles, {len(self.model.feature_ids)} features, "
+            f"{self.model.dim} dims, {len(centroids)} lists in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        return DescriptionVectorIndex.load(self.directory)
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Finished traces are appended here as JSON lines; set TRACE_LOG_PATH="" to disable
+DEFAULT_TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", str(Path(__file__).resolve().parent.parent / "data" / "traces.jsonl"))
+TOKEN_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "reasoning_tokens", "total_tokens")
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    parent_id: str | None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start_time: float = field(default_factory=time.time)
+    duration_ms: float | None = None
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> dict:
+        # Field names follow the OpenTelemetry span model so the lines can be mapped onto it
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """
+    All spans recorded while handling one query.
+
+    The root span covers the whole query; stage spans (extractors, filter, VAD scoring,
+    ranking) and one span per LLM call hang off it. LLM spans carry model, namespace,
+    cache_hit and the token counts from the completion's usage.
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, self.trace_id, None, attributes=attributes)
+        self.spans: list[Span] = [self.root]
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> dict:
+        # Time per stage (summed over repeated spans) and token totals over every LLM call
+        with self._lock:
+            spans = list(self.spans[1:])
+        stages: dict[str, float] = {}
+        for span in spans:
+            if span.duration_ms is not None:
+                stages[span.name] = round(stages.get(span.name, 0.0) + span.duration_ms, 3)
+        llm_spans = [span for span in spans if "cache_hit" in span.attributes]
+        return {
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.root.duration_ms or 0.0, 3),
+            "stages_ms": stages,
+            "llm_calls": len(llm_spans),
+            "llm_cache_hits": sum(1 for span in llm_spans if span.attributes["cache_hit"]),
+            **{name: sum(span.attributes.get(name, 0) for span in llm_spans) for name in TOKEN_ATTRIBUTES},
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {**self.summary(), "name": self.root.name, "attributes": self.root.attributes, "spans": spans}
+
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("span", default=None)
+_export_lock = threading.Lock()
+
+
+@contextmanager
+def start_trace(name: str, export_path: str | None = DEFAULT_TRACE_LOG_PATH, **attributes):
+    """
+    Open a trace for one query; spans opened under it (in this thread, or in threads
+    started with submit()) are collected on the yielded Trace and exported on exit.
+    """
+    trace = Trace(name, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.status = "error"
+        trace.root.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        trace.root.end()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if export_path:
+            export_trace(trace, export_path)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    # Outside a trace the span is still yielded, so callers can set attributes unconditionally
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    current = Span(name, trace.trace_id if trace else "", parent.span_id if parent else None, attributes=attributes)
+    if trace is None:
+        yield current
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def record_span(name: str, duration_ms: float, **attributes):
+    """
+    Add an already-measured span under the current one.
+
+    For work that is interleaved with the caller, e.g. a generator whose time is spread
+    over many next() calls, where a with-block cannot wrap it.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    recorded = Span(name, trace.trace_id, parent.span_id if parent else None,
+                    start_time=time.time() - duration_ms / 1000, duration_ms=duration_ms, attributes=attributes)
+    trace.add(recorded)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+def submit(executor, fn, *args, **kwargs):
+    # Executor threads do not inherit context variables; run fn inside a copy of ours
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def export_trace(trace: Trace, path: str | Path = DEFAULT_TRACE_LOG_PATH):
+    path = Path(path)
+    line = json.dumps(trace.to_dict(), default=str, ensure_ascii=False)
+    try:
+        with _export_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"Could not export trace {trace.trace_id}: {e}")
@@ -37,15 +37,60 @@ def vad_similarity(user_vad, movie_vad, w=(1.0, 1.0, 0.7), alpha=0.6) -> float:
     return alpha * cos + (1 - alpha) * dist_score
 
 
-def rank_movies_by_vad(user_vad, movies_vad_array):
-    print(f"movie_vad_array: {movies_vad_array}")
-    # movies_vad_array: shape (N,3) in [0,1], same order as movie_ids
-    scores = []
-    for key in movies_vad_array:
-        # 'valence': 0.9, 'arousal': 0.8, 'dominance'
-        print(f"valence: {key['valence']}, arousal: {key['arousal']}, dominance: {key['dominance']}")
-        # s = vad_similarity(user_vad, mv)
-        # scores.append((mid, s))
+def vad_similarity_matrix(user_vad, movie_vad_matrix, w=(1.0, 1.0, 0.7), alpha=0.6) -> np.ndarray:
+    # Same blend as vad_similarity, computed for every row of an (N,3) VAD matrix at once
+    w = np.asarray(w, dtype=np.float32)
+    u_w = _vec(user_vad).astype(np.float32) * w
+
+    # clamp, center to [-1,1] and weight in place: (m * 2 - 1) * w == m * 2w - w
+    m_w = np.clip(np.asarray(movie_vad_matrix, dtype=np.float32), 0.0, 1.0)
+    m_w *= 2.0 * w
+    m_w -= w
+
+    # cosine, 0 where either vector has no length
+    nu2 = float(u_w @ u_w)
+    nm2 = np.einsum("ij,ij->i", m_w, m_w)
+    dot = m_w @ u_w
+    nm = np.sqrt(nm2)
+    cos = np.zeros(len(m_w), dtype=np.float32)
+    if nu2 > 0:
+        np.divide(dot, np.sqrt(nu2) * nm, out=cos, where=nm > 0)
+
+    # distance -> score in [0,1], |m - u|^2 expanded so no (N,3) difference is materialised
+    d2 = nm2 - 2.0 * dot + nu2
+    np.maximum(d2, 0.0, out=d2)
+    dmax = 2.0 * np.sqrt(np.sum(w))  # max possible in weighted [-1,1]^3
+    dist_score = 1.0 - (np.sqrt(d2) / dmax)
+
+    return alpha * cos + (1 - alpha) * dist_score
+
+
+def top_k_positions(scores: np.ndarray, k: int) -> np.ndarray:
+    # Positions of the k highest scores, best first; only the k winners get sorted
+    n = len(scores)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def top_k_by_vad(user_vad, movie_vad_matrix, show_ids, k=10, w=(1.0, 1.0, 0.7), alpha=0.6) -> list[tuple[str, float]]:
+    # movie_vad_matrix: shape (N,3) float32 in [0,1], show_ids: shape (N,) in the same order
+    scores = vad_similarity_matrix(user_vad, movie_vad_matrix, w=w, alpha=alpha)
+    show_ids = np.asarray(show_ids)
+    return [(str(show_ids[i]), float(scores[i])) for i in top_k_positions(scores, k)]
+
+
+def rank_movies_by_vad(user_vad, movies_vad_array, k=None):
+    # movies_vad_array: list of {'valence', 'arousal', 'dominance', 'movie_id'} looked up from the VAD store
+    if not movies_vad_array:
+        return []
+    movie_vad_matrix = np.array(
+        [[m["valence"], m["arousal"], m["dominance"]] for m in movies_vad_array], dtype=np.float32
+    )
+    show_ids = np.array([m["movie_id"] for m in movies_vad_array])
     # sort high → low
-    # return sorted(scores, key=lambda t: t[1], reverse=True)
-    return 'Hi'
\ No newline at end of file
+    return top_k_by_vad(user_vad, movie_vad_matrix, show_ids, k=len(show_ids) if k is None else k)
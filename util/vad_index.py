@@ -0,0 +1,129 @@
+import logging
+import numpy as np
+from util.vad_calculation import top_k_by_vad
+
+logger = logging.getLogger(__name__)
+
+# Below this many candidates a direct scan of the subset beats walking grid cells
+BRUTE_FORCE_LIMIT = 256
+
+
+class VADGridIndex:
+    """
+    Uniform 3-D grid over catalog VAD vectors for k-nearest-neighbour queries.
+
+    Points live in the same space vad_similarity compares in: clamped to [0,1],
+    centered to [-1,1] and weighted per axis (dominance down-weighted by default).
+    Rows without a score (NaN) are left out of the grid. Cells are stored CSR-style:
+    catalog rows sorted by cell id plus an offsets array, so a query only touches the
+    cells around the user's VAD and never the whole catalog.
+    """
+
+    def __init__(self, vad_matrix, w=(1.0, 1.0, 0.7), cells_per_axis: int | None = None):
+        vad_matrix = np.asarray(vad_matrix, dtype=np.float32)
+        self.w = np.asarray(w, dtype=np.float32)
+        self.n_rows = len(vad_matrix)
+        self.vad = vad_matrix
+        self.points = (np.clip(vad_matrix, 0.0, 1.0) * 2.0 - 1.0) * self.w
+        valid = ~np.isnan(vad_matrix).any(axis=1)
+        self.n_points = int(valid.sum())
+        if cells_per_axis is None:
+            # Aim for ~8 points per cell
+            cells_per_axis = int(np.clip(round((max(self.n_points, 1) / 8) ** (1 / 3)), 1, 64))
+        self.g = cells_per_axis
+        self.cell_size = 2.0 * self.w / self.g
+
+        rows = np.flatnonzero(valid)
+        cells = self._cell_coords(self.points[rows])
+        cell_ids = np.ravel_multi_index(cells.T, (self.g,) * 3)
+        order = np.argsort(cell_ids, kind="stable")
+        self.rows_by_cell = rows[order]
+        self.cell_start = np.searchsorted(cell_ids[order], np.arange(self.g ** 3 + 1))
+        logger.info(f"Built VAD grid index: {self.n_points} titles, {self.g}^3 cells")
+
+    def memory_bytes(self) -> int:
+        return self.vad.nbytes + self.points.nbytes + self.rows_by_cell.nbytes + self.cell_start.nbytes
+
+    def _cell_coords(self, points: np.ndarray) -> np.ndarray:
+        coords = np.floor((points + self.w) / self.cell_size).astype(np.int64)
+        return np.clip(coords, 0, self.g - 1)
+
+    def _shell(self, center: np.ndarray, r: int) -> np.ndarray:
+        # Linear ids of in-bounds cells at Chebyshev distance exactly r from center
+        span = np.arange(-r, r + 1)
+        offsets = np.stack(np.meshgrid(span, span, span, indexing="ij"), axis=-1).reshape(-1, 3)
+        if r > 0:
+            offsets = offsets[np.abs(offsets).max(axis=1) == r]
+        cells = center + offsets
+        cells = cells[((cells >= 0) & (cells < self.g)).all(axis=1)]
+        return np.ravel_multi_index(cells.T, (self.g,) * 3)
+
+    def query(self, user_vad, k: int = 10, candidates=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k indexed rows closest to user_vad in weighted VAD space.
+
+        Args:
+            user_vad: {'valence','arousal','dominance'} dict or [v, a, d].
+            k: number of neighbours.
+            candidates: optional catalog row positions (e.g. the rows kept by
+                filter_catalog); only these rows may be returned.
+        Returns:
+            (rows, distances) sorted nearest first.
+        """
+        if isinstance(user_vad, dict):
+            user_vad = [user_vad["valence"], user_vad["arousal"], user_vad["dominance"]]
+        q = (np.clip(np.asarray(user_vad, dtype=np.float32), 0.0, 1.0) * 2.0 - 1.0) * self.w
+
+        mask = None
+        if candidates is not None:
+            candidates = np.asarray(candidates, dtype=np.int64)
+            candidates = candidates[~np.isnan(self.vad[candidates, 0])]
+            if len(candidates) <= max(BRUTE_FORCE_LIMIT, k):
+                return self._nearest(q, candidates, k)
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[candidates] = True
+
+        center = self._cell_coords(q[None, :])[0]
+        # Cells in shell r are at least r - 1 whole cells away from q
+        min_cell = float(self.cell_size.min())
+        found_rows: list[np.ndarray] = []
+        n_found = 0
+        kth = np.inf
+        for r in range(self.g):
+            if n_found >= k and (r - 1) * min_cell > kth:
+                break
+            for cell in self._shell(center, r):
+                rows = self.rows_by_cell[self.cell_start[cell]:self.cell_start[cell + 1]]
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                if len(rows):
+                    found_rows.append(rows)
+                    n_found += len(rows)
+            if n_found >= k:
+                rows = np.concatenate(found_rows)
+                d = np.linalg.norm(self.points[rows] - q, axis=1)
+                kth = float(np.partition(d, k - 1)[k - 1])
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._nearest(q, np.concatenate(found_rows), k)
+
+    def _nearest(self, q: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        d = np.linalg.norm(self.points[rows] - q, axis=1)
+        if k < len(rows):
+            top = np.argpartition(d, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(d[top], kind="stable")]
+        return rows[top], d[top]
+
+    def top_k(self, user_vad, show_ids, k: int = 10, candidates=None, alpha=0.6, oversample: int = 4) -> list[tuple[str, float]]:
+        # Nearest neighbours by weighted distance, re-ranked with the full cosine/distance blend
+        rows, _ = self.query(user_vad, k=k * oversample, candidates=candidates)
+        return top_k_by_vad(user_vad, self.vad[rows], np.asarray(show_ids)[rows], k=k, w=self.w, alpha=alpha)
+
+
+def build_catalog_vad_index(vad_keys, store, **kwargs) -> VADGridIndex:
+    # Index every catalog title that already has a stored VAD score; the rest stay out of the grid.
+    # vad_keys: the store key (vad_key) of every catalog row, in row order
+    vad_matrix, _ = store.lookup_keys(vad_keys)
+    return VADGridIndex(vad_matrix, **kwargs)
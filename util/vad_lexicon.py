@@ -0,0 +1,134 @@
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from models.models import VAD, MovieVAD
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_PATH = Path(os.getenv("VAD_LEXICON_PATH", Path(__file__).resolve().parent.parent / "data" / "vad_lexicon.csv"))
+NEUTRAL = 0.5
+
+NEGATORS = {
+    "not", "no", "never", "without", "nothing", "nor", "neither", "hardly", "lacks", "lacking",
+    "isn't", "aren't", "wasn't", "don't", "doesn't", "didn't", "won't", "can't", "cannot",
+}
+# A negated word keeps this share of its distance from neutral, on the other side ("not scary" ≈ mildly calm)
+NEGATION_FLIP = -0.6
+# How many following tokens a negator reaches; punctuation ends it early
+NEGATION_SCOPE = 3
+# Multipliers on the next lexicon word's distance from neutral
+INTENSIFIERS = {
+    "very": 1.5, "extremely": 1.8, "incredibly": 1.7, "utterly": 1.7, "deeply": 1.5, "super": 1.5,
+    "really": 1.4, "highly": 1.4, "totally": 1.4, "heavy": 1.4, "so": 1.3, "truly": 1.3, "too": 1.3,
+    "strong": 1.3, "quite": 1.2, "fairly": 0.8, "somewhat": 0.6, "mild": 0.6, "light": 0.6, "bit": 0.6,
+    "slightly": 0.5, "mildly": 0.5, "low": 0.5, "barely": 0.3, "minimal": 0.3,
+}
+TOKEN_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?|[.,;:!?]")
+
+
+def negation_scopes(text: str, pattern: re.Pattern = TOKEN_PATTERN):
+    """
+    Yields (token, negated) for each token of text, punctuation included.
+
+    A negator reaches the next NEGATION_SCOPE words; intensifiers in between do not use
+    up the scope ("not too gory") and punctuation ends it. pattern picks the tokens; any
+    token that does not start with a letter or digit counts as punctuation.
+    """
+    negation_left = 0
+    for token in pattern.findall(str(text).lower().replace("’", "'")):
+        if token in NEGATORS:
+            negation_left = NEGATION_SCOPE
+            yield token, False
+        elif token in INTENSIFIERS:
+            yield token, negation_left > 0
+        elif not token[0].isalnum():
+            negation_left = 0
+            yield token, False
+        else:
+            yield token, negation_left > 0
+            negation_left = max(negation_left - 1, 0)
+
+
+class VADLexicon:
+    """
+    Word-level VAD lexicon and a local text scorer.
+
+    A text's VAD is the mean of its lexicon words' VAD, each word's distance from
+    neutral (0.5) scaled by a preceding intensifier and flipped (and damped) when a
+    negator precedes it within NEGATION_SCOPE tokens. Texts with no lexicon words
+    score neutral. Only tokenisation is per text; lookup and aggregation are numpy.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_LEXICON_PATH):
+        table = pd.read_csv(path)
+        self.vocab = {word: i for i, word in enumerate(table["word"].astype(str).str.lower())}
+        self.matrix = table[["valence", "arousal", "dominance"]].to_numpy(dtype=np.float32)
+        logger.info(f"Loaded VAD lexicon with {len(self.vocab)} words from {path}")
+
+    def _matches(self, text: str) -> tuple[list[int], list[float]]:
+        # Lexicon ids and their neutral-distance multipliers for one text
+        ids, factors = [], []
+        intensity = 1.0
+        for token, negated in negation_scopes(text):
+            if token in NEGATORS:
+                continue
+            if token in INTENSIFIERS:
+                intensity = INTENSIFIERS[token]
+                continue
+            if not token[0].isalpha():
+                intensity = 1.0
+                continue
+            word_id = self.vocab.get(token)
+            if word_id is not None:
+                ids.append(word_id)
+                factors.append(intensity * (NEGATION_FLIP if negated else 1.0))
+                intensity = 1.0
+        return ids, factors
+
+    def score_texts(self, texts) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (vad, coverage): an (N,3) float32 matrix in [0,1] and the number of lexicon
+            words found in each text (0 means the row is just the neutral default).
+        """
+        texts = list(texts)
+        n = len(texts)
+        word_ids, doc_ids, factors = [], [], []
+        for doc, text in enumerate(texts):
+            ids, text_factors = self._matches(text)
+            word_ids.extend(ids)
+            factors.extend(text_factors)
+            doc_ids.extend([doc] * len(ids))
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        coverage = np.bincount(doc_ids, minlength=n)
+        deviation = (self.matrix[np.asarray(word_ids, dtype=np.int64)] - NEUTRAL) * np.asarray(factors, dtype=np.float32)[:, None]
+        vad = np.empty((n, 3), dtype=np.float32)
+        for dim in range(3):
+            vad[:, dim] = np.bincount(doc_ids, weights=deviation[:, dim], minlength=n)
+        vad /= np.maximum(coverage, 1)[:, None]
+        vad += NEUTRAL
+        np.clip(vad, 0.0, 1.0, out=vad)
+        return vad, coverage
+
+    def estimate_vad(self, text: str) -> VAD:
+        vad, _ = self.score_texts([text])
+        return VAD(valence=float(vad[0, 0]), arousal=float(vad[0, 1]), dominance=float(vad[0, 2]))
+
+    def estimate_movie_vad(self, description: str) -> MovieVAD:
+        vad, _ = self.score_texts([description])
+        return MovieVAD(valence=float(vad[0, 0]), arousal=float(vad[0, 1]), dominance=float(vad[0, 2]))
+
+
+_lexicon: VADLexicon | None = None
+_lexicon_lock = threading.Lock()
+
+def get_vad_lexicon() -> VADLexicon:
+    global _lexicon
+    with _lexicon_lock:
+        if _lexicon is None:
+            _lexicon = VADLexicon()
+        return _lexicon
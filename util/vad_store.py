@@ -0,0 +1,234 @@
+import os
+import hashlib
+import logging
+import threading
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# The store lives next to the catalog data so it survives restarts and is shared by every session
+DEFAULT_STORE_DIR = Path(os.getenv("VAD_STORE_DIR", Path(__file__).resolve().parent.parent / "data" / "vad_store"))
+# Each segment is one keys/vad pair; a bare pair at the top is a pre-segment store, imported on load
+KEYS_FILE = "keys.npy"
+VAD_FILE = "vad.npy"
+SEGMENT_PREFIX = "segment-"
+# 64-bit hash of show_id + description hash: fixed width whatever the length of the show_id
+KEY_DTYPE = np.uint64
+
+
+def description_hash(description) -> str:
+    # Short, stable hash so a changed description invalidates the cached VAD for that title
+    text = "" if description is None else str(description)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _hash_key(show_id, digest: str) -> int:
+    data = f"{show_id}\x1f{digest}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def vad_key(show_id, description) -> int:
+    return _hash_key(show_id, description_hash(description))
+
+
+def _rekey_legacy(keys: np.ndarray) -> np.ndarray:
+    # Stores written before hashed keys held "show_id:description hash" strings
+    return np.array([_hash_key(*str(key).rsplit(":", 1)) for key in keys], dtype=KEY_DTYPE)
+
+
+class VADStore:
+    """
+    Persistent VAD scores for catalog titles, keyed by show_id + description hash.
+
+    On disk the store is a list of segments, each a sorted uint64 key hash array and an
+    (N,3) float32 matrix in valence/arousal/dominance order. Segments are memory-mapped
+    on load and looked up with np.searchsorted, newest first, so neither startup nor a
+    lookup builds anything per stored title. flush() writes the buffered scores as a new
+    small segment; a segment is merged into the one before it once that one is no more
+    than twice its size, so there are O(log N) segments and each score is rewritten
+    O(log N) times. Discarded keys are written as NaN tombstones, dropped when they
+    reach the oldest segment.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_STORE_DIR):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        # Tuple of (number, keys, vad), oldest first; swapped as a whole, so lock-free
+        # readers always see a consistent set of segments
+        self._segments = self._load()
+        self._pending: dict[int, np.ndarray] = {}
+        # Bumped on every flush so indexes built from the store know when they are stale
+        self.version = 0
+
+    def _segment_path(self, number: int, name: str) -> Path:
+        return self.path / f"{SEGMENT_PREFIX}{number:06d}.{name}"
+
+    def _load(self) -> tuple:
+        if (self.path / KEYS_FILE).exists() and (self.path / VAD_FILE).exists():
+            self._import_legacy()
+        segments = []
+        # The keys file is written last, so its presence marks a complete segment
+        for keys_path in sorted(self.path.glob(f"{SEGMENT_PREFIX}*.{KEYS_FILE}")):
+            number = int(keys_path.name[len(SEGMENT_PREFIX):].split(".")[0])
+            vad_path = self._segment_path(number, VAD_FILE)
+            if not vad_path.exists():
+                continue
+            keys = np.load(keys_path, mmap_mode="r")
+            vad = np.load(vad_path, mmap_mode="r")
+            if keys.shape[0] != vad.shape[0]:
+                logger.warning(f"VAD store segment {keys_path.name} is inconsistent, ignoring it")
+                continue
+            segments.append((number, keys, vad))
+        if segments:
+            logger.info(f"Opened {sum(len(keys) for _, keys, _ in segments)} VAD scores in {len(segments)} segments from {self.path}")
+        return tuple(segments)
+
+    def _import_legacy(self):
+        keys = np.load(self.path / KEYS_FILE)
+        vad = np.load(self.path / VAD_FILE)
+        if keys.shape[0] == vad.shape[0]:
+            if keys.dtype.kind == "U":
+                keys = _rekey_legacy(keys)
+            keys, vad = _dedup_sorted(keys.astype(KEY_DTYPE), vad)
+            self._write_segment(0, keys, vad)
+        else:
+            logger.warning(f"VAD store at {self.path} is inconsistent, ignoring it")
+        (self.path / KEYS_FILE).unlink()
+        (self.path / VAD_FILE).unlink()
+
+    def _write_segment(self, number: int, keys: np.ndarray, vad: np.ndarray):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Temp files first so a crash never leaves a half-written segment behind
+        for name, array in ((VAD_FILE, vad.astype(np.float32)), (KEYS_FILE, keys.astype(KEY_DTYPE))):
+            tmp_path = self._segment_path(number, f"{name}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, self._segment_path(number, name))
+
+    def _remove_segment(self, number: int):
+        for name in (KEYS_FILE, VAD_FILE):
+            self._segment_path(number, name).unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        # Counts overwritten scores and tombstones not yet merged away, so it is an upper bound
+        return sum(len(keys) for _, keys, _ in self._segments) + len(self._pending)
+
+    def get(self, show_id, description) -> np.ndarray | None:
+        vad, found = self.lookup([show_id], [description])
+        return vad[0] if found[0] else None
+
+    def lookup(self, show_ids, descriptions) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Look up many titles at once.
+
+        Returns:
+            (vad, found): an (N,3) float32 matrix (NaN rows for misses) and a boolean hit mask.
+        """
+        keys = np.fromiter((vad_key(show_id, description) for show_id, description in zip(show_ids, descriptions)),
+                           dtype=KEY_DTYPE, count=len(show_ids))
+        return self.lookup_keys(keys)
+
+    def lookup_keys(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # lookup() for precomputed vad_key hashes
+        keys = np.asarray(keys, dtype=KEY_DTYPE)
+        segments, pending_scores = self._segments, dict(self._pending)
+        vad = np.full((len(keys), 3), np.nan, dtype=np.float32)
+        resolved = np.zeros(len(keys), dtype=bool)
+        if pending_scores:
+            for i, key in enumerate(keys.tolist()):
+                pending = pending_scores.get(key)
+                if pending is not None:
+                    vad[i] = pending
+                    resolved[i] = True
+        for _, segment_keys, segment_vad in reversed(segments):
+            todo = np.flatnonzero(~resolved)
+            if not len(todo):
+                break
+            if not len(segment_keys):
+                continue
+            positions = np.minimum(np.searchsorted(segment_keys, keys[todo]), len(segment_keys) - 1)
+            hit = segment_keys[positions] == keys[todo]
+            vad[todo[hit]] = segment_vad[positions[hit]]
+            resolved[todo[hit]] = True
+        # Tombstones resolve to NaN, i.e. a miss
+        found = ~np.isnan(vad[:, 0])
+        return vad, found
+
+    def put(self, show_id, description, vad):
+        # vad: MovieVAD-like object, {'valence','arousal','dominance'} dict or [v, a, d]
+        if isinstance(vad, dict):
+            values = [vad["valence"], vad["arousal"], vad["dominance"]]
+        elif hasattr(vad, "valence"):
+            values = [vad.valence, vad.arousal, vad.dominance]
+        else:
+            values = vad
+        with self._lock:
+            self._pending[vad_key(show_id, description)] = np.asarray(values, dtype=np.float32)
+
+    def discard(self, keys) -> int:
+        """
+        Drop entries by full store key (see vad_key), e.g. for titles removed from the
+        catalog or whose description changed. Written out right away, with any pending scores.
+        """
+        keys = np.asarray(list(keys), dtype=KEY_DTYPE)
+        _, found = self.lookup_keys(keys)
+        with self._lock:
+            for key in keys.tolist():
+                self._pending[key] = np.full(3, np.nan, dtype=np.float32)
+            self._flush_locked()
+        if found.any():
+            logger.info(f"Discarded {int(found.sum())} VAD scores from {self.path}")
+        return int(found.sum())
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        keys, vad = _dedup_sorted(np.fromiter(self._pending, dtype=KEY_DTYPE, count=len(self._pending)),
+                                  np.stack(list(self._pending.values())))
+        segments = list(self._segments)
+        number = segments[-1][0] + 1 if segments else 0
+        logger.info(f"Flushing {len(keys)} new VAD scores to {self.path}")
+        # Merge into the previous segments while they are no more than twice as large
+        merged = []
+        while segments and len(segments[-1][1]) <= 2 * len(keys):
+            old_number, old_keys, old_vad = segments.pop()
+            keys, vad = _dedup_sorted(np.concatenate([old_keys, keys]), np.concatenate([old_vad, vad]))
+            merged.append(old_number)
+        if not segments:
+            # Nothing older is left to shadow, so tombstones can go
+            live = ~np.isnan(vad[:, 0])
+            keys, vad = keys[live], vad[live]
+        self._write_segment(number, keys, vad)
+        segments.append((number, np.load(self._segment_path(number, KEYS_FILE), mmap_mode="r"),
+                         np.load(self._segment_path(number, VAD_FILE), mmap_mode="r")))
+        self._segments = tuple(segments)
+        self.version += 1
+        # Cleared only once the scores are readable from the new segment
+        self._pending = {}
+        for old_number in merged:
+            self._remove_segment(old_number)
+
+
+def _dedup_sorted(keys: np.ndarray, vad: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Sort by key; where a key repeats, the later row (the newer score) wins
+    order = np.argsort(keys, kind="stable")
+    keys, vad = np.asarray(keys)[order], np.asarray(vad, dtype=np.float32)[order]
+    last = np.append(keys[1:] != keys[:-1], True)
+    return keys[last], vad[last]
+
+
+_store: VADStore | None = None
+_store_lock = threading.Lock()
+
+def get_vad_store() -> VADStore:
+    # One store per process; every session reads from the same memory map
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VADStore()
+        return _store